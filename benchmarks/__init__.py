@@ -0,0 +1 @@
+""" Benchmarks of the sumoku rules engine and game state """
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+""" Benchmarks of the rules engine and game state hot paths
+
+Run with python -m benchmarks.bench. Results are saved as JSON with
+--output, and compared against an earlier run with --baseline; any
+benchmark slower than the baseline by more than --threshold fails the run.
+"""
+import argparse
+import collections
+import gc
+import itertools
+import json
+import platform
+import StringIO
+import sys
+import time
+import benchmarks.positions
+import sumoku.batch
+import sumoku.game
+import sumoku.moves
+import sumoku.render
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# A benchmark calls call once on each of a list of inputs, made by
+# inputs(count) outside the timed loop
+Benchmark = collections.namedtuple('Benchmark', ['name', 'call', 'inputs'])
+
+
+def cycle(items):
+    """ Return a function making inputs by cycling through items """
+    return lambda count: list(itertools.islice(itertools.cycle(items), count))
+
+
+def staged_copies(state, move):
+    """ Return a function making copies of state with move staged """
+    def inputs(count):
+        """ Return count staged copies """
+        copies = []
+        for _ in xrange(count):
+            clone = state.copy()
+            clone.stage_play(move.tiles)
+            copies.append(clone)
+        return copies
+    return inputs
+
+
+def stage_benchmarks(stage, state):
+    """ Return the benchmarks run against a position """
+    key_number = state.key_number
+    board = state.board
+    played = list(state.played_tiles)
+    hand = sumoku.game.Hand(state.cur_hand())
+    moves = sumoku.moves.state_moves(state)
+    plays = [sorted(move.tiles) for move in moves]
+    best = max(moves, key=lambda move: move.score) if moves else None
+    renderer = sumoku.render.Renderer(StringIO.StringIO())
+    differ = sumoku.render.Renderer(StringIO.StringIO(), diff=True)
+
+    def apply_undo(move):
+        """ Make a move and take it back """
+        state.apply(move)
+        state.undo()
+
+    candidates = [
+        Benchmark('score_play', lambda tiles:
+                  sumoku.game.score_play(tiles, board, key_number),
+                  cycle(plays) if plays else None),
+        Benchmark('score_play_list', lambda tiles:
+                  sumoku.game.score_play(tiles, played, key_number),
+                  cycle(plays) if plays else None),
+        # The batch benchmarks score every play of the position per call
+        Benchmark('score_plays', lambda batch:
+                  sumoku.batch.score_plays(batch, played, key_number,
+                                           vectorize=False),
+                  cycle([plays]) if plays else None),
+        Benchmark('score_plays_numpy', lambda batch:
+                  sumoku.batch.score_plays(batch, played, key_number,
+                                           vectorize=True),
+                  cycle([plays]) if plays and sumoku.batch.numpy else None),
+        Benchmark('complete_line', lambda tile:
+                  sumoku.game.complete_line(tile, True, board),
+                  cycle(played)),
+        Benchmark('find_tile', lambda tile:
+                  sumoku.game.find_tile(tile[2], tile[3], board),
+                  cycle(played)),
+        Benchmark('find_tile_list', lambda tile:
+                  sumoku.game.find_tile(tile[2], tile[3], played),
+                  cycle(played)),
+        Benchmark('submit_play', lambda clone: clone.submit_play(),
+                  staged_copies(state, best) if best else None),
+        Benchmark('apply_undo', apply_undo, cycle([best]) if best else None),
+        Benchmark('generate_moves', lambda hand: list(
+            sumoku.moves.generate_moves(board, hand, key_number)),
+                  cycle([hand])),
+        Benchmark('print_game', renderer.render, cycle([state])),
+        Benchmark('print_game_diff', differ.render, cycle([state])),
+    ]
+    return [Benchmark('{}/{}'.format(benchmark.name, stage),
+                      benchmark.call, benchmark.inputs)
+            for benchmark in candidates if benchmark.inputs is not None]
+
+
+def bag_benchmarks():
+    """ Return the benchmarks which don't depend on a position """
+    bag = sumoku.game.TileBag()
+
+    def draw(_):
+        """ Draw a tile and put it back for the next call """
+        bag.put_back(sumoku.game.draw_tile(bag))
+
+    return [Benchmark('draw_tile', draw, cycle([None]))]
+
+
+def all_benchmarks(seed=benchmarks.positions.SEED):
+    """ Return every benchmark, built from positions of a seeded game """
+    result = bag_benchmarks()
+    for stage, state in benchmarks.positions.positions(seed):
+        result.extend(stage_benchmarks(stage, state))
+    return result
+
+
+def time_calls(call, inputs):
+    """ Return the seconds taken to call on every input """
+    start = time.time()
+    for item in inputs:
+        call(item)
+    return time.time() - start
+
+
+def ops_per_sec(benchmark, min_time=0.2, repeat=3):
+    """ Return the calls per second of a benchmark, taking the best of
+    repeat runs each lasting at least min_time seconds """
+    count = 1
+    while True:
+        elapsed = time_calls(benchmark.call, benchmark.inputs(count))
+        if elapsed >= min_time:
+            break
+        count = count * 2 if elapsed <= 0 else \
+            max(count + 1, int(count * min_time * 1.2 / elapsed))
+    best = elapsed
+    for _ in xrange(repeat - 1):
+        best = min(best, time_calls(benchmark.call, benchmark.inputs(count)))
+    return count / best
+
+
+def retained(benchmark, count=20):
+    """ Return what calls of a benchmark leave behind, per call
+
+    retained_objects counts the objects tracked by the garbage collector
+    which are still alive after the calls, not every object they
+    allocate. Where tracemalloc is available retained_bytes and
+    peak_bytes, the most memory in use during any one call, are measured
+    too.
+    """
+    inputs = benchmark.inputs(count)
+    gc.collect()
+    before = len(gc.get_objects())
+    kept = 0
+    peak = 0
+    for item in inputs:
+        if tracemalloc is None:
+            benchmark.call(item)
+            continue
+        tracemalloc.start()
+        benchmark.call(item)
+        current, highest = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        kept = kept + current
+        peak = max(peak, highest)
+    gc.collect()
+    result = {'retained_objects':
+              float(len(gc.get_objects()) - before) / count}
+    if tracemalloc is not None:
+        result['retained_bytes'] = float(kept) / count
+        result['peak_bytes'] = peak
+    return result
+
+
+def run(benchmarks_to_run, min_time=0.2, repeat=3, out=None):
+    """ Run benchmarks and return {name: results} """
+    results = {}
+    for benchmark in benchmarks_to_run:
+        result = {'ops_per_sec': ops_per_sec(benchmark, min_time, repeat)}
+        result.update(retained(benchmark))
+        results[benchmark.name] = result
+        if out is not None:
+            out.write('{:28} {:12.1f} ops/sec {:8.2f} retained objects/call\n'
+                      .format(benchmark.name, result['ops_per_sec'],
+                              result['retained_objects']))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """ Return [(name, baseline ops/sec, ops/sec)] for every benchmark
+    slower than its baseline by more than a fraction threshold """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        before = baseline[name]['ops_per_sec']
+        after = results[name]['ops_per_sec']
+        if after < before * (1 - threshold):
+            regressions.append((name, before, after))
+    return regressions
+
+
+def parse_args():
+    """ Parse command line arguments """
+    parser = argparse.ArgumentParser(description='Benchmark sumoku')
+    parser.add_argument('--output', default=None,
+                        help='file to save the results to as JSON')
+    parser.add_argument('--baseline', default=None,
+                        help='results of an earlier run to compare with')
+    parser.add_argument('--threshold', default=0.1, type=float,
+                        help='slowdown from the baseline to fail on')
+    parser.add_argument('--filter', default=None,
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('--min-time', default=0.2, type=float,
+                        help='seconds each timed run lasts at least')
+    parser.add_argument('--repeat', default=3, type=int,
+                        help='number of timed runs to take the best of')
+    parser.add_argument('--seed', default=benchmarks.positions.SEED,
+                        type=int, help='seed of the benchmarked game')
+    return parser.parse_args()
+
+
+def main():
+    """ Run the benchmarks and compare them against a baseline """
+    args = parse_args()
+    to_run = [benchmark for benchmark in all_benchmarks(args.seed)
+              if args.filter is None or args.filter in benchmark.name]
+    results = run(to_run, args.min_time, args.repeat, sys.stdout)
+
+    if args.output is not None:
+        with open(args.output, 'w') as output:
+            json.dump({'python': platform.python_version(),
+                       'seed': args.seed,
+                       'results': results}, output, indent=2, sort_keys=True)
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline)['results'],
+                                  args.threshold)
+        for name, before, after in regressions:
+            print '{} regressed from {:.1f} to {:.1f} ops/sec'.format(
+                name, before, after)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
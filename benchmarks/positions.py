@@ -0,0 +1,28 @@
+""" Representative game positions to benchmark against """
+import random
+import sumoku.gamestate
+import sumoku.simulate
+
+SEED = 20161018
+
+# Tiles on the board at each stage of a game
+STAGES = (('early', 10), ('mid', 45), ('late', 90))
+
+
+def build_position(tiles, seed=SEED, players=2, hand_size=8, key_number=3):
+    """ Return the GameState reached by greedy self-play once at least a
+    number of tiles are on the board """
+    rng = random.Random(seed)
+    state = sumoku.gamestate.GameState(players, hand_size, key_number, rng)
+    while len(state.played_tiles) < tiles:
+        if state.game_complete():
+            raise ValueError('Game over with {} tiles played'
+                             .format(len(state.played_tiles)))
+        state.apply(sumoku.simulate.greedy_agent(state, rng))
+    state.undo_log = []
+    return state
+
+
+def positions(seed=SEED):
+    """ Return [(stage name, GameState)] for each stage of a game """
+    return [(name, build_position(tiles, seed)) for name, tiles in STAGES]
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+""" Statistics over recorded games, streamed in one pass
+
+Records are read an event at a time and each game is reduced to a
+GameSummary as it ends, so nothing more than one game is held however
+many are analyzed. Summaries are added into Stats, counters which merge
+by adding them up, so record files can be analyzed in separate
+processes and their Stats combined at the end.
+
+Games aren't replayed on a board: the scores are taken from the record,
+and a GameTracker follows only the tiles in each hand and the bag, to
+know whose turn it is, when the game ends and which tiles were played
+flipped.
+"""
+import argparse
+import collections
+import json
+import multiprocessing
+import time
+import sumoku.record
+
+GameSummary = collections.namedtuple('GameSummary', ['players', 'hand_size',
+                                                     'key_number', 'scores',
+                                                     'turns', 'plays',
+                                                     'completed', 'tiles',
+                                                     'flips', 'removes',
+                                                     'finished'])
+
+
+class GameTracker(object):
+    """ Follows a recorded game event by event """
+
+    def __init__(self, header):
+        self.header = header
+        self.scores = [0 for _ in xrange(header.players)]
+        self.hands = [[] for _ in xrange(header.players)]
+        self.bag = list(header.order)
+        self.player = 0
+        self.passes = 0
+        self.placed = []
+        self.turns = 0
+        self.plays = 0
+        self.completed = 0
+        self.tiles = 0
+        self.flips = 0
+        self.removes = 0
+        self.deal()
+
+    def deal(self):
+        """ Fill up the hands from the bag, as GameState.draw_tiles does """
+        for hand in self.hands:
+            while len(hand) < self.header.hand_size and len(self.bag) > 0:
+                hand.append(self.bag.pop())
+            hand.sort()
+
+    def event(self, event):
+        """ Follow a move event """
+        name = event[0]
+        hand = self.hands[self.player]
+        if name == 'place':
+            tile = hand.pop(event[1])
+            self.placed.append((tile[0], tile[1], event[2], event[3]))
+        elif name == 'remove':
+            tile = next(tile for tile in self.placed
+                        if tile[2] == event[1] and tile[3] == event[2])
+            self.placed.remove(tile)
+            hand.append((tile[0], tile[1]))
+            self.removes = self.removes + 1
+        elif name == 'flip':
+            number, color = hand[event[1]]
+            if number == 6:
+                hand[event[1]] = (9, color)
+            elif number == 9:
+                hand[event[1]] = (6, color)
+        elif name == 'submit':
+            self.scores[self.player] = self.scores[self.player] + event[1]
+            self.turns = self.turns + 1
+            if len(self.placed) == 0:
+                self.passes = self.passes + 1
+            else:
+                self.passes = 0
+                self.plays = self.plays + 1
+                self.completed = self.completed + bool(event[2])
+                self.tiles = self.tiles + len(self.placed)
+                # The bag holds no 9s, so a 9 played is a 6 flipped over
+                self.flips = self.flips + sum(1 for tile in self.placed
+                                              if tile[0] == 9)
+            self.placed = []
+            # The turn passes on as in GameState.commit_play
+            if not event[2] or len(hand) == 0:
+                self.player = (self.player + 1) % self.header.players
+                self.deal()
+
+    def summary(self):
+        """ Return the GameSummary of the game so far """
+        header = self.header
+        finished = self.passes >= header.players or \
+            (len(self.placed) == 0 and
+             all(len(hand) == 0 for hand in self.hands))
+        return GameSummary(header.players, header.hand_size,
+                           header.key_number, tuple(self.scores), self.turns,
+                           self.plays, self.completed, self.tiles, self.flips,
+                           self.removes, finished)
+
+
+def summaries(events):
+    """ Yield a GameSummary for each game in a stream of record events
+
+    A game the record ends before finishing is summarized with finished
+    False.
+    """
+    game = None
+    for event in events:
+        if isinstance(event, sumoku.record.GameHeader):
+            if game is not None:
+                yield game.summary()
+            game = GameTracker(event)
+        else:
+            game.event(event)
+    if game is not None:
+        yield game.summary()
+
+
+class Stats(object):
+    """ Counts accumulated over games, which can be merged """
+
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def add(self, game):
+        """ Count a GameSummary """
+        counts = self.counts
+        if not game.finished:
+            counts['unfinished'] = counts['unfinished'] + 1
+            return
+        counts['games'] = counts['games'] + 1
+        for name in ('turns', 'plays', 'completed', 'tiles', 'flips',
+                     'removes'):
+            counts[name] = counts[name] + getattr(game, name)
+
+        key = ('key_number', game.key_number)
+        counts[key + ('games',)] = counts[key + ('games',)] + 1
+        counts[key + ('score',)] = counts[key + ('score',)] + \
+            sum(game.scores)
+        counts[key + ('seats',)] = counts[key + ('seats',)] + game.players
+
+        # A tie shares the win between the players tied
+        players = ('players', game.players)
+        counts[players + ('games',)] = counts[players + ('games',)] + 1
+        best = max(game.scores)
+        winners = [seat for seat, score in enumerate(game.scores)
+                   if score == best]
+        for seat in winners:
+            counts[players + ('wins', seat)] = \
+                counts[players + ('wins', seat)] + 1.0 / len(winners)
+
+    def merge(self, other):
+        """ Add the counts of other Stats into these """
+        self.counts.update(other.counts)
+        return self
+
+    def report(self):
+        """ Return the statistics as a dict, ready to print as JSON """
+        counts = self.counts
+
+        def ratio(numerator, denominator):
+            """ Return a ratio of counts, or None if there are none """
+            if counts[denominator] == 0:
+                return None
+            return float(counts[numerator]) / counts[denominator]
+
+        key_numbers = sorted(set(key[1] for key in counts
+                                 if key[0] == 'key_number'))
+        player_counts = sorted(set(key[1] for key in counts
+                                   if key[0] == 'players'))
+        return {
+            'games': counts['games'],
+            'unfinished': counts['unfinished'],
+            'turns_per_game': ratio('turns', 'games'),
+            'completion_rate': ratio('completed', 'plays'),
+            'tiles_per_play': ratio('tiles', 'plays'),
+            'flips_per_game': ratio('flips', 'games'),
+            'flips_per_tile': ratio('flips', 'tiles'),
+            'removes_per_game': ratio('removes', 'games'),
+            'key_numbers': dict(
+                (key_number, {
+                    'games': counts[('key_number', key_number, 'games')],
+                    'mean_score': ratio(('key_number', key_number, 'score'),
+                                        ('key_number', key_number, 'seats')),
+                }) for key_number in key_numbers),
+            'players': dict(
+                (players, {
+                    'games': counts[('players', players, 'games')],
+                    'win_share': [ratio(('players', players, 'wins', seat),
+                                        ('players', players, 'games'))
+                                  for seat in xrange(players)],
+                    # How much more than a fair share the first player wins
+                    'first_player_advantage':
+                    ratio(('players', players, 'wins', 0),
+                          ('players', players, 'games')) - 1.0 / players,
+                }) for players in player_counts),
+        }
+
+
+def analyze(events):
+    """ Return the Stats of the games in a stream of record events """
+    stats = Stats()
+    for game in summaries(events):
+        stats.add(game)
+    return stats
+
+
+def analyze_file(path):
+    """ Return the Stats of the games in a record file """
+    return analyze(sumoku.record.read_file(path))
+
+
+def analyze_files(paths, workers=1):
+    """ Return the Stats of the games in record files, each file analyzed
+    by one of a pool of worker processes """
+    stats = Stats()
+    if workers == 1:
+        for path in paths:
+            stats.merge(analyze_file(path))
+        return stats
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        for partial in pool.imap_unordered(analyze_file, paths):
+            stats.merge(partial)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return stats
+
+
+def parse_args():
+    """ Parse command line arguments """
+    parser = argparse.ArgumentParser(
+        description='Statistics over sumoku records')
+    parser.add_argument('records', nargs='+', help='record files')
+    parser.add_argument('--workers', default=multiprocessing.cpu_count(),
+                        type=int, help='number of worker processes')
+    return parser.parse_args()
+
+
+def main():
+    """ Analyze records and print their statistics as JSON """
+    args = parse_args()
+    start = time.time()
+    report = analyze_files(args.records, min(args.workers,
+                                             len(args.records))).report()
+    elapsed = max(time.time() - start, 1e-9)
+    report['seconds'] = round(elapsed, 2)
+    report['games_per_sec'] = round(report['games'] / elapsed, 1)
+    print json.dumps(report, indent=2, sort_keys=True)
+
+if __name__ == "__main__":
+    main()
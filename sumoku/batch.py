@@ -0,0 +1,319 @@
+""" Validation and scoring of many candidate plays against one board
+
+score_plays scores a batch of plays against the same tiles and returns a
+PlayResult for each, rather than raising for the invalid ones. Results
+match score_play exactly: a valid play gets the same score and completed
+flag, and an invalid one the message score_play would raise it with,
+along with a reason code.
+
+The board is indexed once for the batch, and the lines crossing each
+empty cell are looked up once however many plays use it. If NumPy is
+installed, large batches are scored with array operations instead.
+"""
+import collections
+import sumoku.board
+import sumoku.game
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Reasons a play is invalid
+NOT_IN_LINE = 'not_in_line'
+OCCUPIED = 'occupied'
+GAP = 'gap'
+SUM = 'sum'
+COLOR = 'color'
+
+# Batches at least this large are scored with NumPy when it is available
+VECTOR_THRESHOLD = 1024
+
+PlayResult = collections.namedtuple('PlayResult', ['score', 'completed',
+                                                   'reason', 'message'])
+
+
+def invalid(reason, message):
+    """ Return the PlayResult of an invalid play """
+    return PlayResult(0, False, reason, message)
+
+
+def line_error(total, mask, length, keynumber):
+    """ Return (reason, message) if a line is invalid or None if it isn't,
+    checking it like line_score """
+    if length < 2:
+        return None
+    if total % keynumber != 0:
+        return SUM, 'Sum {} not divisible by {}'.format(total, keynumber)
+    if mask & sumoku.board.REPEATED_COLOR:
+        return COLOR, 'Color {} used more than once'.format(
+            sumoku.game.color_string(sumoku.board.repeated_color(mask)))
+    return None
+
+
+class PlayScorer(object):
+    """ Scores plays against one board, remembering the lines which cross
+    each empty cell
+
+    The board must not change while the scorer is in use.
+    """
+
+    __slots__ = ('board', 'keynumber', 'crossings')
+
+    def __init__(self, tiles, keynumber):
+        self.board = sumoku.board.as_board(tiles, False)
+        self.keynumber = keynumber
+        self.crossings = {}
+
+    def score(self, play):
+        """ Return the PlayResult of a play, checking it like score_play """
+        board = self.board
+        keynumber = self.keynumber
+        if len(play) == 0:
+            return PlayResult(0, False, None, None)
+        if len(play) == 1 and len(board) == 0:
+            if play[0][0] % keynumber == 0:
+                return PlayResult(play[0][0], False, None, None)
+            return invalid(SUM, 'Sum {} not divisible by {}'.format(
+                play[0][0], keynumber))
+
+        tiles = sorted(play)
+        first = tiles[0]
+        notrow = False
+        notcol = False
+        for tile in tiles:
+            if tile[3] != first[3]:
+                notrow = True
+            if tile[2] != first[2]:
+                notcol = True
+        if notrow and notcol:
+            return invalid(NOT_IN_LINE, 'Tiles not in a single row or column')
+
+        cells = board.cells
+        placed = {}
+        for tile in tiles:
+            pos = tile[2] if notcol else tile[3]
+            if pos in placed or (tile[2], tile[3]) in cells:
+                return invalid(OCCUPIED,
+                               'Position {},{} is already occupied'
+                               .format(tile[2], tile[3]))
+            placed[pos] = tile
+
+        try:
+            total, mask, length = board.main_line(placed, notcol, first[2],
+                                                  first[3])
+        except sumoku.game.InvalidPlayException, err:
+            return invalid(GAP, err.message)
+        completed = length == 6
+        score = 0
+        if length >= 2:
+            if total % keynumber or mask & sumoku.board.REPEATED_COLOR:
+                return invalid(*line_error(total, mask, length, keynumber))
+            score = total
+
+        crossings = self.crossings
+        row = not notcol
+        for tile in tiles:
+            key = (tile[2], tile[3], row)
+            line = crossings.get(key)
+            if line is None:
+                line = board.line_through(tile[2], tile[3], row)
+                crossings[key] = line
+            if line[2] == 0:
+                continue
+            total = line[0] + tile[0]
+            mask = sumoku.board.merge_masks(line[1], 1 << tile[1])
+            if total % keynumber or mask & sumoku.board.REPEATED_COLOR:
+                return invalid(*line_error(total, mask, line[2] + 1,
+                                           keynumber))
+            if line[2] == 5:
+                completed = True
+            score = score + total
+        return PlayResult(score, completed, None, None)
+
+
+class LineIndex(object):
+    """ Prefix sums of the board along one axis, over a grid of cells
+
+    Arrays are indexed [position along the line, position across it].
+    Each prefix array has one more position than the grid, so the sum over
+    positions lo to hi is prefix[hi + 1] - prefix[lo].
+    """
+
+    def __init__(self, occupied, numbers, colors):
+        size = occupied.shape[0]
+        positions = numpy.arange(size)[:, numpy.newaxis]
+        self.occupied = occupied
+        self.run_start = numpy.maximum.accumulate(
+            numpy.where(occupied, -1, positions), axis=0) + 1
+        self.run_end = numpy.minimum.accumulate(
+            numpy.where(occupied, size, positions)[::-1], axis=0)[::-1] - 1
+        self.count = self.prefix(occupied)
+        self.total = self.prefix(numbers)
+        self.colors = numpy.array([self.prefix(colors == color)
+                                   for color in xrange(6)])
+
+    @staticmethod
+    def prefix(values):
+        """ Return the prefix sums of values along the line """
+        result = numpy.zeros((values.shape[0] + 1,) + values.shape[1:],
+                             dtype=numpy.int64)
+        numpy.cumsum(values, axis=0, out=result[1:])
+        return result
+
+    def span(self, first, last, across):
+        """ Return (total, color counts, length, gaps) of the board tiles
+        joined by filling positions first to last of lines across, where
+        gaps counts the empty cells within first to last """
+        before = first - 1
+        after = last + 1
+        low = numpy.where(self.occupied[before, across],
+                          self.run_start[before, across], first)
+        high = numpy.where(self.occupied[after, across],
+                           self.run_end[after, across], last)
+        total = self.total[high + 1, across] - self.total[low, across]
+        colors = self.colors[:, high + 1, across] - \
+            self.colors[:, low, across]
+        length = self.count[high + 1, across] - self.count[low, across]
+        gaps = last - first + 1 - (self.count[last + 1, across] -
+                                   self.count[first, across])
+        return total, colors, length, gaps
+
+
+def line_valid(total, colors, length, keynumber):
+    """ Return which lines of arrays of totals, color counts and lengths
+    are valid """
+    return (length < 2) | ((total % keynumber == 0) &
+                           (colors.max(axis=0) <= 1))
+
+
+def vector_scores(plays, board, keynumber):
+    """ Return (valid, scores, completed) arrays for plays of at least one
+    tile against a non-empty Board
+
+    Where valid is False the play may or may not be valid, and must be
+    checked tile by tile.
+    """
+    count = len(plays)
+    sizes = numpy.array([len(play) for play in plays])
+    width = sizes.max()
+    flat = numpy.array([tile for play in plays for tile in play],
+                       dtype=numpy.int64)
+    starts = numpy.cumsum(sizes) - sizes
+    present = numpy.arange(width) < sizes[:, numpy.newaxis]
+    # Padding repeats the first tile, so it indexes a real cell
+    tiles = numpy.repeat(flat[starts][:, numpy.newaxis], width, axis=1)
+    tiles[present] = flat
+
+    # Grid covering the board and the plays, with a border of empty cells
+    cells = numpy.array([tile for tile in board], dtype=numpy.int64)
+    xs = numpy.concatenate([cells[:, 2], tiles[:, :, 2].ravel()])
+    ys = numpy.concatenate([cells[:, 3], tiles[:, :, 3].ravel()])
+    x0 = xs.min() - 1
+    y0 = ys.min() - 1
+    shape = (xs.max() - x0 + 2, ys.max() - y0 + 2)
+    occupied = numpy.zeros(shape, dtype=bool)
+    numbers = numpy.zeros(shape, dtype=numpy.int64)
+    colors = numpy.full(shape, -1, dtype=numpy.int64)
+    occupied[cells[:, 2] - x0, cells[:, 3] - y0] = True
+    numbers[cells[:, 2] - x0, cells[:, 3] - y0] = cells[:, 0]
+    colors[cells[:, 2] - x0, cells[:, 3] - y0] = cells[:, 1]
+    rows = LineIndex(occupied, numbers, colors)
+    cols = LineIndex(occupied.T, numbers.T, colors.T)
+
+    number = tiles[:, :, 0]
+    color = tiles[:, :, 1]
+    x = tiles[:, :, 2] - x0
+    y = tiles[:, :, 3] - y0
+    same_x = (x == x[:, :1]).all(axis=1)
+    same_y = (y == y[:, :1]).all(axis=1)
+    # Like score_play, a play along a row has its main line along the row
+    # and the rest, including single tiles, along the column
+    along_row = ~same_x
+    valid = same_x | same_y
+    valid &= ~occupied[x, y].any(axis=1)
+    pos = numpy.where(along_row[:, numpy.newaxis], x, y)
+    ordered = numpy.sort(numpy.where(present, pos, -1 - numpy.arange(width)),
+                         axis=1)
+    valid &= (ordered[:, 1:] != ordered[:, :-1]).all(axis=1)
+
+    added_total = numpy.where(present, number, 0).sum(axis=1)
+    added_colors = numpy.array([(present & (color == index)).sum(axis=1)
+                                for index in xrange(6)])
+    first = numpy.where(present, pos, pos.max() + 1).min(axis=1)
+    last = numpy.where(present, pos, -1).max(axis=1)
+    total = numpy.zeros(count, dtype=numpy.int64)
+    line_colors = numpy.zeros((6, count), dtype=numpy.int64)
+    length = numpy.zeros(count, dtype=numpy.int64)
+    gaps = numpy.zeros(count, dtype=numpy.int64)
+    for index, axis, across in ((along_row, rows, y[:, 0]),
+                                (~along_row, cols, x[:, 0])):
+        (total[index], line_colors[:, index], length[index],
+         gaps[index]) = axis.span(first[index], last[index], across[index])
+    total = total + added_total
+    line_colors = line_colors + added_colors
+    length = length + sizes
+    valid &= (gaps == sizes) & line_valid(total, line_colors, length,
+                                          keynumber)
+    scores = numpy.where(length >= 2, total, 0)
+    completed = length == 6
+
+    # Each tile's crossing line runs the other way to the main line
+    play, slot = numpy.nonzero(present)
+    cross_row = ~along_row[play]
+    cross_total = numpy.zeros(len(play), dtype=numpy.int64)
+    cross_colors = numpy.zeros((6, len(play)), dtype=numpy.int64)
+    cross_length = numpy.zeros(len(play), dtype=numpy.int64)
+    tile_x = x[play, slot]
+    tile_y = y[play, slot]
+    for index, axis, along, across in ((cross_row, rows, tile_x, tile_y),
+                                       (~cross_row, cols, tile_y, tile_x)):
+        (cross_total[index], cross_colors[:, index], cross_length[index],
+         _) = axis.span(along[index], along[index], across[index])
+    tile_color = color[play, slot]
+    cross_total = cross_total + number[play, slot]
+    cross_colors[tile_color, numpy.arange(len(play))] += 1
+    cross_length = cross_length + 1
+    cross_valid = line_valid(cross_total, cross_colors, cross_length,
+                             keynumber)
+    valid &= numpy.bincount(play, weights=~cross_valid,
+                            minlength=count) == 0
+    scores = scores + numpy.bincount(
+        play, weights=numpy.where(cross_length >= 2, cross_total, 0),
+        minlength=count).astype(numpy.int64)
+    completed |= numpy.bincount(play, weights=cross_length == 6,
+                                minlength=count) > 0
+    return valid, scores, completed
+
+
+def score_plays(plays, tiles, keynumber, vectorize=None):
+    """ Return a PlayResult for each of a list of plays against the same
+    tiles, like calling score_play on each
+
+    The plays themselves are not changed. Batches of VECTOR_THRESHOLD plays
+    or more are scored with NumPy when it is installed, unless vectorize is
+    False; vectorize True insists on it.
+    """
+    scorer = PlayScorer(tiles, keynumber)
+    if vectorize is None:
+        vectorize = numpy is not None and len(plays) >= VECTOR_THRESHOLD
+    elif vectorize and numpy is None:
+        raise ImportError('Vectorized scoring needs NumPy')
+    if not vectorize or len(scorer.board) == 0:
+        return [scorer.score(play) for play in plays]
+
+    indexes = [index for index, play in enumerate(plays) if len(play) > 0]
+    results = [PlayResult(0, False, None, None)] * len(plays)
+    if len(indexes) == 0:
+        return results
+    valid, scores, completed = vector_scores(
+        [plays[index] for index in indexes], scorer.board, keynumber)
+    for index, ok, score, complete in zip(indexes, valid.tolist(),
+                                          scores.tolist(),
+                                          completed.tolist()):
+        if ok:
+            results[index] = PlayResult(score, complete, None, None)
+        else:
+            # The array checks only say a play is invalid, so find out why
+            results[index] = scorer.score(plays[index])
+    return results
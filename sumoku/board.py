@@ -0,0 +1,376 @@
+""" An indexed board of played tiles """
+import sumoku.game
+
+
+# Color masks hold one bit per color in the line, plus a flag and the
+# first color found twice when a color is repeated
+COLOR_BITS = (1 << 6) - 1
+REPEATED_COLOR = 1 << 6
+REPEATED_SHIFT = 7
+
+
+# The lines an empty cell away from every tile would join, as line_through
+# returns them along a row and a column
+NO_LINE = (0, 0, 0)
+NO_LINES = (NO_LINE, NO_LINE)
+
+
+def merge_masks(mask, other):
+    """ Combine the color masks of two parts of a line """
+    if mask & REPEATED_COLOR:
+        return mask | (other & COLOR_BITS)
+    if other & REPEATED_COLOR:
+        return other | (mask & COLOR_BITS)
+    shared = mask & other
+    if shared:
+        color = (shared & -shared).bit_length() - 1
+        return mask | other | REPEATED_COLOR | (color << REPEATED_SHIFT)
+    return mask | other
+
+
+def repeated_color(mask):
+    """ Return the color a mask records as repeated, or None """
+    if mask & REPEATED_COLOR:
+        return mask >> REPEATED_SHIFT
+    return None
+
+
+class Board(object):
+    """ Played tiles (number, color, x, y) indexed by their position
+
+    Every occupied cell also maps to the row and column segments it belongs
+    to, as a tuple (start, end, total, mask) of the first and last position
+    along the line, the sum of the numbers and a bitmask of the colors.
+    These are kept up to date as tiles are added and removed, so a line can
+    be validated without walking it.
+
+    The frontier maps each empty cell within the bounds next to a tile to
+    the (total, mask, length) of the row and column a tile placed there
+    would join, as line_through returns them. Plays other than the first
+    must touch a tile, so only frontier cells need be searched for them.
+
+    Only the cells holding tiles are stored, so a board costs the same
+    whatever its bounds, which may be open.
+    """
+
+    __slots__ = ('cells', 'rows', 'cols', 'frontier', 'bounds', 'shared')
+
+    def __init__(self, tiles=(), frontier=True, bounds=None):
+        """ Construct a board holding the given tiles, keeping the frontier
+        up to date unless frontier is False
+
+        bounds are the Bounds of the play space, by default those of the
+        standard board, sumoku.game.STANDARD_BOUNDS.
+        """
+        self.bounds = sumoku.game.STANDARD_BOUNDS if bounds is None \
+            else bounds
+        self.cells = {}
+        self.rows = {}
+        self.cols = {}
+        self.frontier = {} if frontier else None
+        self.shared = False
+        for tile in tiles:
+            # The first tile found at a position wins, like find_tile
+            if (tile[2], tile[3]) not in self.cells:
+                self.add_tile(tile)
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __iter__(self):
+        return self.cells.itervalues()
+
+    def __contains__(self, tile):
+        return self.cells.get((tile[2], tile[3])) == tile
+
+    def copy(self):
+        """ Return a copy of the board
+
+        The copy shares its indexes with this board until either of them
+        is changed, so copies are cheap to take.
+        """
+        clone = Board.__new__(Board)
+        clone.cells = self.cells
+        clone.rows = self.rows
+        clone.cols = self.cols
+        clone.frontier = self.frontier
+        clone.bounds = self.bounds
+        clone.shared = True
+        self.shared = True
+        return clone
+
+    def _unshare(self):
+        """ Take private copies of indexes shared with another board """
+        self.cells = dict(self.cells)
+        self.rows = dict(self.rows)
+        self.cols = dict(self.cols)
+        if self.frontier is not None:
+            self.frontier = dict(self.frontier)
+        self.shared = False
+
+    def get_tile(self, x, y):
+        """ Return the tile at position x, y or None if it is empty """
+        return self.cells.get((x, y))
+
+    def find_tile(self, x, y):
+        """ Return the tile at position x, y """
+        tile = self.cells.get((x, y))
+        if tile is None:
+            raise sumoku.game.InvalidPlayException('No tile found at {},{}'
+                                                   .format(x, y))
+        return tile
+
+    def add_tile(self, tile):
+        """ Add a tile to the board """
+        x = tile[2]
+        y = tile[3]
+        if (x, y) in self.cells:
+            raise sumoku.game.InvalidPlayException(
+                'Position {},{} is already occupied'.format(x, y))
+        if self.shared:
+            self._unshare()
+        self.cells[(x, y)] = tile
+
+        # Join the segments on either side of the tile
+        bit = 1 << tile[1]
+        before = self.rows.get((x - 1, y), (x, x, 0, 0))
+        after = self.rows.get((x + 1, y), (x, x, 0, 0))
+        segment = (before[0], after[1], before[2] + tile[0] + after[2],
+                   merge_masks(merge_masks(before[3], bit), after[3]))
+        for pos in xrange(segment[0], segment[1] + 1):
+            self.rows[(pos, y)] = segment
+
+        before = self.cols.get((x, y - 1), (y, y, 0, 0))
+        after = self.cols.get((x, y + 1), (y, y, 0, 0))
+        segment = (before[0], after[1], before[2] + tile[0] + after[2],
+                   merge_masks(merge_masks(before[3], bit), after[3]))
+        for pos in xrange(segment[0], segment[1] + 1):
+            self.cols[(x, pos)] = segment
+
+        # Only the cells beyond the ends of the joined segments change
+        if self.frontier is not None:
+            self.frontier.pop((x, y), None)
+            row = self.rows[(x, y)]
+            self._update_frontier(row[0] - 1, y, True)
+            self._update_frontier(row[1] + 1, y, True)
+            self._update_frontier(x, segment[0] - 1, False)
+            self._update_frontier(x, segment[1] + 1, False)
+
+    def remove_tile(self, tile):
+        """ Remove a tile from the board """
+        if tile not in self:
+            raise sumoku.game.InvalidPlayException(
+                'No tile found at {},{}'.format(tile[2], tile[3]))
+        if self.shared:
+            self._unshare()
+        x = tile[2]
+        y = tile[3]
+        del self.cells[(x, y)]
+
+        # Split the segments through the tile into the parts either side
+        row = self.rows.pop((x, y))
+        self._index_row(row[0], x - 1, y)
+        self._index_row(x + 1, row[1], y)
+        col = self.cols.pop((x, y))
+        self._index_col(x, col[0], y - 1)
+        self._index_col(x, y + 1, col[1])
+
+        if self.frontier is not None:
+            self._update_frontier(x, y, True)
+            self._update_frontier(x, y, False)
+            self._update_frontier(row[0] - 1, y, True)
+            self._update_frontier(row[1] + 1, y, True)
+            self._update_frontier(x, col[0] - 1, False)
+            self._update_frontier(x, col[1] + 1, False)
+
+    def _update_frontier(self, x, y, row):
+        """ Recompute the line a tile at an empty cell would join along a
+        row or column, adding the cell to the frontier or dropping it """
+        pos = (x, y)
+        if pos in self.cells or not self.bounds.contains(x, y):
+            return
+        line = self.line_through(x, y, row)
+        frontier = self.frontier
+        lines = frontier.get(pos, NO_LINES)
+        if row:
+            if line[2] == 0 and lines[1][2] == 0:
+                frontier.pop(pos, None)
+            else:
+                frontier[pos] = (line, lines[1])
+        elif line[2] == 0 and lines[0][2] == 0:
+            frontier.pop(pos, None)
+        else:
+            frontier[pos] = (lines[0], line)
+
+    def _index_row(self, start, end, y):
+        """ Recompute the row segment covering x positions start to end """
+        total = 0
+        mask = 0
+        for pos in xrange(start, end + 1):
+            tile = self.cells[(pos, y)]
+            total = total + tile[0]
+            mask = merge_masks(mask, 1 << tile[1])
+        segment = (start, end, total, mask)
+        for pos in xrange(start, end + 1):
+            self.rows[(pos, y)] = segment
+
+    def _index_col(self, x, start, end):
+        """ Recompute the column segment covering y positions start to end """
+        total = 0
+        mask = 0
+        for pos in xrange(start, end + 1):
+            tile = self.cells[(x, pos)]
+            total = total + tile[0]
+            mask = merge_masks(mask, 1 << tile[1])
+        segment = (start, end, total, mask)
+        for pos in xrange(start, end + 1):
+            self.cols[(x, pos)] = segment
+
+    def segment(self, x, y, row):
+        """ Return the row or column segment through an occupied cell """
+        if row:
+            return self.rows.get((x, y))
+        return self.cols.get((x, y))
+
+    def line_through(self, x, y, row):
+        """ Return (total, mask, length) of the tiles a new tile at an empty
+        position x, y would join along a row or column """
+        if row:
+            before = self.rows.get((x - 1, y))
+            after = self.rows.get((x + 1, y))
+        else:
+            before = self.cols.get((x, y - 1))
+            after = self.cols.get((x, y + 1))
+        total = 0
+        mask = 0
+        length = 0
+        if before is not None:
+            total = before[2]
+            mask = before[3]
+            length = before[1] - before[0] + 1
+        if after is not None:
+            total = total + after[2]
+            mask = merge_masks(mask, after[3])
+            length = length + after[1] - after[0] + 1
+        return (total, mask, length)
+
+    def complete_line(self, tile, row):
+        """ Complete the line of tiles through tile """
+        line = [tile]
+        cells = self.cells
+        x = tile[2]
+        y = tile[3]
+
+        # Search before the start and after the end until we can't find
+        # any more
+        for step in (-1, 1):
+            pos = (x if row else y) + step
+            found = cells.get((pos, y) if row else (x, pos))
+            while found is not None:
+                line.append(found)
+                pos = pos + step
+                found = cells.get((pos, y) if row else (x, pos))
+
+        return line
+
+    def score_play(self, newtiles, keynumber):
+        """ Validates and scores a new play from the cached line segments """
+        # Make sure the new tiles are all in the same row or column
+        row = newtiles[0][3]
+        col = newtiles[0][2]
+        notrow = False
+        notcol = False
+        for tile in newtiles[1:]:
+            if tile[3] != row:
+                notrow = True
+            if tile[2] != col:
+                notcol = True
+            if notrow and notcol:
+                raise sumoku.game.InvalidPlayException(
+                    'Tiles not in a single row or column')
+
+        # Index the new tiles by their position along the main line
+        placed = {}
+        for tile in newtiles:
+            pos = tile[2] if notcol else tile[3]
+            if pos in placed or (tile[2], tile[3]) in self.cells:
+                raise sumoku.game.InvalidPlayException(
+                    'Position {},{} is already occupied'
+                    .format(tile[2], tile[3]))
+            placed[pos] = tile
+
+        # Score the major axis once, and minor axis for each new tile
+        total, mask, length = self.main_line(placed, notcol, col, row)
+        completed = length == 6
+        score = line_score(total, mask, length, keynumber)
+        for tile in newtiles:
+            total, mask, length = self.line_through(tile[2], tile[3],
+                                                    not notcol)
+            length = length + 1
+            if length == 6:
+                completed = True
+            score = score + line_score(total + tile[0],
+                                       merge_masks(mask, 1 << tile[1]),
+                                       length, keynumber)
+        return (score, completed)
+
+    def main_line(self, placed, row, x, y):
+        """ Return (total, mask, length) of the line formed by new tiles
+        indexed by their position along a row or column """
+        segments = self.rows if row else self.cols
+        first = min(placed)
+        last = max(placed)
+        total = 0
+        mask = 0
+        length = 0
+
+        # Include whatever the play extends on either end
+        for pos in (first - 1, last + 1):
+            segment = segments.get((pos, y) if row else (x, pos))
+            if segment is not None:
+                total = total + segment[2]
+                mask = merge_masks(mask, segment[3])
+                length = length + segment[1] - segment[0] + 1
+
+        # Walk from the first to the last new tile, jumping over segments
+        pos = first
+        while pos <= last:
+            tile = placed.get(pos)
+            if tile is not None:
+                total = total + tile[0]
+                mask = merge_masks(mask, 1 << tile[1])
+                length = length + 1
+                pos = pos + 1
+                continue
+            segment = segments.get((pos, y) if row else (x, pos))
+            if segment is None:
+                raise sumoku.game.InvalidPlayException('Gaps in main line')
+            total = total + segment[2]
+            mask = merge_masks(mask, segment[3])
+            length = length + segment[1] - segment[0] + 1
+            pos = segment[1] + 1
+        return (total, mask, length)
+
+
+def line_score(total, mask, length, keynumber):
+    """ Validates and scores a line from its cached sum and color mask """
+    # Just ignore length 1 or 0
+    if length < 2:
+        return 0
+    if total % keynumber != 0:
+        raise sumoku.game.InvalidPlayException('Sum {} not divisible by {}'
+                                               .format(total, keynumber))
+    if mask & REPEATED_COLOR:
+        raise sumoku.game.InvalidPlayException(
+            'Color {} used more than once'
+            .format(sumoku.game.color_string(repeated_color(mask))))
+    return total
+
+
+def as_board(tiles, frontier=True):
+    """ Return tiles as a Board, indexing a plain list on the standard
+    board if necessary, with its frontier unless frontier is False """
+    if isinstance(tiles, Board) and \
+            (not frontier or tiles.frontier is not None):
+        return tiles
+    return Board(tiles, frontier)
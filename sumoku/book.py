@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+""" An opening book of plays precomputed from self-play
+
+The first turns of a game are much alike: the board is small and the
+hands are what differ. The builder plays many games with a quick agent,
+notes the positions met in their first turns, and searches each distinct
+one with Monte Carlo tree search for its best play.
+
+Positions are canonicalized before they are looked up, so a book holds
+one entry for all the positions which differ only by where the tiles lie
+on the board or by a relabelling of the colors. Tiles are moved so the
+board starts MARGIN cells from the top left corner, or the middle of an
+empty board lies there. Colors on the board are numbered in the order
+their tiles are met reading the board row by row, and the rest by the
+numbers held in them. Sixes and nines in hand count as the same tile.
+
+A book file is a header and records sorted by a 64 bit hash of the
+canonical position, each holding the play as packed tiles. It is read
+through mmap and searched by bisection, so loading a book parses
+nothing and costs nothing until it is used.
+"""
+import argparse
+import collections
+import hashlib
+import itertools
+import mmap
+import multiprocessing
+import random
+import struct
+import sumoku.game
+import sumoku.gamestate
+import sumoku.mcts
+import sumoku.moves
+import sumoku.simulate
+
+MAGIC = 'SOB1'
+# Magic and number of records
+HEADER = struct.Struct('<4sI')
+# Position hash, number of tiles and the packed tiles of the play
+RECORD = struct.Struct('<QB{}I'.format(sumoku.moves.MAX_LINE))
+# Cells left clear around the board, as far as a play can reach past it
+MARGIN = sumoku.moves.MAX_LINE - 1
+
+# The hash of a canonical position, the offset of its board from the
+# real one, and the canonical label of each real color
+Position = collections.namedtuple('Position', ['key', 'offset', 'colors'])
+
+
+def canonical(board, hand, key_number):
+    """ Return the canonical Position of a hand and board, or None if the
+    board is too large for a book """
+    tiles = sorted(board, key=lambda tile: (tile[3], tile[2]))
+    if len(tiles) == 0:
+        x, y = board.bounds.middle()
+    else:
+        x = min(tile[2] for tile in tiles)
+        y = tiles[0][3]
+    offset = (x - MARGIN, y - MARGIN)
+
+    colors = {}
+    for tile in tiles:
+        if tile[1] not in colors:
+            colors[tile[1]] = len(colors)
+    # Colors only in hand are told apart by nothing but their numbers
+    held = collections.defaultdict(list)
+    for number, color in hand:
+        if color not in colors:
+            held[color].append(6 if number == 9 else number)
+    for color in sorted(held, key=lambda color: sorted(held[color])):
+        colors[color] = len(colors)
+
+    placed = []
+    for tile in tiles:
+        x = tile[2] - offset[0]
+        y = tile[3] - offset[1]
+        if x >= sumoku.game.X_LIMIT - MARGIN or \
+                y >= sumoku.game.Y_LIMIT - MARGIN:
+            return None
+        placed.append(sumoku.game.pack_tile((tile[0], colors[tile[1]], x,
+                                             y)))
+    held = sorted(sumoku.game.pack_tile((6 if number == 9 else number,
+                                         colors[color]))
+                  for number, color in hand)
+    data = struct.pack('<BB{}B{}I'.format(len(held), len(placed)),
+                       key_number, len(held), *(held + placed))
+    key = struct.unpack('<Q', hashlib.sha1(data).digest()[:8])[0]
+    return Position(key, offset, colors)
+
+
+def encode_move(position, move):
+    """ Return the tiles of a Move as packed in a record, or None if they
+    reach too far from the board """
+    packed = []
+    for number, color, x, y in move.tiles:
+        x = x - position.offset[0]
+        y = y - position.offset[1]
+        if not 0 <= x < sumoku.game.X_LIMIT or \
+                not 0 <= y < sumoku.game.Y_LIMIT:
+            return None
+        packed.append(sumoku.game.pack_tile((number,
+                                             position.colors[color], x, y)))
+    return tuple(packed)
+
+
+def decode_move(position, packed):
+    """ Return the played tiles packed in a record, on the real board """
+    real = dict((label, color)
+                for color, label in position.colors.iteritems())
+    tiles = []
+    for value in packed:
+        number, color, x, y = sumoku.game.unpack_tile(value)
+        if color not in real:
+            return None
+        tiles.append((number, real[color], x + position.offset[0],
+                      y + position.offset[1]))
+    return tuple(sorted(tiles))
+
+
+def write_book(path, entries):
+    """ Write a book file of entries mapping position hashes to packed
+    tiles """
+    padding = (0,) * sumoku.moves.MAX_LINE
+    with open(path, 'wb') as output:
+        output.write(HEADER.pack(MAGIC, len(entries)))
+        for key in sorted(entries):
+            packed = entries[key]
+            output.write(RECORD.pack(key, len(packed),
+                                     *(packed + padding)[:len(padding)]))
+
+
+class OpeningBook(object):
+    """ A book file mapped into memory """
+
+    __slots__ = ('stream', 'data', 'count')
+
+    def __init__(self, path):
+        self.stream = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self.stream.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            magic, self.count = HEADER.unpack_from(self.data)
+        except (mmap.error, struct.error, ValueError):
+            self.stream.close()
+            raise ValueError('{} is not an opening book'.format(path))
+        if magic != MAGIC or \
+                len(self.data) != HEADER.size + self.count * RECORD.size:
+            self.close()
+            raise ValueError('{} is not an opening book'.format(path))
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, key):
+        """ Return the packed tiles of the play for a position hash, or
+        None if the book doesn't hold it """
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            record = RECORD.unpack_from(self.data,
+                                        HEADER.size + middle * RECORD.size)
+            if record[0] < key:
+                low = middle + 1
+            elif record[0] > key:
+                high = middle
+            else:
+                return record[2:2 + record[1]]
+        return None
+
+    def move(self, state):
+        """ Return the book's Move for the current player of a game state,
+        or None if it has none or its play isn't legal there """
+        if len(state.pending_tiles) > 0:
+            return None
+        hand = state.cur_hand()
+        position = canonical(state.board, hand, state.key_number)
+        if position is None:
+            return None
+        packed = self.lookup(position.key)
+        if packed is None:
+            return None
+        tiles = decode_move(position, packed)
+        if tiles is None:
+            return None
+
+        # A hash collision or another board size could give any play, so
+        # check it can be made before trusting it
+        held = collections.Counter((6 if number == 9 else number, color)
+                                   for number, color in hand)
+        for number, color, x, y in tiles:
+            face = (6 if number == 9 else number, color)
+            if held[face] == 0 or not state.board.bounds.contains(x, y):
+                return None
+            held[face] = held[face] - 1
+        try:
+            score, completed = sumoku.game.score_play(list(tiles),
+                                                      state.board,
+                                                      state.key_number)
+        except sumoku.game.InvalidPlayException:
+            return None
+        return sumoku.moves.Move(tiles, score, completed)
+
+    def close(self):
+        """ Unmap the book """
+        self.data.close()
+        self.stream.close()
+
+
+def opening_positions(players, hand_size, key_number, agent, plies, seed):
+    """ Play the first plies turns of a seeded game with an agent, and
+    return the (hash, state) of each position met """
+    rng = random.Random(seed)
+    if key_number == 'random':
+        key_number = sumoku.game.get_key_number(rng)
+    agent = sumoku.simulate.get_agent(agent)
+    state = sumoku.gamestate.GameState(players, hand_size, key_number, rng)
+    found = []
+    for _ in xrange(plies):
+        if state.game_complete():
+            break
+        position = canonical(state.board, state.cur_hand(), key_number)
+        if position is not None:
+            found.append((position.key, state.copy()))
+        move = agent(state, rng)
+        if move is not None:
+            state.stage_play(move.tiles)
+        state.submit_play()
+    return found
+
+
+def _positions_task(task):
+    """ Find the opening positions of one game from a tuple of
+    opening_positions arguments """
+    return opening_positions(*task)
+
+
+def best_response(task):
+    """ Search a position from a (hash, state, iterations) tuple, and
+    return the hash with the packed tiles of its best play, or None for
+    the tiles if it is best to pass """
+    key, state, iterations = task
+    move = sumoku.mcts.MCTSAgent(None, iterations, seed=key)(state)
+    if move is None:
+        return key, None
+    position = canonical(state.board, state.cur_hand(), state.key_number)
+    return key, encode_move(position, move)
+
+
+def build(games, players, hand_size, key_number, agent='greedy', plies=2,
+          iterations=200, min_count=1, seed=None, workers=1,
+          callback=None):
+    """ Return book entries for the opening positions met in self-play
+
+    Positions met in at least min_count of the games are searched once
+    each for iterations of Monte Carlo tree search per play. callback, if
+    given, is called with the number searched and the number to search
+    as each search finishes.
+    """
+    tasks = [(players, hand_size, key_number, agent, plies, game_seed)
+             for game_seed in sumoku.simulate.game_seeds(games, seed)]
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        mapper = itertools.imap if pool is None else pool.imap_unordered
+        counts = collections.Counter()
+        states = {}
+        for found in mapper(_positions_task, tasks):
+            for key, state in found:
+                counts[key] = counts[key] + 1
+                states.setdefault(key, state)
+
+        searches = [(key, states[key], iterations)
+                    for key in sorted(counts) if counts[key] >= min_count]
+        entries = {}
+        for done, (key, packed) in enumerate(mapper(best_response,
+                                                    searches)):
+            if packed is not None:
+                entries[key] = packed
+            if callback is not None:
+                callback(done + 1, len(searches))
+        if pool is not None:
+            pool.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return entries
+
+
+def parse_args():
+    """ Parse command line arguments """
+    parser = argparse.ArgumentParser(
+        description='Build a sumoku opening book from self-play')
+    parser.add_argument('book', help='book file to write')
+    parser.add_argument('--games', default=1000, type=int,
+                        help='number of self-play games')
+    parser.add_argument('--plies', default=2, type=int,
+                        help='turns of each game to take positions from')
+    parser.add_argument('--players', default=2, type=int,
+                        choices=range(2, 6), help='number of players')
+    parser.add_argument('--key-number', default='random',
+                        choices=['3', '4', '5', 'random'],
+                        help="key number, or 'random' for each game")
+    parser.add_argument('--hand-size', default=8, type=int,
+                        help='number of tiles in hand')
+    parser.add_argument('--agent', default='greedy',
+                        choices=sorted(sumoku.simulate.AGENTS),
+                        help='agent playing the self-play games')
+    parser.add_argument('--iterations', default=200, type=int,
+                        help='search iterations for each position')
+    parser.add_argument('--min-count', default=1, type=int,
+                        help='games a position must be met in to be kept')
+    parser.add_argument('--seed', default=None, type=int,
+                        help='seed for the whole run')
+    parser.add_argument('--workers', default=multiprocessing.cpu_count(),
+                        type=int, help='number of worker processes')
+
+    args = parser.parse_args()
+    if args.key_number != 'random':
+        args.key_number = int(args.key_number)
+    return args
+
+
+def main():
+    """ Build an opening book and write it out """
+    args = parse_args()
+    entries = build(args.games, args.players, args.hand_size,
+                    args.key_number, args.agent, args.plies,
+                    args.iterations, args.min_count, args.seed,
+                    args.workers)
+    write_book(args.book, entries)
+    print 'Wrote {} positions to {}'.format(len(entries), args.book)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+""" An exact solver for the endgame, once the bag is empty
+
+With no tiles left to draw, nothing about the rest of the game is left to
+chance, so it can be searched exhaustively. The search is paranoid: the
+player to move at the root maximizes the margin of their final score over
+the best of the other players, and every other player is assumed to play
+to minimize that margin. With two players this is exact minimax.
+
+The search deepens one turn at a time with alpha-beta pruning, trying
+the best move found by the previous iteration first and then the highest
+scoring plays. Positions are remembered in a TranspositionTable, so a
+position reached again, or searched again one turn deeper, is not searched
+twice.
+"""
+import collections
+import time
+import sumoku.game
+import sumoku.moves
+import sumoku.zobrist
+
+TABLE_SIZE = 1 << 16
+# Depth stored for values which searched to the end of the game
+SOLVED = 1 << 10
+# Kinds of value stored in the table
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+Result = collections.namedtuple('Result', ['move', 'margin', 'line', 'depth',
+                                           'solved', 'nodes', 'seconds',
+                                           'nodes_per_sec'])
+
+
+class BudgetExceeded(Exception):
+    """ Exception raised inside the search when its budget runs out """
+    pass
+
+
+def margin(state, player):
+    """ Return how far a player's score leads the best of the others """
+    return state.scores[player] - max(
+        score for index, score in enumerate(state.scores) if index != player)
+
+
+def position_key(state, root):
+    """ Return the table key of a position searched for the root player
+
+    With two players the margin still to be won from a position doesn't
+    depend on the scores so far, so only the tiles, the passes and whose
+    turn it is are keyed. With more players the margin over the best of
+    the others does, so the scores are keyed too.
+    """
+    key = sumoku.zobrist.mix(state.full_hash() ^ root)
+    key = sumoku.zobrist.mix(key ^ state.passes)
+    if state.players > 2:
+        for score in state.scores:
+            key = sumoku.zobrist.mix(key ^ score)
+    return key
+
+
+def ordered_moves(state, first=None, width=None):
+    """ Return the moves to search from a position, first then the highest
+    scoring plays, with a pass last
+
+    If width is given only that many of the highest scoring plays are
+    searched.
+    """
+    moves = sorted(sumoku.moves.generate_moves(state.board, state.cur_hand(),
+                                               state.key_number,
+                                               analyzer=state.analyzer()),
+                   key=lambda move: (move.completed, move.score,
+                                     len(move.tiles)),
+                   reverse=True)
+    if width is not None:
+        del moves[width:]
+    moves.append(None)
+    if first in moves:
+        moves.remove(first)
+        moves.insert(0, first)
+    return moves
+
+
+class Solver(object):
+    """ A depth limited paranoid search from a position
+
+    The search runs on state itself, leaving it as it found it. Once one
+    iteration has finished, BudgetExceeded is raised when more than nodes
+    positions have been searched, the deadline has passed or the cancel
+    event, a threading.Event, is set. If width is given only that many
+    plays are searched from each position, as ordered_moves picks them.
+    """
+
+    def __init__(self, state, nodes=None, deadline=None, table=None,
+                 width=None, cancel=None):
+        self.state = state
+        self.root = state.player
+        self.max_nodes = nodes
+        self.deadline = deadline
+        self.table = sumoku.zobrist.TranspositionTable(TABLE_SIZE) \
+            if table is None else table
+        self.width = width
+        self.cancel = cancel
+        self.nodes = 0
+        self.limited = False
+
+    def check_budget(self):
+        """ Raise BudgetExceeded if the budget has run out """
+        if not self.limited:
+            return
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise BudgetExceeded()
+        if self.deadline is not None and time.time() > self.deadline:
+            raise BudgetExceeded()
+        if self.cancel is not None and self.cancel.is_set():
+            raise BudgetExceeded()
+
+    def search(self, depth, alpha, beta):
+        """ Return (margin, solved) for the root player searching depth
+        more turns, where solved is True if the search reached the end of
+        the game on every line it had to look at """
+        self.nodes = self.nodes + 1
+        self.check_budget()
+        state = self.state
+        if state.game_complete():
+            return margin(state, self.root), True
+        if depth == 0:
+            return margin(state, self.root), False
+
+        # With two players values are stored relative to the margin so far
+        base = margin(state, self.root) if state.players == 2 else 0
+        key = position_key(state, self.root)
+        entry = self.table.get(key)
+        first = None
+        if entry is not None:
+            stored, (kind, value, first) = entry
+            value = value + base
+            if stored >= depth and \
+                    (kind == EXACT or (kind == LOWER and value >= beta) or
+                     (kind == UPPER and value <= alpha)):
+                return value, stored >= SOLVED
+
+        maximize = state.player == self.root
+        lower, upper = alpha, beta
+        best = None
+        best_value = None
+        solved = True
+        for move in ordered_moves(state, first, self.width):
+            if depth == 1:
+                value, child_solved = self.leaf(move)
+            else:
+                state.apply(move)
+                try:
+                    value, child_solved = self.search(depth - 1, alpha,
+                                                      beta)
+                finally:
+                    state.undo()
+            solved = solved and child_solved
+            if best_value is None or \
+                    (value > best_value if maximize else value < best_value):
+                best = move
+                best_value = value
+            if maximize:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+
+        kind = EXACT
+        if best_value <= lower:
+            kind = UPPER
+        elif best_value >= upper:
+            kind = LOWER
+        self.table.put(key, (kind, best_value - base, best),
+                       SOLVED if solved else depth)
+        return best_value, solved
+
+    def leaf(self, move):
+        """ Return (margin, solved) after a move at the edge of the search,
+        working it out without making the move """
+        self.nodes = self.nodes + 1
+        state = self.state
+        if move is None:
+            return margin(state, self.root), \
+                state.passes + 1 >= state.players
+        scores = state.scores
+        scores[state.player] = scores[state.player] + move.score
+        value = margin(state, self.root)
+        scores[state.player] = scores[state.player] - move.score
+        complete = len(state.tiles) == 0 and \
+            len(move.tiles) == len(state.cur_hand()) and \
+            all(len(hand) == 0 for player, hand in enumerate(state.hands)
+                if player != state.player)
+        return value, complete
+
+    def best_line(self, depth):
+        """ Return the best moves from the position, as far as the table
+        remembers them, up to depth turns """
+        state = self.state
+        start = state.snapshot()
+        line = []
+        while len(line) < depth and not state.game_complete():
+            entry = self.table.get(position_key(state, self.root))
+            if entry is None:
+                break
+            move = entry[1][2]
+            line.append(move)
+            state.apply(move)
+        state.restore(start)
+        return line
+
+
+def check_position(state):
+    """ Raise InvalidPlayException unless the endgame can be searched from
+    a position: the bag must be empty and no tiles placed """
+    if len(state.tiles) != 0:
+        raise sumoku.game.InvalidPlayException('Tiles remain in the bag')
+    if len(state.pending_tiles) != 0:
+        raise sumoku.game.InvalidPlayException('Tiles already placed')
+
+
+def solve(state, nodes=None, seconds=None, table=None):
+    """ Search the endgame from a position with an empty bag, returning a
+    Result
+
+    The search deepens until it reaches the end of the game on every line,
+    when the result is solved, or until more than nodes positions have
+    been searched or seconds have passed. The first iteration, one turn
+    deep, always finishes. margin is the root player's final score less
+    the best of the others, and line the best moves from the position.
+    """
+    check_position(state)
+    start = time.time()
+    deadline = None if seconds is None else start + seconds
+    return deepen(Solver(state.copy(), nodes, deadline, table), start)
+
+
+def deepen(solver, start, progress=None):
+    """ Search with a Solver one turn deeper at a time until its budget
+    runs out or the game is solved, returning a Result
+
+    start is the time the search started. progress, if given, is called
+    with the Result of each iteration as it finishes.
+    """
+    state = solver.state
+    depth = 0
+    value = margin(state, solver.root)
+    solved = state.game_complete()
+    result = Result(None, value, [], depth, solved, 0, 0.0, 0.0)
+    while not solved:
+        try:
+            value, solved = solver.search(depth + 1, float('-inf'),
+                                          float('inf'))
+        except BudgetExceeded:
+            break
+        depth = depth + 1
+        solver.limited = True
+        line = solver.best_line(depth)
+        elapsed = time.time() - start
+        result = Result(line[0] if len(line) > 0 else None, value, line,
+                        depth, solved, solver.nodes, elapsed,
+                        solver.nodes / max(elapsed, 1e-9))
+        if progress is not None:
+            progress(result)
+
+    elapsed = time.time() - start
+    return result._replace(nodes=solver.nodes, seconds=elapsed,
+                           nodes_per_sec=solver.nodes / max(elapsed, 1e-9))
@@ -1,5 +1,10 @@
 """ Implementation of the sumoku game rules """
+import array
+import collections
+import itertools
 import random
+import sys
+import sumoku.board
 
 # Tile colors
 COLOR_RED = 0
@@ -9,12 +14,81 @@ COLOR_BLUE = 3
 COLOR_MAGENTA = 4
 COLOR_CYAN = 5
 
-# Edge of the play space
+# Edge of the play space of the standard board. Each Board has its own
+# Bounds, so games on boards of other sizes can be played side by side.
 MIN_X = 0
 MAX_X = 51
 MIN_Y = 0
 MAX_Y = 19
 
+
+class Bounds(collections.namedtuple('Bounds', ['min_x', 'max_x', 'min_y',
+                                               'max_y'])):
+    """ The cells of a board tiles may be played in, from min to max on
+    each axis inclusive, where an edge of None is open """
+
+    __slots__ = ()
+
+    def contains(self, x, y):
+        """ Return True if a position is within the bounds """
+        return (self.min_x is None or x >= self.min_x) and \
+            (self.max_x is None or x <= self.max_x) and \
+            (self.min_y is None or y >= self.min_y) and \
+            (self.max_y is None or y <= self.max_y)
+
+    def limits(self, row):
+        """ Return the first and last position along a row or a column,
+        open edges being the furthest an int reaches """
+        low, high = (self.min_x, self.max_x) if row else \
+            (self.min_y, self.max_y)
+        return (-sys.maxint - 1 if low is None else low,
+                sys.maxint if high is None else high)
+
+    def middle(self):
+        """ Return the position in the middle of the bounds, taking 0 along
+        an axis open at either end """
+        return tuple(0 if low is None or high is None else (low + high) // 2
+                     for low, high in ((self.min_x, self.max_x),
+                                       (self.min_y, self.max_y)))
+
+
+# Bounds of the standard board, and of a board tiles may be played
+# anywhere on
+STANDARD_BOUNDS = Bounds(MIN_X, MAX_X, MIN_Y, MAX_Y)
+UNBOUNDED = Bounds(None, None, None, None)
+
+# Packed tiles hold the number in the low 4 bits, then 3 bits of color,
+# 6 bits of x and 5 bits of y. A tile in hand is just the low 7 bits.
+COLOR_SHIFT = 4
+X_SHIFT = 7
+Y_SHIFT = 13
+X_LIMIT = 1 << 6
+Y_LIMIT = 1 << 5
+
+
+def pack_tile(tile):
+    """ Pack a tile (number, color) or (number, color, x, y) into an int """
+    value = tile[0] | (tile[1] << COLOR_SHIFT)
+    if len(tile) > 2:
+        if not (0 <= tile[2] < X_LIMIT and 0 <= tile[3] < Y_LIMIT):
+            raise ValueError('Position {},{} cannot be packed'
+                             .format(tile[2], tile[3]))
+        value = value | (tile[2] << X_SHIFT) | (tile[3] << Y_SHIFT)
+    return value
+
+
+def unpack_tile(value):
+    """ Unpack an int into a played tile (number, color, x, y) """
+    return (value & 15, (value >> COLOR_SHIFT) & 7,
+            (value >> X_SHIFT) & 63, value >> Y_SHIFT)
+
+
+# Every tile a hand can hold, by its packed value, so reading a hand
+# doesn't build new tuples
+HAND_TILES = [(value & 15, value >> COLOR_SHIFT)
+              for value in xrange(1 << X_SHIFT)]
+
+
 def color_string(color):
     """ Translate a color to a string """
     if color == COLOR_RED:
@@ -33,11 +107,15 @@ def color_string(color):
 
 def tile_string(tile):
     """ Translate a tile to string """
-    return '{} {}'.format(color_string(tile[0]), tile[1])
+    if isinstance(tile, int):
+        tile = HAND_TILES[tile & ((1 << X_SHIFT) - 1)]
+    return '{} {}'.format(color_string(tile[1]), tile[0])
 
 
 def played_tile_string(tile):
     """ Translate a played tile to a string """
+    if isinstance(tile, int):
+        tile = unpack_tile(tile)
     return '{} at {},{}'.format(tile_string(tile), tile[2], tile[3])
 
 
@@ -53,24 +131,30 @@ def score_tiles(tiles, keynumber):
         return 0
 
     # Check that sum is divisible by the key number
-    tilesum = sum([tile[0] for tile in tiles])
+    tilesum = 0
+    colors = 0
+    repeated = None
+    for tile in tiles:
+        tilesum = tilesum + tile[0]
+        bit = 1 << tile[1]
+        if colors & bit and repeated is None:
+            repeated = tile[1]
+        colors = colors | bit
     if tilesum % keynumber != 0:
         raise InvalidPlayException('Sum {} not divisible by {}'
                                    .format(tilesum, keynumber))
 
     # Check that no colors are repeated
-    colors = []
-    for tile in tiles:
-        color = tile[1]
-        if color in colors:
-            raise InvalidPlayException('Color {} used more than once'
-                                       .format(color_string(color)))
-        colors.append(color)
+    if repeated is not None:
+        raise InvalidPlayException('Color {} used more than once'
+                                   .format(color_string(repeated)))
     return tilesum
 
 
 def find_tile(x, y, tiles):
     """ Return the tile at position x, y """
+    if isinstance(tiles, sumoku.board.Board):
+        return tiles.find_tile(x, y)
     for tile in tiles:
         if tile[2] == x and tile[3] == y:
             return tile
@@ -79,31 +163,7 @@ def find_tile(x, y, tiles):
 
 def complete_line(tile, row, tiles):
     """ Complete the line of tiles """
-    line = [tile]
-
-    # Search before the start until we can't find any more
-    try:
-        if row:
-            for x in xrange(tile[2] - 1, MIN_X - 1, -1):
-                line.append(find_tile(x, tile[3], tiles))
-        else:
-            for y in xrange(tile[3] - 1, MIN_Y - 1, -1):
-                line.append(find_tile(tile[2], y, tiles))
-    except InvalidPlayException:
-        pass
-
-    # Search after the end until we can't find any more
-    try:
-        if row:
-            for x in xrange(tile[2] + 1, MAX_X + 1):
-                line.append(find_tile(x, tile[3], tiles))
-        else:
-            for y in xrange(tile[3] + 1, MAX_Y + 1):
-                line.append(find_tile(tile[2], y, tiles))
-    except InvalidPlayException:
-        pass
-
-    return line
+    return sumoku.board.as_board(tiles, False).complete_line(tile, row)
 
 
 def score_play(newtiles, tiles, keynumber):
@@ -124,42 +184,13 @@ def score_play(newtiles, tiles, keynumber):
     # Sort the tiles to make things easier
     newtiles.sort()
 
-    # Make sure the new tiles are all in the same row or column
-    row = newtiles[0][3]
-    col = newtiles[0][2]
-    notrow = False
-    notcol = False
-    for tile in newtiles[1:]:
-        if tile[3] != row:
-            notrow = True
-        if tile[2] != col:
-            notcol = True
-        if notrow and notcol:
-            raise InvalidPlayException('Tiles not in a single row or column')
-
-    alltiles = list(newtiles)
-    alltiles.extend(tiles)
-
-    # Score the major axis once, and minor axis for each new tile
-    completed = False
-    mainline = complete_line(newtiles[0], notcol, alltiles)
-    if newtiles[-1] not in mainline:
-        raise InvalidPlayException('Gaps in main line')
-    if len(mainline) == 6:
-        completed = True
-
-    score = score_tiles(mainline, keynumber)
-    for tile in newtiles:
-        line = complete_line(tile, not notcol, alltiles)
-        if len(line) == 6:
-            completed = True
-        score = score + score_tiles(line, keynumber)
-    return (score, completed)
-
-
-def get_key_number():
+    return sumoku.board.as_board(tiles, False).score_play(newtiles,
+                                                            keynumber)
+
+
+def get_key_number(rng=random):
     """ Determine a random key number """
-    return random.randrange(3, 6)
+    return rng.randrange(3, 6)
 
 
 def generate_tiles():
@@ -172,8 +203,234 @@ def generate_tiles():
     return tiles
 
 
-def draw_tile(tiles):
+class Hand(object):
+    """ A hand of tiles (number, color), stored one packed byte per tile
+
+    A Hand behaves like a list of tiles. Reading it returns shared tuples
+    from HAND_TILES rather than building new ones.
+    """
+
+    __slots__ = ('packed',)
+    __hash__ = None
+
+    def __init__(self, tiles=()):
+        if isinstance(tiles, Hand):
+            self.packed = array.array('B', tiles.packed)
+        else:
+            self.packed = array.array('B', [pack_tile(tile)
+                                            for tile in tiles])
+
+    def __len__(self):
+        return len(self.packed)
+
+    def __iter__(self):
+        return itertools.imap(HAND_TILES.__getitem__, self.packed)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [HAND_TILES[value] for value in self.packed[index]]
+        return HAND_TILES[self.packed[index]]
+
+    def __setitem__(self, index, tile):
+        if isinstance(index, slice):
+            if isinstance(tile, Hand):
+                self.packed[index] = tile.packed
+            else:
+                self.packed[index] = array.array('B', [pack_tile(item)
+                                                       for item in tile])
+        else:
+            self.packed[index] = pack_tile(tile)
+
+    def __delitem__(self, index):
+        del self.packed[index]
+
+    def __eq__(self, other):
+        if isinstance(other, Hand):
+            return self.packed == other.packed
+        return list(self) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __repr__(self):
+        return 'Hand({!r})'.format(list(self))
+
+    def append(self, tile):
+        """ Add a tile to the hand """
+        self.packed.append(pack_tile(tile))
+
+    def sort(self):
+        """ Sort the hand like a list of tuples """
+        self.packed = array.array('B', sorted(
+            self.packed, key=HAND_TILES.__getitem__))
+
+    def copy(self):
+        """ Return a copy of the hand """
+        return Hand(self)
+
+
+# Color masks with each number of colors set
+MASKS_BY_SIZE = [[mask for mask in xrange(1 << 6)
+                  if bin(mask).count('1') == size] for size in xrange(7)]
+
+
+def tile_faces(tile):
+    """ Return a tile as drawn from the bag and the numbers it can show,
+    as ((number, color), [(number, color), ...]) """
+    if tile[0] in (6, 9):
+        return (6, tile[1]), [(6, tile[1]), (9, tile[1])]
+    return (tile[0], tile[1]), [(tile[0], tile[1])]
+
+
+class HandAnalyzer(object):
+    """ The combinations of tiles a hand can add to a line
+
+    Combinations hold tiles of distinct colors, as a line may not repeat
+    one. They are indexed by the residue of their sum modulo the key number
+    and by their color mask, and a 6 or 9 is counted both ways, so the
+    tiles which close a line are found without trying every permutation.
+    """
+
+    __slots__ = ('key_number', 'counts', 'table')
+
+    def __init__(self, hand, key_number):
+        """ Construct the analyzer of a hand for a key number """
+        self.key_number = key_number
+        self.counts = collections.Counter()
+        self.table = {}
+        for tile in hand:
+            self.add(tile)
+
+    def add(self, tile):
+        """ Update the analyzer for a tile added to the hand """
+        key, faces = tile_faces(tile)
+        self.counts[key] = self.counts[key] + 1
+        # A second copy of a tile can't join any combination the first
+        # copy can't, as they share a color
+        if self.counts[key] > 1:
+            return
+
+        bit = 1 << key[1]
+        additions = [((face[0] % self.key_number, bit), (face,))
+                     for face in faces]
+        for (residue, mask), combinations in self.table.iteritems():
+            if mask & bit:
+                continue
+            for face in faces:
+                entry = ((residue + face[0]) % self.key_number, mask | bit)
+                for combination in combinations:
+                    additions.append(
+                        (entry, tuple(sorted(combination + (face,)))))
+        for entry, combination in additions:
+            self.table.setdefault(entry, []).append(combination)
+
+    def remove(self, tile):
+        """ Update the analyzer for a tile taken from the hand """
+        key, faces = tile_faces(tile)
+        if self.counts[key] == 0:
+            raise InvalidPlayException('No {} in hand'
+                                       .format(tile_string(tile)))
+        self.counts[key] = self.counts[key] - 1
+        if self.counts[key] > 0:
+            return
+        del self.counts[key]
+
+        bit = 1 << key[1]
+        for entry in [entry for entry in self.table if entry[1] & bit]:
+            combinations = [combination
+                            for combination in self.table[entry]
+                            if not any(face in combination
+                                       for face in faces)]
+            if len(combinations) > 0:
+                self.table[entry] = combinations
+            else:
+                del self.table[entry]
+
+    def combinations(self, residue, size, exclude=0):
+        """ Return the combinations of size tiles whose sum leaves residue
+        modulo the key number, using none of the colors in mask exclude """
+        result = []
+        if size > 6:
+            return result
+        for mask in MASKS_BY_SIZE[size]:
+            if not mask & exclude:
+                result.extend(self.table.get((residue, mask), ()))
+        return result
+
+    def can_close(self, residue, size, exclude=0):
+        """ Return True if size tiles of colors not in exclude can add
+        residue modulo the key number to a line """
+        if size > 6:
+            return False
+        for mask in MASKS_BY_SIZE[size]:
+            if not mask & exclude and (residue, mask) in self.table:
+                return True
+        return False
+
+    def closing(self, total, size, exclude=0):
+        """ Return the combinations of size tiles which bring a line sum
+        total to a multiple of the key number """
+        return self.combinations(-total % self.key_number, size, exclude)
+
+
+class TileBag(object):
+    """ The tiles left to draw, shuffled once so that each draw is O(1)
+
+    The bag also counts how many of each (number, color) remain.
+    """
+
+    __slots__ = ('tiles', 'counts')
+
+    def __init__(self, tiles=None, rng=None):
+        """ Construct a bag of tiles, by default a full set, shuffled with
+        rng, a random.Random """
+        if tiles is None:
+            tiles = generate_tiles()
+        self.tiles = list(tiles)
+        (random if rng is None else rng).shuffle(self.tiles)
+        self.counts = collections.Counter(self.tiles)
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def __iter__(self):
+        return iter(self.tiles)
+
+    def count(self, tile):
+        """ Return how many of a tile (number, color) remain """
+        return self.counts[tile]
+
+    def draw(self):
+        """ Draw the next tile """
+        tile = self.tiles.pop()
+        self.counts[tile] = self.counts[tile] - 1
+        return tile
+
+    def put_back(self, tile):
+        """ Return the last tile drawn to the bag, to be drawn again next """
+        self.tiles.append(tile)
+        self.counts[tile] = self.counts[tile] + 1
+
+    def refill(self, tiles):
+        """ Replace the contents of the bag with tiles, drawn from the end """
+        self.tiles = list(tiles)
+        self.counts = collections.Counter(self.tiles)
+
+    def copy(self):
+        """ Return a copy of the bag, which will draw the same tiles """
+        clone = TileBag.__new__(TileBag)
+        clone.tiles = list(self.tiles)
+        clone.counts = collections.Counter(self.counts)
+        return clone
+
+
+def draw_tile(tiles, rng=random):
     """ Draw a random tile from the remaining ones """
-    tile = random.choice(tiles)
+    if isinstance(tiles, TileBag):
+        return tiles.draw()
+    tile = rng.choice(tiles)
     tiles.remove(tile)
     return tile
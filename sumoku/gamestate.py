@@ -1,76 +1,377 @@
 """ A class holding game state """
+import collections
+import struct
+import sumoku.board
 import sumoku.game
-import sys
+import sumoku.moves
+import sumoku.render
+import sumoku.zobrist
 
 
-def output_tile(tile, highlight):
-    """ Print a tile in color """
-    sys.stdout.write('\x1b[{};{}1m{}\x1b[0m'
-                     .format(31 + tile[1], '47;' if highlight else '',
-                             tile[0]))
+# What apply changed, for undo to put back. Only the hand of the player
+# moving changes, as the others are full or the bag is empty.
+UndoEntry = collections.namedtuple('UndoEntry', ['tiles', 'player', 'passes',
+                                                 'score', 'hand', 'drawn',
+                                                 'board', 'board_hash',
+                                                 'hand_hash'])
+
+
+# Fixed part of a packed position: players, hand size, key number, player,
+# passes, then the number of played and pending tiles
+PACKED_HEADER = struct.Struct('<7B')
 
 
 class GameState(object):
     """ A class holding sumoku game state """
 
-    def __init__(self, players, hand_size, key_number):
-        """ Construct the game state from initial parameters """
+    __slots__ = ('players', 'hand_size', 'key_number', 'drawn', 'undo_log',
+                 'tiles', 'hands', 'board_hash', 'hand_hashes', 'scores',
+                 'played_tiles', 'pending_tiles', 'board', 'pending',
+                 'player', 'passes', 'analyzers')
+
+    def __init__(self, players, hand_size, key_number, rng=None, order=None,
+                 bounds=None):
+        """ Construct the game state from initial parameters
+
+        The bag is shuffled with rng, a random.Random, so a game is
+        replayable from its seed. Alternatively order gives the tiles in
+        the bag, drawn from the end. The game is played within bounds, by
+        default those of the standard board, or sumoku.game.UNBOUNDED for
+        a board without edges.
+        """
         self.players = players
         self.hand_size = hand_size
         self.key_number = key_number
-        self.tiles = sumoku.game.generate_tiles()
-        self.hands = [[] for _ in xrange(players)]
+        self.drawn = None
+        self.undo_log = []
+        if order is None:
+            self.tiles = sumoku.game.TileBag(sumoku.game.generate_tiles(),
+                                             rng)
+        else:
+            self.tiles = sumoku.game.TileBag([])
+            self.tiles.refill(order)
+        self.hands = [sumoku.game.Hand() for _ in xrange(players)]
+        self.analyzers = [None] * players
+        self.board_hash = 0
+        self.hand_hashes = [0 for _ in xrange(players)]
         self.draw_tiles()
         self.scores = [0 for _ in xrange(players)]
         self.played_tiles = []
         self.pending_tiles = []
+        self.board = sumoku.board.Board(bounds=bounds)
+        self.pending = sumoku.board.Board(frontier=False)
         self.player = 0
+        self.passes = 0
 
     def draw_tiles(self):
         """ Draw tiles to fill up hands """
-        for hand in self.hands:
+        for player, hand in enumerate(self.hands):
             while len(hand) < self.hand_size and len(self.tiles) > 0:
-                hand.append(sumoku.game.draw_tile(self.tiles))
+                tile = self.tiles.draw()
+                if self.drawn is not None:
+                    self.drawn.append(tile)
+                hand.append(tile)
+                analyzer = self.analyzed(player)
+                if analyzer is not None:
+                    analyzer.add(tile)
+                self.hand_hashes[player] = (self.hand_hashes[player] +
+                                            sumoku.zobrist.hand_key(tile)) \
+                    & sumoku.zobrist.MASK
             hand.sort()
 
     def cur_hand(self):
         """ Return the hand of the current player """
         return self.hands[self.player]
 
+    def analyzed(self, player):
+        """ Return the HandAnalyzer kept for a player's hand, or None if
+        there is none or it was made for a hand since replaced """
+        analyzed = self.analyzers[player]
+        if analyzed is None or analyzed[0] is not self.hands[player]:
+            return None
+        return analyzed[1]
+
+    def analyzer(self):
+        """ Return a HandAnalyzer of the current player's hand
+
+        It is built the first time it is asked for, then kept up to date
+        as tiles are drawn, placed, taken back and undone.
+        """
+        analyzer = self.analyzed(self.player)
+        if analyzer is None:
+            hand = self.cur_hand()
+            analyzer = sumoku.game.HandAnalyzer(hand, self.key_number)
+            self.analyzers[self.player] = (hand, analyzer)
+        return analyzer
+
     def flip_tile(self, tile):
         """ Flip a tile between 6 and 9 """
         hand = self.cur_hand()
-        if hand[tile][0] == 6:
-            hand[tile] = (9, hand[tile][1])
-        elif hand[tile][0] == 9:
-            hand[tile] = (6, hand[tile][1])
+        number, color = hand[tile]
+        if number == 6:
+            hand[tile] = (9, color)
+        elif number == 9:
+            hand[tile] = (6, color)
 
     def place_tile(self, tile, col, row):
         """ Place a tile on the board """
+        if not self.board.bounds.contains(col, row):
+            raise sumoku.game.InvalidPlayException(
+                'Position {},{} is off the board'.format(col, row))
+        if self.board.get_tile(col, row) is not None:
+            raise sumoku.game.InvalidPlayException(
+                'Position {},{} is already occupied'.format(col, row))
         hand = self.cur_hand()
-        self.pending_tiles.append((hand[tile][0], hand[tile][1], col, row))
+        played = (hand[tile][0], hand[tile][1], col, row)
+        self.pending.add_tile(played)
+        self.pending_tiles.append(played)
         del hand[tile]
+        analyzer = self.analyzed(self.player)
+        if analyzer is not None:
+            analyzer.remove(played)
+        self.board_hash = self.board_hash ^ sumoku.zobrist.board_key(played)
+        self.hand_hashes[self.player] = (self.hand_hashes[self.player] -
+                                         sumoku.zobrist.hand_key(played)) \
+            & sumoku.zobrist.MASK
+
+    def stage_play(self, tiles):
+        """ Place played tiles (number, color, x, y) from the current hand,
+        flipping 6s and 9s as needed """
+        for tile in tiles:
+            hand = self.cur_hand()
+            flipped = sumoku.moves.flipped_number(tile[0])
+            for index, held in enumerate(hand):
+                if held[1] == tile[1] and held[0] in (tile[0], flipped):
+                    break
+            else:
+                raise sumoku.game.InvalidPlayException(
+                    'No {} in hand'.format(sumoku.game.tile_string(tile)))
+            if held[0] != tile[0]:
+                self.flip_tile(index)
+            self.place_tile(index, tile[2], tile[3])
 
     def remove_tile(self, col, row):
         """ Remove a tile from the board """
-        tile = sumoku.game.find_tile(col, row, self.pending_tiles)
+        tile = self.pending.find_tile(col, row)
+        self.pending.remove_tile(tile)
         self.pending_tiles.remove(tile)
         self.cur_hand().append((tile[0], tile[1]))
+        analyzer = self.analyzed(self.player)
+        if analyzer is not None:
+            analyzer.add(tile)
+        self.board_hash = self.board_hash ^ sumoku.zobrist.board_key(tile)
+        self.hand_hashes[self.player] = (self.hand_hashes[self.player] +
+                                         sumoku.zobrist.hand_key(tile)) \
+            & sumoku.zobrist.MASK
 
     def submit_play(self):
-        """ Submit a play """
+        """ Submit a play, returning its score and whether it completed a
+        line """
         score, complete_line = sumoku.game.score_play(self.pending_tiles,
-                                                      self.played_tiles,
+                                                      self.board,
                                                       self.key_number)
+        self.commit_play(score, complete_line)
+        return score, complete_line
+
+    def commit_play(self, score, complete_line):
+        """ Put the pending tiles on the board for a score already known,
+        and pass the turn on unless a line was completed """
         self.scores[self.player] = self.scores[self.player] + score
+        if len(self.pending_tiles) == 0:
+            self.passes = self.passes + 1
+        else:
+            self.passes = 0
+        for tile in self.pending_tiles:
+            self.board.add_tile(tile)
         self.played_tiles.extend(self.pending_tiles)
         self.pending_tiles = []
+        self.pending = sumoku.board.Board(frontier=False)
         if not complete_line or len(self.cur_hand()) == 0:
             self.player = (self.player + 1) % self.players
             self.draw_tiles()
 
+    def apply(self, move):
+        """ Play a Move from the current hand, or pass if it is None, so that
+        it can be taken back with undo """
+        if len(self.pending_tiles) != 0:
+            raise sumoku.game.InvalidPlayException('Tiles already placed')
+        entry = UndoEntry(() if move is None else tuple(move.tiles),
+                          self.player, self.passes, self.scores[self.player],
+                          sumoku.game.Hand(self.cur_hand()), [], self.board,
+                          self.board_hash, self.hand_hashes[self.player])
+        # The move is made on a copy of the board, sharing its indexes
+        # until it changes, and undo puts the original back
+        self.board = self.board.copy()
+        self.drawn = entry.drawn
+        try:
+            if move is not None:
+                self.stage_play(move.tiles)
+            self.submit_play()
+        except sumoku.game.InvalidPlayException:
+            analyzer = self.analyzed(entry.player)
+            if analyzer is not None:
+                for tile in self.pending_tiles:
+                    analyzer.add(tile)
+            self.hands[entry.player][:] = entry.hand
+            self.board = entry.board
+            self.pending_tiles = []
+            self.pending = sumoku.board.Board(frontier=False)
+            self.board_hash = entry.board_hash
+            self.hand_hashes[entry.player] = entry.hand_hash
+            raise
+        finally:
+            self.drawn = None
+        self.undo_log.append(entry)
+
+    def undo(self):
+        """ Take back the last move made with apply """
+        entry = self.undo_log.pop()
+        for tile in reversed(entry.drawn):
+            self.tiles.put_back(tile)
+        # The hand is refilled in place, so references to it stay valid
+        self.hands[entry.player][:] = entry.hand
+        analyzer = self.analyzed(entry.player)
+        if analyzer is not None:
+            for tile in entry.drawn:
+                analyzer.remove(tile)
+            for tile in entry.tiles:
+                analyzer.add(tile)
+        # Putting the board back is cheaper than removing the tiles, which
+        # would index every line they were in again
+        self.board = entry.board
+        if len(entry.tiles) > 0:
+            del self.played_tiles[-len(entry.tiles):]
+        self.player = entry.player
+        self.passes = entry.passes
+        self.scores[entry.player] = entry.score
+        self.board_hash = entry.board_hash
+        self.hand_hashes[entry.player] = entry.hand_hash
+
+    def snapshot(self):
+        """ Return a marker for the current position """
+        return len(self.undo_log)
+
+    def restore(self, snapshot):
+        """ Undo every move applied since a snapshot was taken """
+        while len(self.undo_log) > snapshot:
+            self.undo()
+
+    def copy(self):
+        """ Return an independent copy of the game state
+
+        Boards are shared until either copy changes them. The copy has no
+        moves to undo, and its bag will draw the same tiles as this one.
+        """
+        clone = GameState.__new__(GameState)
+        for name in GameState.__slots__:
+            setattr(clone, name, getattr(self, name))
+        clone.drawn = None
+        clone.undo_log = []
+        clone.tiles = self.tiles.copy()
+        clone.hands = [sumoku.game.Hand(hand) for hand in self.hands]
+        # Analyzers are built again if the copy needs them
+        clone.analyzers = [None] * self.players
+        clone.scores = list(self.scores)
+        clone.hand_hashes = list(self.hand_hashes)
+        clone.played_tiles = list(self.played_tiles)
+        clone.pending_tiles = list(self.pending_tiles)
+        clone.board = self.board.copy()
+        clone.pending = self.pending.copy()
+        return clone
+
+    def pack(self):
+        """ Return the position as a compact string of bytes
+
+        Played tiles take 4 bytes each, and tiles in hands and in the bag
+        one byte each. The undo log is not kept. Only games on the standard
+        board can be packed.
+        """
+        if self.board.bounds != sumoku.game.STANDARD_BOUNDS:
+            raise ValueError('Only games on the standard board can be packed')
+        pack = sumoku.game.pack_tile
+        parts = [PACKED_HEADER.pack(self.players, self.hand_size,
+                                    self.key_number, self.player,
+                                    self.passes, len(self.played_tiles),
+                                    len(self.pending_tiles)),
+                 struct.pack('<{}H'.format(self.players), *self.scores),
+                 struct.pack('<{}I'.format(len(self.played_tiles) +
+                                           len(self.pending_tiles)),
+                             *[pack(tile) for tile in
+                               self.played_tiles + self.pending_tiles])]
+        for hand in self.hands + [self.tiles]:
+            parts.append(chr(len(hand)))
+            parts.append(''.join(chr(pack(tile)) for tile in hand))
+        return ''.join(parts)
+
+    @staticmethod
+    def unpack(data):
+        """ Return the GameState packed into a string by pack """
+        state = GameState.__new__(GameState)
+        (state.players, state.hand_size, state.key_number, state.player,
+         state.passes, played, pending) = PACKED_HEADER.unpack_from(data)
+        offset = PACKED_HEADER.size
+        scores = struct.Struct('<{}H'.format(state.players))
+        state.scores = list(scores.unpack_from(data, offset))
+        offset = offset + scores.size
+        packed = struct.Struct('<{}I'.format(played + pending))
+        tiles = [sumoku.game.unpack_tile(value)
+                 for value in packed.unpack_from(data, offset)]
+        offset = offset + packed.size
+        state.played_tiles = tiles[:played]
+        state.pending_tiles = tiles[played:]
+        state.board = sumoku.board.Board(state.played_tiles)
+        state.pending = sumoku.board.Board(state.pending_tiles,
+                                           frontier=False)
+
+        groups = []
+        for _ in xrange(state.players + 1):
+            size = ord(data[offset])
+            groups.append([sumoku.game.HAND_TILES[ord(value)] for value in
+                           data[offset + 1:offset + 1 + size]])
+            offset = offset + 1 + size
+        state.hands = [sumoku.game.Hand(hand) for hand in groups[:-1]]
+        state.tiles = sumoku.game.TileBag([])
+        state.tiles.refill(groups[-1])
+        state.drawn = None
+        state.undo_log = []
+        state.rehash()
+        return state
+
+    def hash(self):
+        """ Return the 64 bit hash of the position the current player sees:
+        the tiles on the board, their hand, their turn and the key number """
+        return self.board_hash ^ \
+            sumoku.zobrist.mix(self.hand_hashes[self.player]) ^ \
+            sumoku.zobrist.player_key(self.player) ^ \
+            sumoku.zobrist.key_number_key(self.key_number)
+
+    def full_hash(self):
+        """ Return the 64 bit hash of the position including every hand """
+        value = self.hash()
+        for player, hand_hash in enumerate(self.hand_hashes):
+            if player != self.player:
+                value = value ^ sumoku.zobrist.mix(
+                    hand_hash ^ sumoku.zobrist.player_key(player))
+        return value
+
+    def rehash(self):
+        """ Recompute the hashes, and forget the hand analyzers, after the
+        board or hands were changed directly rather than through the
+        methods of this class """
+        self.analyzers = [None] * self.players
+        self.board_hash = sumoku.zobrist.board_hash(
+            list(self.board) + self.pending_tiles)
+        self.hand_hashes = [sumoku.zobrist.hand_hash(hand)
+                            for hand in self.hands]
+
     def game_complete(self):
         """ Return True if the game is complete """
+        # Nothing changes once every player has passed in turn
+        if self.passes >= self.players:
+            return True
+        # The last tiles placed still have to be submitted
+        if len(self.pending_tiles) != 0:
+            return False
         for hand in self.hands:
             if len(hand) != 0:
                 return False
@@ -78,38 +379,4 @@ class GameState(object):
 
     def print_game(self):
         """ Print the game state """
-        print '   abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
-        for row in xrange(sumoku.game.MIN_Y, sumoku.game.MAX_Y + 1):
-            sys.stdout.write('{:2} '.format(row + 1))
-            for col in xrange(sumoku.game.MIN_X, sumoku.game.MAX_X + 1):
-                try:
-                    tile = sumoku.game.find_tile(col, row, self.played_tiles)
-                    output_tile(tile, False)
-                except sumoku.game.InvalidPlayException:
-                    try:
-                        tile = sumoku.game.find_tile(col, row,
-                                                     self.pending_tiles)
-                        output_tile(tile, True)
-                    except sumoku.game.InvalidPlayException:
-                        sys.stdout.write('-')
-
-            if row == 0:
-                print ' Key number: {}'.format(self.key_number)
-            elif row == 1:
-                print ' Tiles remaining: {}'.format(len(self.tiles))
-            elif row == 3:
-                print ' Player Score Hand'
-            elif row == 4:
-                print '              12345678'
-            elif row - 5 >= 0 and row - 5 < self.players:
-                player = row - 5
-                sys.stdout.write(' ')
-                if player == self.player:
-                    sys.stdout.write('\x1b[47m')
-                sys.stdout.write('{:6} {:05} '
-                                 .format(player + 1, self.scores[player]))
-                for tile in self.hands[player]:
-                    output_tile(tile, player == self.player)
-                print
-            else:
-                print
+        sumoku.render.Renderer().draw(self)
@@ -0,0 +1,89 @@
+""" Hints for the player to move, from an anytime search
+
+A hint is searched with the endgame Solver, one turn deeper at a time, so
+that whenever its time runs out the best move of the deepest finished
+search is ready. A move is worth the margin of the player's score over
+the best of the others once the search ends: its own score plus what the
+turns after it are expected to bring.
+
+The tiles the player can't see are dealt out once, seeded by the position
+they see, so asking again gives the same hint. Only the WIDTH highest
+scoring plays are searched from each position, so that later turns can be
+looked at in the time a hint has.
+"""
+import random
+import threading
+import time
+import sumoku.endgame
+import sumoku.game
+import sumoku.mcts
+
+# Plays searched from each position
+WIDTH = 8
+
+
+def hint(state, seconds=None, nodes=None, cancel=None, progress=None,
+         width=WIDTH):
+    """ Search for the best move of the current player, returning an
+    endgame Result
+
+    The search stops after seconds, after more than nodes positions or
+    once the cancel event is set, though the first turn is always searched
+    in full. progress, if given, is called with the Result of each turn
+    deeper searched.
+    """
+    if len(state.pending_tiles) != 0:
+        raise sumoku.game.InvalidPlayException('Tiles already placed')
+
+    start = time.time()
+    deadline = None if seconds is None else start + seconds
+    dealt = sumoku.mcts.determinize(state, random.Random(state.hash()))
+    solver = sumoku.endgame.Solver(dealt, nodes, deadline, width=width,
+                                   cancel=cancel)
+    return sumoku.endgame.deepen(solver, start, progress)
+
+
+class HintSearch(object):
+    """ A hint searched in a background thread
+
+    The search runs on a copy of the state, which may be played on while
+    it runs. Call result to wait for it, or cancel to stop it early and
+    take the best move found so far.
+    """
+
+    def __init__(self, state, seconds=None, nodes=None, progress=None,
+                 width=WIDTH):
+        self.cancelled = threading.Event()
+        self.outcome = None
+        self.error = None
+        self.thread = threading.Thread(
+            target=self._run, args=(state.copy(), seconds, nodes, progress,
+                                    width))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self, state, seconds, nodes, progress, width):
+        """ Search, keeping the Result or the exception raised """
+        try:
+            self.outcome = hint(state, seconds, nodes, self.cancelled,
+                                progress, width)
+        except sumoku.game.InvalidPlayException, err:
+            self.error = err
+
+    def done(self):
+        """ Return True once the search has finished """
+        return not self.thread.is_alive()
+
+    def cancel(self):
+        """ Stop the search as soon as its first turn is searched """
+        self.cancelled.set()
+
+    def result(self, timeout=None):
+        """ Wait up to timeout seconds, or until the search finishes, and
+        return its Result, or None if it is still running """
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.outcome
@@ -0,0 +1,257 @@
+""" Opt-in timing of the hot paths of the rules engine
+
+Nothing is measured until enable is called. It replaces each function in
+HOT_PATHS with a wrapper counting its calls and adding the time each
+takes to a histogram, and disable puts the original functions back, so
+instrumentation costs nothing while it is off. Calls are timed
+inclusively, so a hot path calling another is charged for both.
+
+Histograms have BUCKETS_PER_OCTAVE buckets for each doubling of the time
+taken, so percentiles read from them are within a fraction of that of
+the true value, and Stats of several processes merge by adding them up.
+"""
+import contextlib
+import cProfile
+import functools
+import math
+import sys
+import time
+
+# Functions timed, as (module, attribute) with methods as Class.method
+HOT_PATHS = [
+    ('sumoku.game', 'score_play'),
+    ('sumoku.game', 'complete_line'),
+    ('sumoku.board', 'Board.score_play'),
+    ('sumoku.board', 'Board.complete_line'),
+    ('sumoku.gamestate', 'GameState.draw_tiles'),
+    ('sumoku.gamestate', 'GameState.submit_play'),
+    ('sumoku.render', 'Renderer.render'),
+]
+# Histogram buckets for each doubling of the time a call takes
+BUCKETS_PER_OCTAVE = 4
+# Seconds below which calls all fall into the first bucket
+RESOLUTION = 1e-7
+# Percentiles reported
+PERCENTILES = (50, 90, 99)
+
+# Stat of each hot path by name, kept across enable and disable
+STATS = {}
+# Original functions replaced while enabled, by name
+_ORIGINALS = {}
+
+
+def bucket(seconds):
+    """ Return the histogram bucket of a call taking seconds """
+    if seconds <= RESOLUTION:
+        return 0
+    mantissa, exponent = math.frexp(seconds / RESOLUTION)
+    return exponent * BUCKETS_PER_OCTAVE + \
+        int((mantissa * 2 - 1) * BUCKETS_PER_OCTAVE)
+
+
+def bucket_limit(index):
+    """ Return the longest time in seconds falling into a bucket """
+    exponent, part = divmod(index, BUCKETS_PER_OCTAVE)
+    return math.ldexp(1 + float(part + 1) / BUCKETS_PER_OCTAVE,
+                      exponent - 1) * RESOLUTION
+
+
+class Stat(object):
+    """ The calls made to a function and a histogram of their times """
+
+    __slots__ = ('calls', 'seconds', 'longest', 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.longest = 0.0
+        self.histogram = {}
+
+    def add(self, seconds):
+        """ Count a call taking seconds """
+        self.calls = self.calls + 1
+        self.seconds = self.seconds + seconds
+        if seconds > self.longest:
+            self.longest = seconds
+        index = bucket(seconds)
+        self.histogram[index] = self.histogram.get(index, 0) + 1
+
+    def merge(self, other):
+        """ Add the calls counted by another Stat into this one """
+        self.calls = self.calls + other.calls
+        self.seconds = self.seconds + other.seconds
+        self.longest = max(self.longest, other.longest)
+        for index, count in other.histogram.iteritems():
+            self.histogram[index] = self.histogram.get(index, 0) + count
+        return self
+
+    def clear(self):
+        """ Forget every call counted """
+        self.calls = 0
+        self.seconds = 0.0
+        self.longest = 0.0
+        self.histogram = {}
+
+    def percentile(self, point):
+        """ Return the time in seconds point percent of calls took at
+        most, or None if there were no calls """
+        if self.calls == 0:
+            return None
+        wanted = self.calls * point / 100.0
+        seen = 0
+        for index in sorted(self.histogram):
+            seen = seen + self.histogram[index]
+            if seen >= wanted:
+                return min(bucket_limit(index), self.longest)
+        return self.longest
+
+    def report(self):
+        """ Return the counts as a dict of plain values, times in
+        microseconds """
+        report = {'calls': self.calls, 'seconds': round(self.seconds, 6)}
+        if self.calls > 0:
+            report['mean_us'] = round(1e6 * self.seconds / self.calls, 2)
+            report['max_us'] = round(1e6 * self.longest, 2)
+            for point in PERCENTILES:
+                report['p{}_us'.format(point)] = \
+                    round(1e6 * self.percentile(point), 2)
+        return report
+
+    def __getstate__(self):
+        return (self.calls, self.seconds, self.longest, self.histogram)
+
+    def __setstate__(self, state):
+        self.calls, self.seconds, self.longest, self.histogram = state
+
+
+def _resolve(module_name, attribute):
+    """ Return the object holding a hot path and the name it has there """
+    owner = sys.modules.get(module_name)
+    if owner is None:
+        owner = __import__(module_name, fromlist=['__name__'])
+    path = attribute.split('.')
+    for name in path[:-1]:
+        owner = getattr(owner, name)
+    return owner, path[-1]
+
+
+def path_name(module_name, attribute):
+    """ Return the name a hot path's Stat is kept under """
+    return '{}.{}'.format(module_name.rpartition('.')[2], attribute)
+
+
+def _timed(function, stat):
+    """ Return a wrapper of function adding the time of each call to a
+    Stat """
+    timer = time.time
+
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        """ Time a call of the wrapped function """
+        start = timer()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stat.add(timer() - start)
+    return timed
+
+
+def enabled():
+    """ Return True if the hot paths are being timed """
+    return len(_ORIGINALS) > 0
+
+
+def enable():
+    """ Start timing the hot paths """
+    if enabled():
+        return
+    for module_name, attribute in HOT_PATHS:
+        owner, name = _resolve(module_name, attribute)
+        key = path_name(module_name, attribute)
+        # Take methods from the class dict, not as unbound methods
+        original = vars(owner)[name]
+        stat = STATS.setdefault(key, Stat())
+        _ORIGINALS[key] = (owner, name, original)
+        setattr(owner, name, _timed(original, stat))
+
+
+def disable():
+    """ Stop timing, putting back the original functions """
+    for owner, name, original in _ORIGINALS.itervalues():
+        setattr(owner, name, original)
+    _ORIGINALS.clear()
+
+
+def reset():
+    """ Forget every call counted so far """
+    for stat in STATS.itervalues():
+        stat.clear()
+
+
+def take():
+    """ Return copies of the Stats counted so far, forgetting them """
+    taken = dict((key, Stat().merge(stat))
+                 for key, stat in STATS.iteritems() if stat.calls > 0)
+    reset()
+    return taken
+
+
+def merge(stats):
+    """ Add Stats counted elsewhere, such as by another process, into
+    STATS """
+    for key, stat in stats.iteritems():
+        STATS.setdefault(key, Stat()).merge(stat)
+
+
+def init_worker(timing):
+    """ Start a worker process counting from zero, timing the hot paths if
+    timing is True, as its parent does """
+    reset()
+    if timing:
+        enable()
+
+
+def report():
+    """ Return the report of each hot path called, by name """
+    return dict((key, stat.report()) for key, stat in STATS.iteritems()
+                if stat.calls > 0)
+
+
+def summary_table():
+    """ Return the hot paths called as a table, slowest in total first """
+    columns = ['calls', 'seconds', 'mean_us'] + \
+        ['p{}_us'.format(point) for point in PERCENTILES] + ['max_us']
+    lines = ['{:32}'.format('function') +
+             ''.join('{:>11}'.format(column) for column in columns)]
+    reports = report()
+    for key in sorted(reports, key=lambda key: -reports[key]['seconds']):
+        lines.append('{:32}'.format(key) +
+                     ''.join('{:>11}'.format(reports[key][column])
+                             for column in columns))
+    return '\n'.join(lines) + '\n'
+
+
+@contextlib.contextmanager
+def profiling(path=None, stream=None):
+    """ Time the hot paths while the block runs
+
+    Afterwards the summary table is written to stream if one is given,
+    and if path is given the whole block is profiled with cProfile and
+    the profile dumped there, for pstats or other viewers to read.
+    """
+    was_enabled = enabled()
+    enable()
+    profiler = None
+    if path is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(path)
+        if not was_enabled:
+            disable()
+        if stream is not None:
+            stream.write(summary_table())
@@ -0,0 +1,128 @@
+""" Precomputed tables of the ways a line can be completed
+
+For each key number, a table maps the state of a line, its color mask and
+the residue of its sum modulo the key number, to a 64 bit set of
+completions. Bit c is set if adding one tile of each color in mask c can
+leave the line valid, so bit 0 says whether the line is valid as it is.
+Tables are built on first use and cached on disk.
+"""
+import os
+import struct
+import sumoku.board
+
+MAGIC = 'SLT1'
+NUMBERS = range(1, 10)
+MASKS = 1 << 6
+
+_TABLES = {}
+
+
+def cache_dir():
+    """ Return the directory tables are cached in """
+    return os.environ.get('SUMOKU_CACHE',
+                          os.path.join(os.path.expanduser('~'), '.cache',
+                                       'sumoku'))
+
+
+def build_entries(key_number):
+    """ Return the completions of every line state, indexed by
+    mask * key_number + residue """
+    # Residues the numbers on tiles of the colors in a mask can add up to
+    reachable = [1 << 0]
+    for mask in xrange(1, MASKS):
+        rest = reachable[mask & (mask - 1)]
+        residues = 0
+        for residue in xrange(key_number):
+            if rest & (1 << residue):
+                for number in NUMBERS:
+                    residues = residues | (1 << ((residue + number) %
+                                                 key_number))
+        reachable.append(residues)
+
+    entries = []
+    for mask in xrange(MASKS):
+        for residue in xrange(key_number):
+            completions = 0
+            for added in xrange(MASKS):
+                if added & mask:
+                    continue
+                if bin(mask | added).count('1') < 2 or \
+                        reachable[added] & (1 << (-residue % key_number)):
+                    completions = completions | (1 << added)
+            entries.append(completions)
+    return entries
+
+
+class LineTable(object):
+    """ The completions of every line for a key number """
+
+    __slots__ = ('key_number', 'entries')
+
+    def __init__(self, key_number, entries=None):
+        self.key_number = key_number
+        if entries is None:
+            entries = build_entries(key_number)
+        self.entries = entries
+
+    def completions(self, mask, residue):
+        """ Return the set of completions of a line as a 64 bit int """
+        if mask & sumoku.board.REPEATED_COLOR:
+            return 0
+        return self.entries[mask * self.key_number + residue]
+
+    def is_valid(self, mask, residue):
+        """ Return True if a line is valid as it stands """
+        return self.completions(mask, residue) & 1 == 1
+
+    def can_extend(self, mask, residue, exclude=0):
+        """ Return True if tiles of colors not in exclude can be added to a
+        line to leave it valid """
+        return self.completions(mask, residue) & DISJOINT[exclude] > 1
+
+    def save(self, path):
+        """ Write the table to a file """
+        with open(path, 'wb') as output:
+            output.write(MAGIC + chr(self.key_number))
+            output.write(struct.pack('<{}Q'.format(len(self.entries)),
+                                     *self.entries))
+
+    @staticmethod
+    def load(path, key_number):
+        """ Read the table for a key number from a file, or return None if
+        it isn't a valid table """
+        count = MASKS * key_number
+        try:
+            with open(path, 'rb') as data:
+                header = data.read(len(MAGIC) + 1)
+                body = data.read()
+        except IOError:
+            return None
+        if header != MAGIC + chr(key_number) or len(body) != 8 * count:
+            return None
+        return LineTable(key_number,
+                         list(struct.unpack('<{}Q'.format(count), body)))
+
+
+# Completions using none of the colors in each mask
+DISJOINT = [sum(1 << added for added in xrange(MASKS) if not added & mask)
+            for mask in xrange(MASKS)]
+
+
+def line_table(key_number):
+    """ Return the table for a key number, loading or building it the
+    first time it is needed """
+    table = _TABLES.get(key_number)
+    if table is not None:
+        return table
+    path = os.path.join(cache_dir(), 'lines{}.bin'.format(key_number))
+    table = LineTable.load(path, key_number)
+    if table is None:
+        table = LineTable(key_number)
+        try:
+            if not os.path.isdir(cache_dir()):
+                os.makedirs(cache_dir())
+            table.save(path)
+        except (IOError, OSError):
+            pass
+    _TABLES[key_number] = table
+    return table
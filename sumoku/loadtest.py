@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+""" A load test client for the sumoku game server
+
+Each simulated client plays whole games against itself, holding every
+seat. It mirrors the game locally from the seed it starts it with, so it
+knows the tiles in hand, and plays the first legal move it finds.
+"""
+import argparse
+import asynchat
+import asyncore
+import json
+import random
+import socket
+import time
+import sumoku.gamestate
+import sumoku.moves
+import sumoku.record
+import sumoku.sumokucli
+
+
+def turn_commands(state, move):
+    """ Return the commands making a move, applying them to state """
+    return [sumoku.sumokucli.format_command(event)
+            for event in sumoku.record.move_events(state, move)]
+
+
+class Client(asynchat.async_chat):
+    """ A connection playing games one after another """
+
+    def __init__(self, address, seeds, results, socket_map,
+                 players=2, key_number=3):
+        asynchat.async_chat.__init__(self, map=socket_map)
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.connect(address)
+        self.set_terminator('\n')
+        self.seeds = seeds
+        self.results = results
+        self.players = players
+        self.key_number = key_number
+        self.incoming = []
+        self.state = None
+        self.waiting = 0
+        self.sent = 0
+
+    def handle_connect(self):
+        self.new_game()
+
+    def new_game(self):
+        """ Start the next game """
+        seed = self.seeds.getrandbits(32)
+        self.state = sumoku.gamestate.GameState(
+            self.players, 8, self.key_number, random.Random(seed))
+        self.send_commands(['new {} {} 8 {}'.format(
+            self.players, self.key_number, seed)])
+
+    def send_commands(self, commands):
+        """ Send commands and wait for all their replies """
+        self.waiting = len(commands)
+        self.sent = time.time()
+        self.push(''.join(command + '\n' for command in commands))
+        self.results['commands'] = self.results['commands'] + len(commands)
+        self.results['batches'] = self.results['batches'] + 1
+        if commands[-1] == 'submit':
+            self.results['turns'] = self.results['turns'] + 1
+
+    def collect_incoming_data(self, data):
+        self.incoming.append(data)
+
+    def found_terminator(self):
+        line = ''.join(self.incoming)
+        self.incoming = []
+        if not line.startswith('ok'):
+            self.results['errors'] = self.results['errors'] + 1
+        self.waiting = self.waiting - 1
+        if self.waiting > 0:
+            return
+        self.results['latency'] = self.results['latency'] + \
+            time.time() - self.sent
+        if self.state.game_complete():
+            self.results['games'] = self.results['games'] + 1
+            self.new_game()
+            return
+        move = next(iter(sumoku.moves.generate_moves(
+            self.state.board, self.state.cur_hand(), self.state.key_number,
+            analyzer=self.state.analyzer())), None)
+        self.send_commands(turn_commands(self.state, move))
+
+    def handle_close(self):
+        self.close()
+
+
+def load_test(address, clients, duration, seed=None, players=2):
+    """ Run clients against a server for duration seconds and return
+    their counters """
+    socket_map = {}
+    results = {'commands': 0, 'batches': 0, 'turns': 0, 'games': 0,
+               'errors': 0, 'latency': 0.0}
+    seeds = random.Random(seed)
+    connections = [Client(address, seeds, results, socket_map, players)
+                   for _ in xrange(clients)]
+    start = time.time()
+    while time.time() - start < duration:
+        asyncore.loop(timeout=0.1, use_poll=True, map=socket_map, count=1)
+    elapsed = time.time() - start
+    for connection in connections:
+        connection.close()
+
+    batches = max(results['batches'], 1)
+    return {'clients': clients, 'seconds': round(elapsed, 2),
+            'commands': results['commands'], 'turns': results['turns'],
+            'games': results['games'], 'errors': results['errors'],
+            'commands_per_sec': round(results['commands'] / elapsed, 1),
+            'turns_per_sec': round(results['turns'] / elapsed, 1),
+            'mean_latency_ms': round(1000 * results['latency'] / batches, 2)}
+
+
+def parse_args():
+    """ Parse command line arguments """
+    parser = argparse.ArgumentParser(description='Load test a sumoku server')
+    parser.add_argument('--host', default='localhost',
+                        help='server address')
+    parser.add_argument('--port', default=7664, type=int,
+                        help='server port')
+    parser.add_argument('--clients', default=100, type=int,
+                        help='number of concurrent connections')
+    parser.add_argument('--duration', default=10.0, type=float,
+                        help='seconds to run for')
+    parser.add_argument('--seed', default=None, type=int,
+                        help='seed for the games played')
+    return parser.parse_args()
+
+
+def main():
+    """ Run a load test and print its results as JSON """
+    args = parse_args()
+    print json.dumps(load_test((args.host, args.port), args.clients,
+                               args.duration, args.seed),
+                     indent=2, sort_keys=True)
+
+if __name__ == "__main__":
+    main()
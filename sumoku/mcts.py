@@ -0,0 +1,318 @@
+""" A Monte Carlo tree search computer player """
+import collections
+import heapq
+import itertools
+import math
+import multiprocessing
+import random
+import time
+import sumoku.endgame
+import sumoku.game
+import sumoku.moves
+import sumoku.zobrist
+
+# Search parameters
+EXPLORATION = 0.7
+TOP_MOVES = 16
+ROLLOUT_DEPTH = 4
+ROLLOUT_SAMPLE = 48
+MARGIN_SCALE = 60.0
+TABLE_SIZE = 1 << 12
+# Positions the endgame solver may search for a move when there's no time
+# limit
+ENDGAME_NODES = 2000
+
+
+class Node(object):
+    """ A node of the search tree, reached by a move of player """
+
+    __slots__ = ('move', 'player', 'children', 'visits', 'reward',
+                 'available')
+
+    def __init__(self, move, player):
+        self.move = move
+        self.player = player
+        self.children = {}
+        self.visits = 0
+        self.reward = 0.0
+        self.available = 0
+
+
+def move_key(move):
+    """ Return the key identifying a move, None for a pass """
+    if move is None:
+        return None
+    return move.tiles
+
+
+def tile_kind(tile):
+    """ Return a tile as drawn from the bag, with any 9 turned back to 6 """
+    if tile[0] == 9:
+        return (6, tile[1])
+    return (tile[0], tile[1])
+
+
+def unseen_tiles(state):
+    """ Return the tiles hidden from the current player, which are in the
+    other players' hands or still in the bag """
+    counts = collections.Counter(tile_kind(tile)
+                                 for tile in sumoku.game.generate_tiles())
+    seen = itertools.chain(state.played_tiles, state.pending_tiles,
+                           state.cur_hand())
+    for tile in seen:
+        counts[tile_kind(tile)] = counts[tile_kind(tile)] - 1
+    return sorted(counts.elements())
+
+
+def deal(state, hidden, rng):
+    """ Deal hidden tiles at random into the other players' hands and the
+    bag of state, in place """
+    hidden = list(hidden)
+    rng.shuffle(hidden)
+    for player, hand in enumerate(state.hands):
+        if player == state.player:
+            continue
+        size = len(hand)
+        hand[:] = sorted(hidden[:size])
+        hidden = hidden[size:]
+    state.tiles.refill(hidden)
+    state.rehash()
+
+
+def determinize(state, rng):
+    """ Return a copy of state with the hidden tiles dealt out at random """
+    clone = state.copy()
+    deal(clone, unseen_tiles(state), rng)
+    return clone
+
+
+def candidate_moves(state, limit, table=None):
+    """ Return the highest scoring legal moves, or a pass if there are none
+
+    If a TranspositionTable is given the moves are looked up in it, keyed
+    so as not to clash with the full move lists of moves.state_moves.
+    """
+    if table is not None:
+        key = state.hash() ^ sumoku.zobrist.mix(limit)
+        entry = table.get(key)
+        if entry is not None:
+            return entry[1]
+    moves = heapq.nlargest(limit, sumoku.moves.generate_moves(
+        state.board, state.cur_hand(), state.key_number,
+        analyzer=state.analyzer()),
+        key=lambda move: (move.score, len(move.tiles)))
+    if len(moves) == 0:
+        moves = [None]
+    if table is not None:
+        table.put(key, moves)
+    return moves
+
+
+def rollout(state, rng, depth, sample):
+    """ Play on for a few turns, each time taking the best of a sample of
+    the legal moves """
+    for _ in xrange(depth):
+        if state.game_complete():
+            break
+        moves = list(itertools.islice(sumoku.moves.generate_moves(
+            state.board, state.cur_hand(), state.key_number,
+            analyzer=state.analyzer()), sample))
+        best = None
+        if len(moves) > 0:
+            rng.shuffle(moves)
+            best = max(moves, key=lambda move: move.score)
+        state.apply(best)
+
+
+def evaluate(state):
+    """ Return the reward of each player for a position """
+    rewards = []
+    for player, score in enumerate(state.scores):
+        margin = score - max(other for index, other in enumerate(state.scores)
+                             if index != player)
+        if state.game_complete():
+            rewards.append(1.0 if margin > 0 else 0.5 if margin == 0 else 0.0)
+        else:
+            rewards.append(0.5 + 0.5 * math.tanh(margin / MARGIN_SCALE))
+    return rewards
+
+
+def select(node, moves, exploration):
+    """ Return the move and child maximizing the UCB1 bound """
+    best = None
+    best_value = None
+    for move in moves:
+        child = node.children[move_key(move)]
+        value = child.reward / child.visits + exploration * \
+            math.sqrt(math.log(child.available) / child.visits)
+        if best_value is None or value > best_value:
+            best = (move, child)
+            best_value = value
+    return best
+
+
+def search(state, rng, iterations=None, deadline=None, table=None,
+           exploration=EXPLORATION, top_moves=TOP_MOVES,
+           rollout_depth=ROLLOUT_DEPTH, rollout_sample=ROLLOUT_SAMPLE):
+    """ Run an information set search from the current player's view of
+    state until the iterations run out or the deadline passes
+
+    Each iteration deals the hidden tiles out at random, descends the tree
+    through moves legal in that deal, expands one node and scores a short
+    rollout. The moves are made on a single copy of state and undone again
+    after each iteration. Candidate moves are cached in table, a
+    TranspositionTable, so positions met again in later deals are not
+    generated twice. Returns the root Node.
+    """
+    if table is None:
+        table = sumoku.zobrist.TranspositionTable(TABLE_SIZE)
+    root = Node(None, None)
+    hidden = unseen_tiles(state)
+    current = state.copy()
+    start = current.snapshot()
+    count = 0
+    while (iterations is None or count < iterations) and \
+            (deadline is None or time.time() < deadline):
+        count = count + 1
+        deal(current, hidden, rng)
+        node = root
+        path = [root]
+        while not current.game_complete():
+            moves = candidate_moves(current, top_moves, table)
+            unexplored = []
+            for move in moves:
+                child = node.children.get(move_key(move))
+                if child is None:
+                    unexplored.append(move)
+                else:
+                    child.available = child.available + 1
+            if len(unexplored) > 0:
+                move = rng.choice(unexplored)
+                child = Node(move, current.player)
+                child.available = 1
+                node.children[move_key(move)] = child
+                current.apply(move)
+                path.append(child)
+                break
+            move, node = select(node, moves, exploration)
+            current.apply(move)
+            path.append(node)
+
+        rollout(current, rng, rollout_depth, rollout_sample)
+        rewards = evaluate(current)
+        current.restore(start)
+        for node in path:
+            node.visits = node.visits + 1
+            if node.player is not None:
+                node.reward = node.reward + rewards[node.player]
+    return root
+
+
+def root_statistics(root):
+    """ Return {move key: [move, visits, reward]} for the root's children """
+    return dict((key, [child.move, child.visits, child.reward])
+                for key, child in root.children.iteritems())
+
+
+def merge_statistics(results):
+    """ Sum the root statistics of several searches """
+    merged = {}
+    for statistics in results:
+        for key, (move, visits, reward) in statistics.iteritems():
+            if key in merged:
+                merged[key][1] = merged[key][1] + visits
+                merged[key][2] = merged[key][2] + reward
+            else:
+                merged[key] = [move, visits, reward]
+    return merged
+
+
+def _search_task(task):
+    """ Search from a tuple (state, seed, iterations, deadline, params) in
+    a worker process and return the root statistics """
+    state, seed, iterations, deadline, params = task
+    root = search(state, random.Random(seed), iterations, deadline,
+                  **params)
+    return root_statistics(root)
+
+
+class MCTSAgent(object):
+    """ An agent choosing moves by Monte Carlo tree search
+
+    Each move is searched for time_limit seconds or a number of iterations
+    per worker. With several workers, independent searches run in a pool
+    of processes and their root visit counts are merged.
+
+    Once the bag is empty, if endgame is True, the endgame solver is given
+    half the time first, and its move is played if it solves the game.
+    Given an opening book, a sumoku.book.OpeningBook, the agent plays the
+    book's move without searching whenever the book has one.
+    """
+
+    def __init__(self, time_limit=1.0, iterations=None, workers=1,
+                 seed=None, endgame=True, book=None, **params):
+        self.time_limit = time_limit
+        self.iterations = iterations
+        self.workers = workers
+        self.rng = random.Random(seed)
+        self.endgame = endgame
+        self.book = book
+        self.params = params
+        self.pool = None
+        self.table = sumoku.zobrist.TranspositionTable(TABLE_SIZE)
+        self.endgame_table = None
+
+    def __call__(self, state, rng=None):
+        """ Return the Move to play, or None to pass """
+        if self.book is not None:
+            move = self.book.move(state)
+            if move is not None:
+                return move
+        moves = candidate_moves(state, 2)
+        if len(moves) == 1:
+            return moves[0]
+
+        deadline = None
+        if self.time_limit is not None:
+            deadline = time.time() + self.time_limit
+        if self.endgame and len(state.tiles) == 0:
+            if self.endgame_table is None:
+                self.endgame_table = sumoku.zobrist.TranspositionTable(
+                    sumoku.endgame.TABLE_SIZE)
+            if self.time_limit is None:
+                result = sumoku.endgame.solve(state, nodes=ENDGAME_NODES,
+                                              table=self.endgame_table)
+            else:
+                result = sumoku.endgame.solve(state,
+                                              seconds=self.time_limit / 2,
+                                              table=self.endgame_table)
+            if result.solved:
+                return result.move
+        if self.workers == 1:
+            statistics = root_statistics(search(state, self.rng,
+                                                self.iterations, deadline,
+                                                self.table, **self.params))
+        else:
+            if self.pool is None:
+                self.pool = multiprocessing.Pool(self.workers)
+            portable = state.copy()
+            tasks = [(portable, self.rng.getrandbits(64), self.iterations,
+                      deadline, self.params) for _ in xrange(self.workers)]
+            statistics = merge_statistics(self.pool.map(_search_task, tasks))
+
+        if len(statistics) == 0:
+            return moves[0]
+        return max(statistics.itervalues(),
+                   key=lambda entry: (entry[1], entry[2]))[0]
+
+    def close(self):
+        """ Shut down any worker processes """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+def mcts_agent(state, rng):
+    """ A self-play agent searching 100 iterations per move """
+    return MCTSAgent(None, 100, seed=rng.getrandbits(64))(state)
@@ -0,0 +1,296 @@
+""" Generation of every legal play for a hand """
+import collections
+import sumoku.board
+import sumoku.game
+import sumoku.lines
+
+# Longest possible line, one tile of each color
+MAX_LINE = 6
+
+Move = collections.namedtuple('Move', ['tiles', 'score', 'completed'])
+
+
+def flipped_number(number):
+    """ Return the number a tile shows when flipped, or None """
+    if number == 6:
+        return 9
+    if number == 9:
+        return 6
+    return None
+
+
+def hand_options(hand):
+    """ Return the distinct tiles in a hand with their counts
+
+    Each entry is (key, [(number, color), ...]) where key identifies the
+    physical tile and the list holds every way it can be played, so a 6
+    may also be played as a 9 and the reverse.
+    """
+    counts = collections.defaultdict(int)
+    for tile in hand:
+        number = tile[0]
+        if number == 9:
+            number = 6
+        counts[(number, tile[1])] = counts[(number, tile[1])] + 1
+
+    options = []
+    for key in sorted(counts):
+        faces = [key]
+        flipped = flipped_number(key[0])
+        if flipped is not None:
+            faces.append((flipped, key[1]))
+        options.append((key, faces))
+    return options, counts
+
+
+# Number of colors in each color mask
+COLOR_COUNTS = [bin(mask).count('1')
+                for mask in xrange(sumoku.board.COLOR_BITS + 1)]
+
+
+def generate_moves(board, hand, key_number, origin=None, analyzer=None):
+    """ Yield every legal play of tiles from hand as a Move
+
+    Plays must touch the tiles already on the board. On an empty board
+    the opening plays are generated through origin, which defaults to the
+    middle of the board's bounds. Each distinct play is yielded once, with its
+    tiles sorted like score_play sorts them. A HandAnalyzer kept up to date
+    with the hand, such as GameState.analyzer, may be given to save
+    building one.
+    """
+    board = sumoku.board.as_board(board)
+    options, counts = hand_options(hand)
+    if len(options) == 0:
+        return
+    if analyzer is None and len(hand) > 1:
+        analyzer = sumoku.game.HandAnalyzer(hand, key_number)
+
+    if len(board) == 0:
+        if origin is None:
+            origin = board.bounds.middle()
+        for move in _opening_moves(options, counts, key_number, origin,
+                                   board.bounds, analyzer):
+            yield move
+        return
+
+    for move in _single_moves(board, options, key_number):
+        yield move
+    if len(hand) < 2:
+        return
+    for row in (True, False):
+        for span in _spans(board, row, len(hand), analyzer):
+            for move in _fill(span, options, counts, key_number):
+                yield move
+
+
+def state_moves(state, table=None):
+    """ Return a list of the legal plays for the current player of a game
+    state, looking them up in a TranspositionTable if one is given """
+    if table is not None:
+        key = state.hash()
+        entry = table.get(key)
+        if entry is not None:
+            return entry[1]
+    moves = list(generate_moves(state.board, state.cur_hand(),
+                                state.key_number,
+                                analyzer=state.analyzer()))
+    if table is not None:
+        table.put(key, moves)
+    return moves
+
+
+def _opening_moves(options, counts, key_number, origin, bounds, analyzer):
+    """ Yield the plays possible on an empty board through origin, within
+    the Bounds of the board """
+    x, y = origin
+    for _, faces in options:
+        for number, color in faces:
+            if number % key_number == 0:
+                yield Move(((number, color, x, y),), number, False)
+
+    hand_size = sum(counts.itervalues())
+    for row in (True, False):
+        pos = x if row else y
+        low, high = bounds.limits(row)
+        for length in xrange(2, min(MAX_LINE, hand_size) + 1):
+            if not analyzer.can_close(0, length):
+                continue
+            for start in xrange(max(low, pos - length + 1),
+                                min(pos, high - length + 1) + 1):
+                if row:
+                    cells = [(cell, y) for cell in
+                             xrange(start, start + length)]
+                else:
+                    cells = [(x, cell) for cell in
+                             xrange(start, start + length)]
+                span = (cells, 0, 0, length, [(0, 0, 0)] * length)
+                for move in _fill(span, options, counts, key_number):
+                    yield move
+
+
+def _single_moves(board, options, key_number):
+    """ Yield the plays of a single tile next to tiles on the board """
+    table = sumoku.lines.line_table(key_number)
+    frontier = board.frontier
+    for x, y in sorted(frontier):
+        lines = frontier[(x, y)]
+        # Skip cells where a line can't be extended by any tile
+        if not all(table.can_extend(mask, total % key_number)
+                   for total, mask, length in lines if length > 0):
+            continue
+        for _, faces in options:
+            for number, color in faces:
+                bit = (1 << color) | sumoku.board.REPEATED_COLOR
+                score = 0
+                completed = False
+                for total, mask, length in lines:
+                    if length == 0:
+                        continue
+                    if mask & bit or (total + number) % key_number:
+                        break
+                    score = score + total + number
+                    completed = completed or length + 1 == MAX_LINE
+                else:
+                    yield Move(((number, color, x, y),), score, completed)
+
+
+def _spans(board, row, hand_size, analyzer):
+    """ Yield the stretches of a row or column which a play of two or more
+    new tiles could fill to form a complete line, skipping those the
+    HandAnalyzer finds no tiles to close
+
+    Each span is (empty cells, total, mask, length, cross lines) where
+    total, mask and length describe the whole line before the new tiles
+    are added, and cross lines hold (total, mask, length) of what each
+    empty cell joins on the other axis.
+    """
+    cells = board.cells
+    frontier = board.frontier
+    # The frontier lines a cell joins are indexed (row, column)
+    cross = 1 if row else 0
+    low, high = board.bounds.limits(row)
+
+    # Only stretches near a tile in or beside the line can connect, so
+    # index the positions of tiles and of cells touching a tile across it
+    near = {}
+    for x, y in cells:
+        near.setdefault(y if row else x, []).append(x if row else y)
+    for (x, y), lines in frontier.iteritems():
+        if lines[cross][2] > 0:
+            near.setdefault(y if row else x, []).append(x if row else y)
+
+    for line in sorted(near):
+        def cell(pos, line=line):
+            """ Return the board position pos along the line """
+            return (pos, line) if row else (line, pos)
+
+        first = max(low, min(near[line]) - MAX_LINE + 1)
+        last = min(high, max(near[line]) + MAX_LINE - 1)
+        for start in xrange(first, last + 1):
+            if start > low and cell(start - 1) in cells:
+                continue
+            empties = []
+            total = 0
+            mask = 0
+            connected = False
+            for end in xrange(start, min(high, start + MAX_LINE - 1) + 1):
+                tile = cells.get(cell(end))
+                if tile is None:
+                    empties.append(cell(end))
+                    if len(empties) > hand_size:
+                        break
+                    lines = frontier.get(cell(end))
+                    connected = connected or \
+                        (lines is not None and lines[cross][2] > 0)
+                else:
+                    total = total + tile[0]
+                    mask = sumoku.board.merge_masks(mask, 1 << tile[1])
+                    connected = True
+                if len(empties) < 2 or not connected:
+                    continue
+                if end < high and cell(end + 1) in cells:
+                    continue
+                if mask & sumoku.board.REPEATED_COLOR:
+                    break
+                if not analyzer.can_close(-total % analyzer.key_number,
+                                          len(empties), mask):
+                    continue
+                crosses = [frontier.get(pos, sumoku.board.NO_LINES)[cross]
+                           for pos in empties]
+                yield (list(empties), total, mask, end - start + 1, crosses)
+
+
+def _fill(span, options, counts, key_number):
+    """ Return the plays which fill every empty cell of a span
+
+    The tiles each cell can take without breaking its cross line are found
+    first, then tiles are assigned one cell at a time, pruning as soon as a
+    color repeats, too few colors remain to fill the span or the last tile
+    can't bring the line sum to a multiple of the key number.
+    """
+    empties, total, mask, length, crosses = span
+    remaining = dict(counts)
+    hand_colors = 0
+    for key in counts:
+        hand_colors = hand_colors | (1 << key[1])
+
+    candidates = []
+    for (x, y), (cross_total, cross_mask, cross_length) in zip(empties,
+                                                                crosses):
+        cell = []
+        for key, faces in options:
+            bit = 1 << key[1]
+            if cross_mask & (bit | sumoku.board.REPEATED_COLOR):
+                continue
+            for number, color in faces:
+                if cross_length == 0:
+                    cell.append((key, bit, (number, color, x, y), 0, False))
+                elif (cross_total + number) % key_number == 0:
+                    cell.append((key, bit, (number, color, x, y),
+                                 cross_total + number,
+                                 cross_length + 1 == MAX_LINE))
+        if len(cell) == 0:
+            return []
+        candidates.append(cell)
+
+    # Colors able to close the line in the last cell, by residue
+    closing = [0] * key_number
+    for _, bit, tile, _, _ in candidates[-1]:
+        closing[tile[0] % key_number] = closing[tile[0] % key_number] | bit
+
+    moves = []
+    placed = []
+    last = len(empties) - 1
+    completed_line = length == MAX_LINE
+
+    def fill(index, total, mask, score, completed):
+        """ Assign a tile to the empty cell at index """
+        # Every remaining cell needs a color not yet in the line
+        if COLOR_COUNTS[hand_colors & ~mask & sumoku.board.COLOR_BITS] < \
+                last + 1 - index:
+            return
+        for key, bit, tile, cross_score, cross_completed in \
+                candidates[index]:
+            if mask & bit or remaining[key] == 0:
+                continue
+            if index == last:
+                if (total + tile[0]) % key_number == 0:
+                    placed.append(tile)
+                    moves.append(Move(tuple(sorted(placed)),
+                                      score + cross_score + total + tile[0],
+                                      completed or cross_completed or
+                                      completed_line))
+                    placed.pop()
+                continue
+            if index == last - 1 and not closing[
+                    -(total + tile[0]) % key_number] & ~(mask | bit):
+                continue
+            remaining[key] = remaining[key] - 1
+            placed.append(tile)
+            fill(index + 1, total + tile[0], mask | bit, score + cross_score,
+                 completed or cross_completed)
+            placed.pop()
+            remaining[key] = remaining[key] + 1
+
+    fill(0, total, mask, 0, False)
+    return moves
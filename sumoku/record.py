@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+""" Append-only records of played games, and their replay
+
+A record is a stream of events. A game starts with a GameHeader holding
+everything needed to rebuild its bag, followed by the moves made:
+
+    ('place', tile, col, row)   Place the tile at an index of the hand
+    ('flip', tile)              Flip the tile at an index of the hand
+    ('remove', col, row)        Take a placed tile back into the hand
+    ('submit', score, line)     Submit the play, scoring score and
+                                completing a line if line is True
+
+In the binary format each event is a frame, a length byte followed by a
+type byte and the fields. The JSON lines format holds one event per line.
+"""
+import argparse
+import collections
+import json
+import struct
+import time
+import sumoku.game
+import sumoku.gamestate
+import sumoku.moves
+
+VERSION = 2
+# Seeds are stored in 64 bits
+SEED_LIMIT = 1 << 64
+
+GameHeader = collections.namedtuple('GameHeader', ['players', 'hand_size',
+                                                   'key_number', 'seed',
+                                                   'order'])
+
+# Frame layouts after the type byte. A header holds the version, players,
+# hand size, key number, whether there is a seed, and the seed.
+HEADER_FIELDS = struct.Struct('<BBBB?Q')
+# Headers of version 1 records, which stored a missing seed as -1
+HEADER_FIELDS_V1 = struct.Struct('<BBBBq')
+FIELDS = {
+    'place': struct.Struct('<BBB'),
+    'flip': struct.Struct('<B'),
+    'remove': struct.Struct('<BB'),
+    'submit': struct.Struct('<HB'),
+}
+JSON_FIELDS = {'place': ['tile', 'col', 'row'], 'flip': ['tile'],
+               'remove': ['col', 'row'], 'submit': ['score', 'line']}
+TYPES = {'game': 'G', 'place': 'P', 'flip': 'F', 'remove': 'R',
+         'submit': 'S'}
+NAMES = dict((code, name) for name, code in TYPES.iteritems())
+
+# Bytes read from a record at a time
+CHUNK_SIZE = 1 << 16
+
+
+def shuffled_tiles(rng):
+    """ Return a full set of tiles in the order a bag shuffled with rng
+    would hold them """
+    tiles = sumoku.game.generate_tiles()
+    rng.shuffle(tiles)
+    return tiles
+
+
+def parse_seed(value):
+    """ Return a seed given on the command line, rejecting any a record
+    can't store """
+    seed = int(value)
+    if not 0 <= seed < SEED_LIMIT:
+        raise argparse.ArgumentTypeError(
+            'seed must be from 0 to {}'.format(SEED_LIMIT - 1))
+    return seed
+
+
+def new_game(header):
+    """ Return the GameState a record's header starts """
+    return sumoku.gamestate.GameState(header.players, header.hand_size,
+                                      header.key_number,
+                                      order=header.order)
+
+
+def encode(event):
+    """ Return an event as a binary frame """
+    if isinstance(event, GameHeader):
+        if event.seed is not None and not 0 <= event.seed < SEED_LIMIT:
+            raise ValueError('Seed {} does not fit in a record'
+                             .format(event.seed))
+        body = TYPES['game'] + HEADER_FIELDS.pack(
+            VERSION, event.players, event.hand_size, event.key_number,
+            event.seed is not None, event.seed or 0) + \
+            ''.join(chr(sumoku.game.pack_tile(tile)) for tile in event.order)
+    else:
+        body = TYPES[event[0]] + FIELDS[event[0]].pack(*event[1:])
+    return chr(len(body)) + body
+
+
+def decode(body):
+    """ Return the event in the body of a binary frame """
+    name = NAMES.get(body[:1])
+    if name is None:
+        raise ValueError('Unknown record type {!r}'.format(body[:1]))
+    if name != 'game':
+        return (name,) + FIELDS[name].unpack(body[1:])
+    version = ord(body[1:2] or '\0')
+    if version == VERSION:
+        fields = HEADER_FIELDS
+        _, players, hand_size, key_number, has_seed, seed = \
+            fields.unpack_from(body, 1)
+        if not has_seed:
+            seed = None
+    elif version == 1:
+        fields = HEADER_FIELDS_V1
+        _, players, hand_size, key_number, seed = fields.unpack_from(body, 1)
+        if seed < 0:
+            seed = None
+    else:
+        raise ValueError('Unknown record version {}'.format(version))
+    order = [sumoku.game.HAND_TILES[ord(value)]
+             for value in body[1 + fields.size:]]
+    return GameHeader(players, hand_size, key_number, seed, order)
+
+
+def to_json(event):
+    """ Return an event as a line of JSON """
+    if isinstance(event, GameHeader):
+        fields = dict(event._asdict())
+        fields['order'] = [list(tile) for tile in event.order]
+        fields['type'] = 'game'
+    else:
+        fields = dict(zip(['type'] + JSON_FIELDS[event[0]], event))
+    return json.dumps(fields, sort_keys=True)
+
+
+def from_json(line):
+    """ Return the event in a line of JSON """
+    fields = json.loads(line)
+    if fields['type'] == 'game':
+        return GameHeader(fields['players'], fields['hand_size'],
+                          fields['key_number'], fields['seed'],
+                          [tuple(tile) for tile in fields['order']])
+    return (str(fields['type']),) + tuple(
+        fields[name] for name in JSON_FIELDS[fields['type']])
+
+
+class RecordWriter(object):
+    """ Writes events to a stream as they happen """
+
+    def __init__(self, stream, binary=True):
+        self.stream = stream
+        self.binary = binary
+
+    def write(self, event):
+        """ Append an event """
+        if self.binary:
+            self.stream.write(encode(event))
+        else:
+            self.stream.write(to_json(event) + '\n')
+
+    def flush(self):
+        """ Flush the stream """
+        self.stream.flush()
+
+    def close(self):
+        """ Close the stream """
+        self.stream.close()
+
+
+def read_binary(stream):
+    """ Yield the events of a binary record, reading it a chunk at a time """
+    buf = ''
+    offset = 0
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if len(chunk) == 0:
+            break
+        buf = buf[offset:] + chunk
+        offset = 0
+        while offset < len(buf):
+            end = offset + 1 + ord(buf[offset])
+            if end > len(buf):
+                break
+            yield decode(buf[offset + 1:end])
+            offset = end
+    if offset < len(buf):
+        raise ValueError('Record ends part way through an event')
+
+
+def read_json(stream):
+    """ Yield the events of a JSON lines record """
+    for line in stream:
+        if line.strip():
+            yield from_json(line)
+
+
+def is_json(path):
+    """ Return True if a record file is in the JSON lines format """
+    return path.endswith('.jsonl')
+
+
+def open_writer(path):
+    """ Return a RecordWriter appending to a file, in the format its name
+    calls for """
+    return RecordWriter(open(path, 'ab'), binary=not is_json(path))
+
+
+def read_file(path):
+    """ Yield the events of a record file """
+    with open(path, 'rb') as stream:
+        reader = read_json if is_json(path) else read_binary
+        for event in reader(stream):
+            yield event
+
+
+def apply_event(state, event, trusted=False):
+    """ Make a move event on a game state, returning the event to record
+
+    A submit is scored and the result recorded in the event returned. If
+    trusted, a submit takes its score from the event rather than scoring
+    the play again.
+    """
+    name = event[0]
+    if name == 'place':
+        state.place_tile(event[1], event[2], event[3])
+    elif name == 'flip':
+        state.flip_tile(event[1])
+    elif name == 'remove':
+        state.remove_tile(event[1], event[2])
+    elif name == 'submit':
+        if trusted:
+            state.commit_play(event[1], bool(event[2]))
+            return event
+        score, line = state.submit_play()
+        return ('submit', score, int(line))
+    else:
+        raise ValueError('Unknown event {}'.format(name))
+    return event
+
+
+def stage_events(state, move):
+    """ Place the tiles of a Move, or nothing if it is None, on a game
+    state without submitting them, returning the events which placed them """
+    events = []
+    if move is not None:
+        for tile in move.tiles:
+            flipped = sumoku.moves.flipped_number(tile[0])
+            for index, held in enumerate(state.cur_hand()):
+                if held[1] == tile[1] and held[0] in (tile[0], flipped):
+                    break
+            else:
+                raise sumoku.game.InvalidPlayException(
+                    'No {} in hand'.format(sumoku.game.tile_string(tile)))
+            if held[0] != tile[0]:
+                events.append(apply_event(state, ('flip', index)))
+            events.append(apply_event(state,
+                                      ('place', index, tile[2], tile[3])))
+    return events
+
+
+def move_events(state, move):
+    """ Make a Move, or a pass if it is None, on a game state, returning
+    the events which made it """
+    events = stage_events(state, move)
+    events.append(apply_event(state, ('submit', 0, 0)))
+    return events
+
+
+def replay(events, trusted=False, callback=None):
+    """ Replay the games of a record, yielding (header, state) as each
+    game ends
+
+    A trusted record is fast forwarded, taking the scores recorded rather
+    than validating each play. callback, if given, is called with the
+    state after every event, say to render it.
+    """
+    header = None
+    state = None
+    for event in events:
+        if isinstance(event, GameHeader):
+            if state is not None:
+                yield header, state
+            header = event
+            state = new_game(header)
+            continue
+        recorded = apply_event(state, event, trusted)
+        if recorded != event:
+            raise sumoku.game.InvalidPlayException(
+                'Recorded {} but play scores {}'.format(event, recorded))
+        if callback is not None:
+            callback(state)
+    if state is not None:
+        yield header, state
+
+
+def parse_args():
+    """ Parse command line arguments """
+    parser = argparse.ArgumentParser(description='Replay sumoku records')
+    parser.add_argument('records', nargs='+', help='record files')
+    parser.add_argument('--trusted', action='store_true',
+                        help='fast forward without validating plays')
+    return parser.parse_args()
+
+
+def main():
+    """ Replay records, printing how many games and moves they hold """
+    args = parse_args()
+    games = 0
+    tiles = 0
+    start = time.time()
+    for path in args.records:
+        for _, state in replay(read_file(path), args.trusted):
+            games = games + 1
+            tiles = tiles + len(state.played_tiles)
+    elapsed = max(time.time() - start, 1e-9)
+    print json.dumps({'games': games, 'tiles': tiles,
+                      'seconds': round(elapsed, 2),
+                      'games_per_sec': round(games / elapsed, 1)},
+                     indent=2, sort_keys=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+""" Buffered drawing of the game state on a terminal
+
+A frame is built as a list of lines, each a list of (column, text) cells,
+and written with a single call. In differential mode only the cells which
+changed since the last frame are written, each after an ANSI escape moving
+the cursor to it.
+"""
+import sys
+
+COLUMNS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+HEADER = '   ' + COLUMNS
+# Most of the board shown at once
+VIEW_WIDTH = len(COLUMNS)
+VIEW_HEIGHT = 20
+CLEAR_SCREEN = '\x1b[H\x1b[2J'
+CLEAR_LINE = '\x1b[K'
+CLEAR_BELOW = '\x1b[J'
+
+
+def move_cursor(line, column):
+    """ Return the escape moving the cursor to a line and column from 1 """
+    return '\x1b[{};{}H'.format(line, column)
+
+
+def tile_text(tile, highlight):
+    """ Return a tile drawn in color """
+    return '\x1b[{};{}1m{}\x1b[0m'.format(31 + tile[1],
+                                           '47;' if highlight else '',
+                                           tile[0])
+
+
+def side_text(state, row):
+    """ Return the text beside a row of the board """
+    if row == 0:
+        return ' Key number: {}'.format(state.key_number)
+    if row == 1:
+        return ' Tiles remaining: {}'.format(len(state.tiles))
+    if row == 3:
+        return ' Player Score Hand'
+    if row == 4:
+        return '              12345678'
+    player = row - 5
+    if player >= 0 and player < state.players:
+        current = player == state.player
+        parts = [' ', '\x1b[47m' if current else '',
+                 '{:6} {:05} '.format(player + 1, state.scores[player])]
+        parts.extend(tile_text(tile, current)
+                     for tile in state.hands[player])
+        return ''.join(parts)
+    return ''
+
+
+def view_span(low, high, first, last, size):
+    """ Return the first position and length of a view of at most size
+    positions along an axis bounded by low and high, either of which may
+    be None, centred on the occupied positions first to last """
+    if low is not None and high is not None:
+        size = min(size, high - low + 1)
+    start = (first + last) // 2 - (size - 1) // 2
+    if high is not None:
+        start = min(start, high - size + 1)
+    if low is not None:
+        start = max(start, low)
+    return start, size
+
+
+def viewport(state, width=VIEW_WIDTH, height=VIEW_HEIGHT):
+    """ Return (left, top, columns, rows) of the part of the board to show,
+    scrolled to the middle of the tiles placed and clipped to the bounds
+    of the board """
+    bounds = state.board.bounds
+    cells = state.board.cells.keys() + state.pending.cells.keys()
+    if len(cells) > 0:
+        xs = [x for x, _ in cells]
+        ys = [y for _, y in cells]
+        first = (min(xs), min(ys))
+        last = (max(xs), max(ys))
+    else:
+        first = last = bounds.middle()
+    left, columns = view_span(bounds.min_x, bounds.max_x, first[0], last[0],
+                              width)
+    top, rows = view_span(bounds.min_y, bounds.max_y, first[1], last[1],
+                          height)
+    return left, top, columns, rows
+
+
+def build_frame(state, width=VIEW_WIDTH, height=VIEW_HEIGHT):
+    """ Return the lines of cells of a frame showing state, with at most
+    width columns and height rows of the board """
+    board = state.board.cells
+    pending = state.pending.cells
+    left, top, columns, rows = viewport(state, width, height)
+    # Row numbers are right aligned to the widest shown
+    label = max(2, len(str(top + 1)), len(str(top + rows)))
+    side = label + columns + 2
+    frame = [[(1, ' ' * (label + 1) +
+               ''.join(COLUMNS[col % len(COLUMNS)]
+                       for col in xrange(left, left + columns)))]]
+    for row in xrange(top, top + rows):
+        line = [(1, '{:{}} '.format(row + 1, label))]
+        for col in xrange(left, left + columns):
+            tile = board.get((col, row))
+            if tile is not None:
+                text = tile_text(tile, False)
+            else:
+                tile = pending.get((col, row))
+                text = '-' if tile is None else tile_text(tile, True)
+            line.append((col - left + label + 2, text))
+        line.append((side, side_text(state, row - top)))
+        frame.append(line)
+    # A board too short for the scores carries them on below it
+    for row in xrange(rows, 5 + state.players):
+        frame.append([(1, ' ' * (side - 1)), (side, side_text(state, row))])
+    return frame
+
+
+def frame_text(frame):
+    """ Return the text drawing a whole frame """
+    return ''.join([''.join([text for _, text in line]) + '\n'
+                    for line in frame])
+
+
+def diff_text(old, new):
+    """ Return the text redrawing the cells of frame new which differ from
+    frame old, leaving the cursor on a cleared line below the frame """
+    parts = []
+    for number, (old_line, new_line) in enumerate(zip(old, new)):
+        last = len(new_line) - 1
+        for index, (column, text) in enumerate(new_line):
+            if old_line[index][1] != text:
+                parts.append(move_cursor(number + 1, column))
+                parts.append(text)
+                # Text at the end of a line may have shrunk
+                if index == last:
+                    parts.append(CLEAR_LINE)
+    parts.append(move_cursor(len(new) + 1, 1))
+    parts.append(CLEAR_BELOW)
+    return ''.join(parts)
+
+
+def same_shape(old, new):
+    """ Return True if two frames have their cells in the same places """
+    if len(old) != len(new):
+        return False
+    for old_line, new_line in zip(old, new):
+        if [column for column, _ in old_line] != \
+                [column for column, _ in new_line]:
+            return False
+    return True
+
+
+class Renderer(object):
+    """ Draws game states to a stream, with one write per frame
+
+    In differential mode the first frame clears the screen, and later
+    frames only redraw what changed. Anything written below the frame is
+    cleared on each draw. Boards larger than width by height are shown
+    through a viewport following the tiles played.
+    """
+
+    def __init__(self, stream=None, diff=False, width=VIEW_WIDTH,
+                 height=VIEW_HEIGHT):
+        self.stream = sys.stdout if stream is None else stream
+        self.diff = diff
+        self.width = width
+        self.height = height
+        self.frame = None
+
+    def render(self, state):
+        """ Return the text drawing state """
+        frame = build_frame(state, self.width, self.height)
+        if not self.diff:
+            text = frame_text(frame)
+        elif self.frame is None or not same_shape(self.frame, frame):
+            text = CLEAR_SCREEN + frame_text(frame)
+        else:
+            text = diff_text(self.frame, frame)
+        self.frame = frame
+        return text
+
+    def draw(self, state):
+        """ Draw state """
+        self.stream.write(self.render(state))
+        self.stream.flush()
+
+    def invalidate(self):
+        """ Forget the last frame, so the next is drawn in full """
+        self.frame = None
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+""" A server hosting many sumoku games over a line based protocol
+
+Each line sent by a client is a command, answered by one line starting
+with "ok" or "error". The play commands are those of the command line
+game, run by sumokucli.execute_command:
+
+    new [players] [key number] [hand size] [seed]  Start a game, holding
+                                                   every seat in it
+    join <game> <player>                           Take a seat in a game
+    state                                          Describe the game
+    place <tile> <col> <row>, flip <tile>,
+    remove <col> <row>, submit                     Play for the current
+                                                   player
+    stats                                          Describe the server
+    timings                                        Time taken by the rules
+                                                   engine, as JSON
+    quit                                           Disconnect
+
+The server runs in one thread on asyncore. A connection whose replies
+aren't being read stops being read from until they drain, and games and
+connections idle for too long are dropped.
+
+Started with --profile, the server times the hot paths of the rules
+engine, and timings reports their call counts and latency percentiles
+so far, empty while they aren't being timed.
+"""
+import argparse
+import asynchat
+import asyncore
+import itertools
+import json
+import random
+import socket
+import sys
+import time
+import sumoku.game
+import sumoku.gamestate
+import sumoku.instrument
+import sumoku.sumokucli
+
+# Longest command line accepted
+MAX_LINE = 1024
+# Replies buffered for a connection before it stops being read from
+MAX_BUFFERED = 1 << 16
+# Seconds a game or connection may be idle before it is dropped
+IDLE_TIMEOUT = 600.0
+
+COLOR_LETTERS = 'rgybmc'
+
+
+def tile_text(tile):
+    """ Describe a tile as its number and color letter, with its position
+    in command line coordinates if it has been played """
+    text = '{}{}'.format(tile[0], COLOR_LETTERS[tile[1]])
+    if len(tile) > 2:
+        text = '{}@{}{}'.format(text, sumoku.sumokucli.format_col(tile[2]),
+                                tile[3] + 1)
+    return text
+
+
+def describe(state):
+    """ Describe a game state in one line """
+    return 'player={} key={} bag={} passes={} scores={} hand={} ' \
+        'pending={} board={}{}'.format(
+            state.player + 1, state.key_number, len(state.tiles),
+            state.passes, ','.join(str(score) for score in state.scores),
+            ','.join(tile_text(tile) for tile in state.cur_hand()),
+            ','.join(tile_text(tile) for tile in state.pending_tiles),
+            ','.join(tile_text(tile) for tile in state.played_tiles),
+            ' over' if state.game_complete() else '')
+
+
+class ProtocolError(Exception):
+    """ Exception raised for a command the server can't carry out """
+    pass
+
+
+class Game(object):
+    """ A game hosted by the server and the connections seated at it """
+
+    __slots__ = ('game_id', 'state', 'seats', 'last_active')
+
+    def __init__(self, game_id, state, connection):
+        self.game_id = game_id
+        self.state = state
+        self.seats = [connection] * state.players
+        self.last_active = time.time()
+
+
+class Connection(asynchat.async_chat):
+    """ A client connection, reading one command per line """
+
+    def __init__(self, server, sock):
+        asynchat.async_chat.__init__(self, sock, map=server.socket_map)
+        self.server = server
+        self.game = None
+        self.incoming = []
+        self.incoming_size = 0
+        self.last_active = time.time()
+        self.set_terminator('\n')
+
+    def collect_incoming_data(self, data):
+        self.incoming.append(data)
+        self.incoming_size = self.incoming_size + len(data)
+        if self.incoming_size > MAX_LINE:
+            self.incoming = []
+            self.incoming_size = 0
+            self.reply('error line too long')
+            self.close_when_done()
+
+    def found_terminator(self):
+        line = ''.join(self.incoming).strip()
+        self.incoming = []
+        self.incoming_size = 0
+        self.last_active = time.time()
+        command = line.split()
+        try:
+            self.reply('ok' + self.server.execute(self, command))
+        except (ProtocolError, sumoku.sumokucli.IllegalCommandException,
+                sumoku.game.InvalidPlayException), err:
+            self.reply('error {}'.format(err))
+        if command[:1] == ['quit']:
+            self.close_when_done()
+
+    def reply(self, text):
+        """ Queue a line to send """
+        self.push(text + '\n')
+
+    def buffered(self):
+        """ Return the number of bytes queued to send """
+        return sum(len(data) for data in self.producer_fifo
+                   if isinstance(data, str))
+
+    def readable(self):
+        # Stop reading commands while the replies to earlier ones back up
+        return self.buffered() < MAX_BUFFERED and \
+            asynchat.async_chat.readable(self)
+
+    def handle_close(self):
+        self.server.disconnect(self)
+        self.close()
+
+
+class GameServer(asyncore.dispatcher):
+    """ Accepts connections and hosts their games """
+
+    def __init__(self, host='localhost', port=0, idle_timeout=IDLE_TIMEOUT,
+                 socket_map=None):
+        self.socket_map = {} if socket_map is None else socket_map
+        asyncore.dispatcher.__init__(self, map=self.socket_map)
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind((host, port))
+        self.listen(128)
+        self.idle_timeout = idle_timeout
+        self.games = {}
+        self.connections = set()
+        self.game_ids = itertools.count(1)
+        self.started = time.time()
+        self.commands = 0
+        self.moves = 0
+        self.evicted = 0
+
+    def address(self):
+        """ Return the (host, port) the server listens on """
+        return self.socket.getsockname()
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            self.connections.add(Connection(self, pair[0]))
+
+    def disconnect(self, connection):
+        """ Forget a closed connection, and its game if nobody else is
+        seated at it """
+        self.connections.discard(connection)
+        game = connection.game
+        connection.game = None
+        if game is not None and \
+                all(seat is connection for seat in game.seats):
+            self.games.pop(game.game_id, None)
+
+    def execute(self, connection, command):
+        """ Carry out a command for a connection, returning the text to
+        follow "ok" in the reply """
+        self.commands = self.commands + 1
+        if len(command) == 0 or command[0] in ('help', '?'):
+            return ' commands: new join state place flip remove submit ' \
+                'stats timings quit'
+        name = command[0]
+        if name == 'new':
+            return ' {}'.format(self.new_game(connection, command[1:]))
+        if name == 'join':
+            return self.join_game(connection, command[1:])
+        if name == 'stats':
+            return ' ' + ' '.join('{}={}'.format(key, value) for key, value
+                                  in sorted(self.statistics().iteritems()))
+        if name == 'timings':
+            return ' ' + json.dumps(sumoku.instrument.report(),
+                                    sort_keys=True)
+        if name == 'quit':
+            return ''
+        if name not in ('state', 'place', 'flip', 'remove', 'submit'):
+            raise ProtocolError('unknown command {}'.format(name))
+
+        game = connection.game
+        if game is None or game.game_id not in self.games:
+            raise ProtocolError('not in a game')
+        game.last_active = time.time()
+        if name == 'state':
+            return ' ' + describe(game.state)
+        if game.seats[game.state.player] is not connection:
+            raise ProtocolError('not your turn')
+
+        sumoku.sumokucli.execute_command(game.state, command)
+        if name != 'submit':
+            return ''
+        self.moves = self.moves + 1
+        if game.state.game_complete():
+            del self.games[game.game_id]
+            return ' over scores={}'.format(
+                ','.join(str(score) for score in game.state.scores))
+        return ' player={}'.format(game.state.player + 1)
+
+    def new_game(self, connection, args):
+        """ Start a game from the arguments of a new command """
+        try:
+            players = int(args[0]) if len(args) > 0 else 2
+            key_number = args[1] if len(args) > 1 else 'random'
+            hand_size = int(args[2]) if len(args) > 2 else 8
+            seed = int(args[3]) if len(args) > 3 else None
+        except ValueError:
+            raise ProtocolError('new takes numbers')
+        if players < 2 or players > 5 or hand_size < 1:
+            raise ProtocolError('bad game parameters')
+        rng = random.Random(seed)
+        if key_number == 'random':
+            key_number = sumoku.game.get_key_number(rng)
+        elif key_number in ('3', '4', '5'):
+            key_number = int(key_number)
+        else:
+            raise ProtocolError('key number must be 3, 4, 5 or random')
+
+        state = sumoku.gamestate.GameState(players, hand_size, key_number,
+                                           rng)
+        game = Game(next(self.game_ids), state, connection)
+        self.games[game.game_id] = game
+        connection.game = game
+        return game.game_id
+
+    def join_game(self, connection, args):
+        """ Seat a connection in a game from the arguments of a join """
+        try:
+            game_id, player = int(args[0]), int(args[1]) - 1
+        except (IndexError, ValueError):
+            raise ProtocolError('join takes a game and a player')
+        game = self.games.get(game_id)
+        if game is None:
+            raise ProtocolError('no game {}'.format(game_id))
+        if player < 0 or player >= len(game.seats):
+            raise ProtocolError('no player {}'.format(player + 1))
+        game.seats[player] = connection
+        game.last_active = time.time()
+        connection.game = game
+        return ''
+
+    def evict_idle(self, now=None):
+        """ Drop games and connections idle for longer than the timeout """
+        if now is None:
+            now = time.time()
+        limit = now - self.idle_timeout
+        for game_id, game in self.games.items():
+            if game.last_active < limit:
+                del self.games[game_id]
+                self.evicted = self.evicted + 1
+        for connection in list(self.connections):
+            if connection.last_active < limit:
+                self.disconnect(connection)
+                connection.close()
+
+    def statistics(self):
+        """ Return the server's counters """
+        elapsed = max(time.time() - self.started, 1e-9)
+        return {'games': len(self.games),
+                'connections': len(self.connections),
+                'commands': self.commands, 'moves': self.moves,
+                'evicted': self.evicted,
+                'moves_per_sec': round(self.moves / elapsed, 1)}
+
+
+def serve(server, poll=1.0, until=None):
+    """ Run a server's event loop, evicting idle games every poll
+    seconds, until the time until if one is given """
+    last = time.time()
+    while until is None or time.time() < until:
+        asyncore.loop(timeout=poll, use_poll=True, map=server.socket_map,
+                      count=1)
+        if time.time() - last >= poll:
+            server.evict_idle()
+            last = time.time()
+
+
+def parse_args():
+    """ Parse command line arguments """
+    parser = argparse.ArgumentParser(description='A sumoku game server')
+    parser.add_argument('--host', default='localhost',
+                        help='address to listen on')
+    parser.add_argument('--port', default=7664, type=int,
+                        help='port to listen on')
+    parser.add_argument('--idle-timeout', default=IDLE_TIMEOUT, type=float,
+                        help='seconds before an idle game is dropped')
+    parser.add_argument('--profile', nargs='?', const='', default=None,
+                        metavar='FILE',
+                        help='time the rules engine, printing a table of the '
+                        'timings to standard error on exit and writing a '
+                        'cProfile dump to FILE if given')
+    return parser.parse_args()
+
+
+def main():
+    """ Run the server until interrupted """
+    args = parse_args()
+    server = GameServer(args.host, args.port, args.idle_timeout)
+    print 'Listening on {}:{}'.format(*server.address())
+    if args.profile is None:
+        try:
+            serve(server)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    with sumoku.instrument.profiling(args.profile or None, sys.stderr):
+        try:
+            serve(server)
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
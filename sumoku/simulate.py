@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+""" Headless self-play of complete sumoku games """
+import argparse
+import collections
+import json
+import multiprocessing
+import random
+import sys
+import sumoku.game
+import sumoku.gamestate
+import sumoku.instrument
+import sumoku.mcts
+import sumoku.moves
+
+# Turns after which a game is abandoned, far beyond any real game
+MAX_TURNS = 1000
+
+GameResult = collections.namedtuple('GameResult', ['seed', 'key_number',
+                                                   'scores', 'turns',
+                                                   'tiles_left'])
+
+
+def pass_agent(state, rng):
+    """ An agent which always passes """
+    return None
+
+
+def random_agent(state, rng):
+    """ An agent which makes a random legal play """
+    moves = list(sumoku.moves.generate_moves(state.board, state.cur_hand(),
+                                             state.key_number,
+                                             analyzer=state.analyzer()))
+    if len(moves) == 0:
+        return None
+    return rng.choice(moves)
+
+
+def greedy_agent(state, rng):
+    """ An agent which makes the highest scoring legal play """
+    best = None
+    for move in sumoku.moves.generate_moves(state.board, state.cur_hand(),
+                                            state.key_number,
+                                            analyzer=state.analyzer()):
+        if best is None or (move.score, len(move.tiles)) > \
+                (best.score, len(best.tiles)):
+            best = move
+    return best
+
+
+# Agent policies by name. A policy is called with the game state and a
+# random.Random and returns the Move to play, or None to pass.
+AGENTS = {
+    'pass': pass_agent,
+    'random': random_agent,
+    'greedy': greedy_agent,
+    'mcts': sumoku.mcts.mcts_agent,
+}
+
+
+def get_agent(agent):
+    """ Return an agent policy given either its name or the policy """
+    if callable(agent):
+        return agent
+    try:
+        return AGENTS[agent]
+    except KeyError:
+        raise ValueError('Unknown agent {}'.format(agent))
+
+
+def play_game(players, hand_size, key_number, agents, seed):
+    """ Play a complete game and return its GameResult
+
+    key_number may be 'random' to pick one from the game's seed. agents
+    holds one policy (or policy name) per player.
+    """
+    rng = random.Random(seed)
+    if key_number == 'random':
+        key_number = sumoku.game.get_key_number(rng)
+    agents = [get_agent(agent) for agent in agents]
+    state = sumoku.gamestate.GameState(players, hand_size, key_number, rng)
+
+    turns = 0
+    while not state.game_complete() and turns < MAX_TURNS:
+        move = agents[state.player](state, rng)
+        if move is not None:
+            state.stage_play(move.tiles)
+        state.submit_play()
+        turns = turns + 1
+    return GameResult(seed, key_number, list(state.scores), turns,
+                      len(state.tiles))
+
+
+def _play_task(task):
+    """ Play one game from a tuple of play_game arguments """
+    return play_game(*task)
+
+
+def _timed_task(task):
+    """ Play one game in a worker process, returning its GameResult and
+    the hot path Stats counted playing it """
+    return play_game(*task), sumoku.instrument.take()
+
+
+def game_seeds(games, seed):
+    """ Return an independent seed for each of a number of games """
+    rng = random.Random(seed)
+    return [rng.getrandbits(63) for _ in xrange(games)]
+
+
+def simulate(games, players, hand_size, key_number, agents, seed=None,
+             workers=1, chunksize=16):
+    """ Play a number of games, yielding their results in order
+
+    Each game gets its own seed derived from seed, so the results are the
+    same however many worker processes play them. While the hot paths are
+    instrumented, the workers' timings are merged into those of this
+    process.
+    """
+    if len(agents) == 1:
+        agents = list(agents) * players
+    if len(agents) != players:
+        raise ValueError('Need one agent per player')
+    for agent in agents:
+        get_agent(agent)
+
+    tasks = [(players, hand_size, key_number, agents, game_seed)
+             for game_seed in game_seeds(games, seed)]
+    if workers == 1:
+        for task in tasks:
+            yield _play_task(task)
+        return
+
+    timing = sumoku.instrument.enabled()
+    pool = multiprocessing.Pool(workers, sumoku.instrument.init_worker,
+                                (timing,))
+    try:
+        if not timing:
+            for result in pool.imap(_play_task, tasks, chunksize):
+                yield result
+        else:
+            for result, stats in pool.imap(_timed_task, tasks, chunksize):
+                sumoku.instrument.merge(stats)
+                yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def percentiles(values, points=(0, 25, 50, 75, 100)):
+    """ Return the given percentiles of a list of values """
+    values = sorted(values)
+    if len(values) == 0:
+        return {}
+    return dict((point, values[(len(values) - 1) * point // 100])
+                for point in points)
+
+
+def distribution(values):
+    """ Summarize a list of values """
+    if len(values) == 0:
+        return {'mean': None, 'percentiles': {}}
+    return {'mean': float(sum(values)) / len(values),
+            'percentiles': percentiles(values)}
+
+
+def summarize(results):
+    """ Aggregate a collection of GameResults """
+    results = list(results)
+    players = len(results[0].scores) if len(results) > 0 else 0
+    wins = [0 for _ in xrange(players)]
+    for result in results:
+        best = max(result.scores)
+        for player, score in enumerate(result.scores):
+            if score == best:
+                wins[player] = wins[player] + 1
+
+    return {
+        'games': len(results),
+        'scores': [distribution([result.scores[player]
+                                 for result in results])
+                   for player in xrange(players)],
+        'wins': wins,
+        'turns': distribution([result.turns for result in results]),
+        'tiles_left': distribution([result.tiles_left
+                                    for result in results]),
+        'key_numbers': dict(collections.Counter(result.key_number
+                                                for result in results)),
+    }
+
+
+def parse_args():
+    """ Parse command line arguments """
+    parser = argparse.ArgumentParser(description='Headless sumoku self-play')
+    parser.add_argument('--games', default=100, type=int,
+                        help='number of games to play')
+    parser.add_argument('--players', default=2, type=int,
+                        choices=range(2, 6), help='number of players')
+    parser.add_argument('--key-number', default='random',
+                        choices=['3', '4', '5', 'random'],
+                        help="key number, or 'random' for each game")
+    parser.add_argument('--hand-size', default=8, type=int,
+                        help='number of tiles in hand')
+    parser.add_argument('--agents', default=['greedy'], nargs='+',
+                        choices=sorted(AGENTS),
+                        help='agent for each player, or one for all')
+    parser.add_argument('--seed', default=None, type=int,
+                        help='seed for the whole run')
+    parser.add_argument('--workers', default=multiprocessing.cpu_count(),
+                        type=int, help='number of worker processes')
+    parser.add_argument('--profile', nargs='?', const='', default=None,
+                        metavar='FILE',
+                        help='time the rules engine, adding the timings to '
+                        'the results, printing a table of them to standard '
+                        'error and writing a cProfile dump to FILE if given')
+
+    args = parser.parse_args()
+    if args.key_number != 'random':
+        args.key_number = int(args.key_number)
+    return args
+
+
+def main():
+    """ Run a batch of games and print the aggregate results """
+    args = parse_args()
+    if args.profile is None:
+        results = simulate(args.games, args.players, args.hand_size,
+                           args.key_number, args.agents, args.seed,
+                           args.workers)
+        print json.dumps(summarize(results), indent=2, sort_keys=True)
+        return
+
+    with sumoku.instrument.profiling(args.profile or None, sys.stderr):
+        summary = summarize(simulate(args.games, args.players,
+                                     args.hand_size, args.key_number,
+                                     args.agents, args.seed, args.workers))
+    summary['timings'] = sumoku.instrument.report()
+    print json.dumps(summary, indent=2, sort_keys=True)
+
+if __name__ == "__main__":
+    main()
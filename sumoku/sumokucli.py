@@ -1,8 +1,17 @@
 #!/usr/bin/env python
 """ A CLI interface to play sumoku """
 import argparse
+import random
+import sys
+import sumoku.book
+import sumoku.endgame
 import sumoku.game
 import sumoku.gamestate
+import sumoku.hint
+import sumoku.instrument
+import sumoku.mcts
+import sumoku.record
+import sumoku.render
 
 
 class IllegalCommandException(Exception):
@@ -20,30 +29,88 @@ def parse_args():
                         help="key number, or 'random'")
     parser.add_argument('--hand-size', default=8, type=int,
                         help='number of tiles in hand')
+    parser.add_argument('--ai', default=[], type=int, action='append',
+                        metavar='PLAYER',
+                        help='let the computer play for a player')
+    parser.add_argument('--ai-time', default=2.0, type=float,
+                        help='seconds the computer thinks per move')
+    parser.add_argument('--ai-workers', default=1, type=int,
+                        help='number of processes the computer thinks with')
+    parser.add_argument('--book', default=None, metavar='FILE',
+                        help='opening book for the computer to play from')
+    parser.add_argument('--seed', default=None,
+                        type=sumoku.record.parse_seed,
+                        help='seed to replay a game exactly')
+    parser.add_argument('--record', default=None, metavar='FILE',
+                        help='append every move to a game record, as JSON '
+                        'lines if FILE ends in .jsonl')
+    parser.add_argument('--script', default=None, metavar='FILE',
+                        help="read commands from a file, or '-' for "
+                        'standard input, stopping at the first illegal one')
+    parser.add_argument('--quiet', '--final-only', action='store_true',
+                        help='print only the final scores')
+    parser.add_argument('--profile', nargs='?', const='', default=None,
+                        metavar='FILE',
+                        help='time the rules engine, printing a table of the '
+                        'timings to standard error on exit and writing a '
+                        'cProfile dump to FILE if given')
 
     args = parser.parse_args()
+    args.rng = random.Random(args.seed)
+
+    for player in args.ai:
+        if player < 1 or player > args.players:
+            parser.error('AI player must be between 1 and {}'
+                         .format(args.players))
 
     # Get key number
     if args.key_number == "random":
-        args.key_number = sumoku.game.get_key_number()
+        args.key_number = sumoku.game.get_key_number(args.rng)
     else:
         args.key_number = int(args.key_number)
 
     return args
 
 
+COMMAND_HELP = [
+    'help,?                   Print this help message',
+    'submit                   Submit the current play',
+    'flip <tile>              Flip a tile between 6 and 9',
+    'place <tile> <col> <row> Place a tile on the board',
+    'remove <col> <row>       Remove a tile from the board',
+    'analyze [ms]             Solve the endgame once the bag is empty',
+    'hint [ms]                Suggest a play and place its tiles',
+]
+
+# Milliseconds analyze and hint search for by default
+ANALYZE_TIME = 2000
+HINT_TIME = 2000
+# Seconds between checks for Ctrl-C while a hint is searched
+HINT_POLL = 0.1
+
+
+# Commands parse_command knows
+COMMANDS = ['help', '?', 'submit', 'flip', 'place', 'remove', 'analyze',
+            'hint']
+
+
 def command_help():
     """ Print help for commands """
-    print 'help,?                   Print this help message'
-    print 'submit                   Submit the current play'
-    print 'flip <tile>              Flip a tile between 6 and 9'
-    print 'place <tile> <col> <row> Place a tile on the board'
-    print 'remove <col> <row>       Remove a tile from the board'
+    for line in COMMAND_HELP:
+        print line
+
+
+def parse_number(numstr, name):
+    """ Parse a number from user input """
+    try:
+        return int(numstr)
+    except ValueError:
+        raise IllegalCommandException('{} must be a number'.format(name))
 
 
 def parse_tile(tilestr, hand):
     """ Parse a tile from user input """
-    tile = int(tilestr) - 1
+    tile = parse_number(tilestr, 'Tile') - 1
     if tile < 0 or tile >= len(hand):
         raise IllegalCommandException('Tile must be between {} and {}'
                                       .format(1, len(hand)))
@@ -65,31 +132,51 @@ def parse_col(colstr):
     return colnum
 
 
+def format_col(colnum):
+    """ Return a column as the user enters it """
+    if colnum < 26:
+        return chr(ord('a') + colnum)
+    return chr(ord('A') + colnum - 26)
+
+
 def parse_row(rowstr):
     """ Parse a row from user input """
-    row = int(rowstr) - 1
+    row = parse_number(rowstr, 'Row') - 1
     if row < 0 or row > sumoku.game.MAX_Y:
         raise IllegalCommandException('Row must be 1-{}'
                                       .format(sumoku.game.MAX_Y + 1))
     return row
 
 
-def handle_command(state):
-    """ Get a command from the user and perform appropriate action """
-    command = raw_input('Player {} enter command (? for help): '
-                        .format(state.player + 1)).split()
+def handle_command(state, read=raw_input):
+    """ Get a command from the user and perform appropriate action
+
+    The command is read by calling read with a prompt. Returns the event
+    made, or None if the user asked for help.
+    """
+    command = read('Player {} enter command (? for help): '
+                   .format(state.player + 1)).split()
+    return execute_command(state, command)
+
+
+def parse_command(state, command):
+    """ Parse a command, given as a list of words, into the record event
+    it makes, or None if it asks for help
+
+    analyze and hint make ('analyze', milliseconds) and ('hint',
+    milliseconds) events, which change nothing and aren't recorded.
+    """
     hand = state.cur_hand()
 
     if len(command) == 0:
-        command_help()
+        return None
     elif command[0] == 'submit':
-        state.submit_play()
+        return ('submit', 0, 0)
     elif command[0] == 'flip':
         if len(command) != 2:
             raise IllegalCommandException('Flip command takes one argument')
 
-        tile = parse_tile(command[1], hand)
-        state.flip_tile(tile)
+        return ('flip', parse_tile(command[1], hand))
     elif command[0] == 'place':
         if len(command) != 4:
             raise IllegalCommandException('Place command takes 3 arguments')
@@ -97,36 +184,308 @@ def handle_command(state):
         tile = parse_tile(command[1], hand)
         col = parse_col(command[2])
         row = parse_row(command[3])
-        state.place_tile(tile, col, row)
+        return ('place', tile, col, row)
     elif command[0] == 'remove':
         if len(command) != 3:
             raise IllegalCommandException('Remove command takes 2 arguments')
 
         col = parse_col(command[1])
         row = parse_row(command[2])
-        state.remove_tile(col, row)
+        return ('remove', col, row)
+    elif command[0] == 'analyze':
+        if len(command) > 2:
+            raise IllegalCommandException(
+                'Analyze command takes at most one argument')
+
+        budget = ANALYZE_TIME
+        if len(command) == 2:
+            budget = parse_number(command[1], 'Milliseconds')
+        return ('analyze', budget)
+    elif command[0] == 'hint':
+        if len(command) > 2:
+            raise IllegalCommandException(
+                'Hint command takes at most one argument')
+
+        budget = HINT_TIME
+        if len(command) == 2:
+            budget = parse_number(command[1], 'Milliseconds')
+        return ('hint', budget)
+    return None
+
+
+def format_command(event):
+    """ Return the command making a record event """
+    if event[0] == 'submit':
+        return 'submit'
+    if event[0] == 'flip':
+        return 'flip {}'.format(event[1] + 1)
+    if event[0] == 'place':
+        return 'place {} {} {}'.format(event[1] + 1, format_col(event[2]),
+                                       event[3] + 1)
+    return 'remove {} {}'.format(format_col(event[1]), event[2] + 1)
+
+
+def execute_command(state, command):
+    """ Perform a command, given as a list of words, on a game state
+
+    Nothing is read or printed, so this may be driven by any front end.
+    Returns the event made, or None if the command asks for help. Analyze
+    and hint events are returned without being carried out.
+    """
+    event = parse_command(state, command)
+    if event is None or event[0] in ('analyze', 'hint'):
+        return event
+    return sumoku.record.apply_event(state, event)
+
+
+def move_string(move):
+    """ Return a Move as a string, or pass for None """
+    if move is None:
+        return 'pass'
+    return ', '.join(sumoku.game.played_tile_string(tile)
+                     for tile in move.tiles)
+
+
+def analysis_text(state, result):
+    """ Return lines describing an endgame Result searched from state """
+    lines = ['Margin {:+d} for player {}, {}'.format(
+        result.margin, state.player + 1,
+        'solved' if result.solved else
+        'searched {} turns deep'.format(result.depth))]
+    clone = state.copy()
+    for move in result.line:
+        lines.append('  Player {}: {}'.format(clone.player + 1,
+                                              move_string(move)))
+        clone.apply(move)
+    lines.append('{} positions in {:.2f}s, {:.0f} per second'.format(
+        result.nodes, result.seconds, result.nodes_per_sec))
+    return lines
+
+
+def analyze(state, budget):
+    """ Solve the endgame for up to budget milliseconds and print the
+    best plays """
+    result = sumoku.endgame.solve(state, seconds=budget / 1000.0)
+    for line in analysis_text(state, result):
+        print line
+
+
+def hint_text(state, result):
+    """ Return a message describing a hint Result searched from state """
+    if result.move is None:
+        suggestion = 'pass'
+    else:
+        suggestion = '{} for {} points'.format(move_string(result.move),
+                                               result.move.score)
+    return 'Hint for player {}: {}, margin {:+d} searching {} turns deep, ' \
+        '{} positions in {:.2f}s'.format(state.player + 1, suggestion,
+                                         result.margin, result.depth,
+                                         result.nodes, result.seconds)
+
+
+def hint(state, budget, recorder=None, announce=True):
+    """ Search for up to budget milliseconds for the current player's best
+    play and place its tiles, returning a message describing it
+
+    The search runs in the background, and Ctrl-C stops it early with the
+    best play found so far. If announce, a line saying so is printed first.
+    """
+    if announce:
+        print 'Searching for a hint, Ctrl-C to stop early...'
+    search = sumoku.hint.HintSearch(state, budget / 1000.0)
+    result = None
+    while result is None:
+        try:
+            result = search.result(HINT_POLL)
+        except KeyboardInterrupt:
+            search.cancel()
+    for event in sumoku.record.stage_events(state, result.move):
+        if recorder is not None:
+            recorder.write(event)
+    return hint_text(state, result)
+
+
+def computer_play(state, agent, recorder=None):
+    """ Let the computer play for the current player, returning a message
+    saying what it played """
+    move = agent(state)
+    if move is None:
+        message = 'Player {} passes'.format(state.player + 1)
     else:
-        command_help()
-    return False
+        message = 'Player {} plays {}'.format(state.player + 1,
+                                              move_string(move))
+    for event in sumoku.record.move_events(state, move):
+        if recorder is not None:
+            recorder.write(event)
+    return message
+
+
+def script_commands(stream):
+    """ Yield (line number, command) for each command of a script, skipping
+    blank lines and comments starting with # """
+    for number, line in enumerate(stream, 1):
+        command = line.split('#', 1)[0].split()
+        if len(command) > 0:
+            yield number, command
+
+
+def run_script(state, commands, agent, ai=(), renderer=None, recorder=None):
+    """ Carry out the commands of a script, as from script_commands, with
+    the computer playing for the players in ai
+
+    The computer plays on after the commands run out until it is a human
+    player's turn. Nothing is printed unless a renderer is given to draw
+    the game with. Raises IllegalCommandException naming the line of the
+    first command which can't be carried out.
+    """
+    def computer_turns():
+        """ Let the computer play until it is a human player's turn """
+        while state.player + 1 in ai and not state.game_complete():
+            message = computer_play(state, agent, recorder)
+            if renderer is not None:
+                renderer.draw(state)
+                print message
+
+    for number, command in commands:
+        computer_turns()
+        try:
+            if command[0] not in COMMANDS:
+                raise IllegalCommandException(
+                    'Unknown command {}'.format(command[0]))
+            if state.game_complete():
+                raise IllegalCommandException('The game is over')
+            event = execute_command(state, command)
+            # Analysis changes nothing, so it is only searched when shown,
+            # but a script asking for it where it can't be done is wrong
+            # either way
+            if event is not None and event[0] == 'analyze':
+                sumoku.endgame.check_position(state)
+        except (IllegalCommandException,
+                sumoku.game.InvalidPlayException), err:
+            raise IllegalCommandException('Line {}: {}'.format(number, err))
+        if event is None:
+            if renderer is not None:
+                command_help()
+        elif event[0] == 'analyze':
+            if renderer is not None:
+                analyze(state, event[1])
+        elif event[0] == 'hint':
+            message = hint(state, event[1], recorder, renderer is not None)
+            if renderer is not None:
+                renderer.draw(state)
+                print message
+        else:
+            if recorder is not None:
+                recorder.write(event)
+            if renderer is not None:
+                renderer.draw(state)
+    computer_turns()
+
+
+def run_interactive(state, agent, ai=(), renderer=None, recorder=None,
+                    read=raw_input):
+    """ Play a game to the end with commands read from the user, with the
+    computer playing for the players in ai
+
+    Commands are read by calling read with a prompt. Nothing is printed,
+    not even the prompt, help or errors, unless a renderer is given to
+    draw the game with, and analyze is then ignored.
+    """
+    quiet = renderer is None
+    while not state.game_complete():
+        if state.player + 1 in ai:
+            if not quiet:
+                print 'Player {} is thinking...'.format(state.player + 1)
+            message = computer_play(state, agent, recorder)
+            if not quiet:
+                renderer.draw(state)
+                print message
+            continue
+        try:
+            event = handle_command(
+                state, (lambda prompt: read('')) if quiet else read)
+            if not quiet:
+                renderer.draw(state)
+            if event is None:
+                if not quiet:
+                    command_help()
+            elif event[0] == 'analyze':
+                if not quiet:
+                    analyze(state, event[1])
+            elif event[0] == 'hint':
+                message = hint(state, event[1], recorder, not quiet)
+                if not quiet:
+                    renderer.draw(state)
+                    print message
+            elif recorder is not None:
+                recorder.write(event)
+        except (IllegalCommandException,
+                sumoku.game.InvalidPlayException), err:
+            if not quiet:
+                if renderer.diff:
+                    renderer.draw(state)
+                print 'Error: {}'.format(err.message)
 
 
 def play_sumoku():
     """ Play a game of sumoku """
     args = parse_args()
+    if args.profile is None:
+        sys.exit(run_game(args))
+    with sumoku.instrument.profiling(args.profile or None, sys.stderr):
+        status = run_game(args)
+    sys.exit(status)
+
+
+def run_game(args):
+    """ Play a game of sumoku with the parsed command line arguments,
+    returning the exit status """
+    order = sumoku.record.shuffled_tiles(args.rng)
     state = sumoku.gamestate.GameState(args.players, args.hand_size,
-                                       args.key_number)
+                                       args.key_number, args.rng, order)
+    recorder = None
+    if args.record is not None:
+        recorder = sumoku.record.open_writer(args.record)
+        recorder.write(sumoku.record.GameHeader(
+            args.players, args.hand_size, args.key_number, args.seed, order))
 
-    state.print_game()
-    while not state.game_complete():
+    book = None
+    if args.book is not None:
+        book = sumoku.book.OpeningBook(args.book)
+    agent = sumoku.mcts.MCTSAgent(args.ai_time, workers=args.ai_workers,
+                                  seed=args.rng.getrandbits(64), book=book)
+
+    # On a terminal only what changed is redrawn after each command, and
+    # messages are printed below the board until the next redraw
+    renderer = None
+    if not args.quiet:
+        renderer = sumoku.render.Renderer(
+            diff=args.script is None and sys.stdout.isatty())
+        renderer.draw(state)
+    status = 0
+    if args.script is not None:
+        script = sys.stdin if args.script == '-' else open(args.script)
         try:
-            handle_command(state)
-            state.print_game()
+            run_script(state, script_commands(script), agent, args.ai,
+                       renderer, recorder)
         except IllegalCommandException, err:
-            print 'Error: {}'.format(err.message)
+            print >> sys.stderr, 'Error: {}'.format(err.message)
+            status = 1
+        if script is not sys.stdin:
+            script.close()
+    else:
+        run_interactive(state, agent, args.ai, renderer, recorder)
+
+    agent.close()
+    if book is not None:
+        book.close()
+    if recorder is not None:
+        recorder.close()
 
     print 'Final Scores:'
     for player in xrange(state.players):
         print 'P{} {:05}'.format(player + 1, state.scores[player])
+    return status
 
 if __name__ == "__main__":
     play_sumoku()
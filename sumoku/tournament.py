@@ -0,0 +1,497 @@
+#!/usr/bin/env python
+""" Tournaments between agent policies, kept in a SQLite database
+
+A tournament plays the agents of simulate.AGENTS against each other at
+every player count and key number it is given. Every game is scheduled,
+with its seats and seed, before it is played, and its result is stored
+at most once, so a tournament stopped part way, even by a crash, carries
+on where it left off and never plays a game twice.
+
+In a round robin each round seats every group of agents, or all of them
+repeated to fill the seats when there are too few, once in each order
+around the table. A Swiss round instead groups agents of similar rating,
+avoiding two player pairings already played where it can, so its rounds
+are scheduled one at a time as the results of the last come in.
+
+Agents are rated by Elo, each game counting as a match between every
+pair of different agents at the table. Ratings are updated as results
+are stored, taking the games in the order they were scheduled, so they
+don't depend on the order in which workers finished them.
+"""
+import argparse
+import collections
+import itertools
+import json
+import multiprocessing
+import random
+import sqlite3
+import time
+import sumoku.simulate
+import sumoku.zobrist
+
+ROUND_ROBIN = 'round-robin'
+SWISS = 'swiss'
+FORMATS = [ROUND_ROBIN, SWISS]
+
+INITIAL_RATING = 1500.0
+# Most a rating moves after a game against one other agent
+K_FACTOR = 32.0
+# Results stored per transaction, and longest to wait before storing them
+BATCH_SIZE = 64
+BATCH_SECONDS = 5.0
+
+Settings = collections.namedtuple('Settings', ['name', 'format', 'agents',
+                                               'player_counts',
+                                               'key_numbers', 'rounds',
+                                               'hand_size', 'seed'])
+
+# A scheduled game, its seats holding one agent name per player
+Game = collections.namedtuple('Game', ['game_id', 'round', 'players',
+                                       'key_number', 'seats', 'seed'])
+
+Standing = collections.namedtuple('Standing', ['agent', 'rating', 'games',
+                                               'wins'])
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tournaments (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    settings TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    tournament INTEGER NOT NULL REFERENCES tournaments (id),
+    round INTEGER NOT NULL,
+    number INTEGER NOT NULL,
+    players INTEGER NOT NULL,
+    key_number INTEGER NOT NULL,
+    seats TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    scores TEXT,
+    turns INTEGER,
+    finished REAL,
+    UNIQUE (tournament, round, number)
+);
+CREATE INDEX IF NOT EXISTS unfinished ON games (tournament, finished);
+CREATE TABLE IF NOT EXISTS ratings (
+    tournament INTEGER NOT NULL REFERENCES tournaments (id),
+    agent TEXT NOT NULL,
+    rating REAL NOT NULL,
+    games INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    PRIMARY KEY (tournament, agent)
+);
+CREATE TABLE IF NOT EXISTS rated (
+    tournament INTEGER PRIMARY KEY REFERENCES tournaments (id),
+    game INTEGER NOT NULL
+);
+'''
+
+
+def connect(path):
+    """ Open a tournament database, creating its tables if need be """
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def create(connection, settings):
+    """ Start a tournament, scheduling its games, and return its id
+
+    A tournament of the same name already started with the same settings
+    is resumed instead. A seed of None is picked at random and stored.
+    """
+    for agent in settings.agents:
+        sumoku.simulate.get_agent(agent)
+    if settings.format not in FORMATS:
+        raise ValueError('Unknown format {}'.format(settings.format))
+    tournament_id = find(connection, settings.name)
+    if tournament_id is not None:
+        stored = get_settings(connection, tournament_id)
+        if settings.seed is None:
+            settings = settings._replace(seed=stored.seed)
+        # Compare the settings as they would be stored
+        if stored != Settings(**json.loads(json.dumps(settings._asdict()))):
+            raise ValueError('Tournament {} has other settings'
+                             .format(settings.name))
+        return tournament_id
+
+    if settings.seed is None:
+        settings = settings._replace(seed=random.getrandbits(63))
+    with connection:
+        cursor = connection.execute(
+            'INSERT INTO tournaments (name, settings) VALUES (?, ?)',
+            (settings.name, json.dumps(settings._asdict())))
+        tournament_id = cursor.lastrowid
+        connection.executemany(
+            'INSERT INTO ratings VALUES (?, ?, ?, 0, 0)',
+            [(tournament_id, agent, INITIAL_RATING)
+             for agent in sorted(set(settings.agents))])
+        if settings.format == ROUND_ROBIN:
+            for number in xrange(settings.rounds):
+                schedule(connection, tournament_id, settings, number,
+                         round_robin(settings))
+    return tournament_id
+
+
+def find(connection, name):
+    """ Return the id of a tournament given its name, or None """
+    row = connection.execute('SELECT id FROM tournaments WHERE name = ?',
+                             (name,)).fetchone()
+    return None if row is None else row[0]
+
+
+def get_settings(connection, tournament_id):
+    """ Return the Settings of a tournament """
+    row = connection.execute('SELECT settings FROM tournaments WHERE id = ?',
+                             (tournament_id,)).fetchone()
+    if row is None:
+        raise ValueError('No tournament {}'.format(tournament_id))
+    return Settings(**json.loads(row[0]))
+
+
+def fill(agents, players):
+    """ Return the groups of agents seated at a table of players """
+    if len(agents) >= players:
+        return list(itertools.combinations(agents, players))
+    return [tuple(itertools.islice(itertools.cycle(agents), players))]
+
+
+def rotations(group):
+    """ Return a group seated starting from each of its members """
+    return [group[start:] + group[:start] for start in xrange(len(group))]
+
+
+def round_robin(settings):
+    """ Return the tables of a round robin round as (players, key number,
+    seats) """
+    return [(players, key_number, seats)
+            for players in settings.player_counts
+            for key_number in settings.key_numbers
+            for group in fill(settings.agents, players)
+            for seats in rotations(group)]
+
+
+def swiss(settings, number, ratings, met):
+    """ Return the tables of a Swiss round as (players, key number,
+    seats)
+
+    Agents are ranked by rating and seated in groups of neighbours, the
+    seats rotating from round to round. Two player pairs try not to
+    repeat one in met, a set of frozensets. Agents left over when the
+    groups don't come out even sit out that table size.
+    """
+    ranked = sorted(settings.agents, key=lambda agent: (-ratings[agent],
+                                                        agent))
+    tables = []
+    for players in settings.player_counts:
+        if len(ranked) < players:
+            groups = fill(ranked, players)
+        elif players == 2:
+            groups = pairings(ranked, met)
+        else:
+            groups = [tuple(ranked[start:start + players])
+                      for start in xrange(0, len(ranked) - players + 1,
+                                          players)]
+        for group in groups:
+            seats = rotations(group)[number % len(group)]
+            tables.extend((players, key_number, seats)
+                          for key_number in settings.key_numbers)
+    return tables
+
+
+def pairings(ranked, met):
+    """ Pair ranked agents, each with the best ranked one left it hasn't
+    met, or the best ranked one left if it has met them all """
+    left = list(ranked)
+    pairs = []
+    while len(left) > 1:
+        first = left.pop(0)
+        other = next((agent for agent in left
+                      if frozenset((first, agent)) not in met), left[0])
+        left.remove(other)
+        pairs.append((first, other))
+    return pairs
+
+
+def schedule(connection, tournament_id, settings, number, tables):
+    """ Store the games of a round, each seeded from the tournament """
+    seed = sumoku.zobrist.mix(settings.seed ^ sumoku.zobrist.mix(number))
+    seeds = sumoku.simulate.game_seeds(len(tables), seed)
+    connection.executemany(
+        'INSERT OR IGNORE INTO games (tournament, round, number, players, '
+        'key_number, seats, seed) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(tournament_id, number, index, players, key_number,
+          json.dumps(list(seats)), seeds[index])
+         for index, (players, key_number, seats) in enumerate(tables)])
+
+
+def unfinished(connection, tournament_id):
+    """ Return the scheduled Games not yet played """
+    return [Game(game_id, number, players, key_number, json.loads(seats),
+                 seed)
+            for game_id, number, players, key_number, seats, seed
+            in connection.execute(
+                'SELECT id, round, players, key_number, seats, seed '
+                'FROM games WHERE tournament = ? AND finished IS NULL '
+                'ORDER BY id', (tournament_id,))]
+
+
+def rounds_scheduled(connection, tournament_id):
+    """ Return the number of rounds scheduled so far """
+    row = connection.execute('SELECT MAX(round) FROM games '
+                             'WHERE tournament = ?',
+                             (tournament_id,)).fetchone()
+    return 0 if row[0] is None else row[0] + 1
+
+
+def pairs_met(connection, tournament_id):
+    """ Return the two player pairings already scheduled """
+    return set(frozenset(json.loads(seats)) for (seats,) in
+               connection.execute('SELECT seats FROM games WHERE '
+                                  'tournament = ? AND players = 2',
+                                  (tournament_id,)))
+
+
+def ratings(connection, tournament_id):
+    """ Return the rating of each agent """
+    return dict(connection.execute('SELECT agent, rating FROM ratings '
+                                   'WHERE tournament = ?',
+                                   (tournament_id,)))
+
+
+def rating_changes(ratings, seats, scores):
+    """ Return how much a game moves the rating of each agent in it
+
+    Each pair of different agents at the table counts as a match, won by
+    the higher score, scaled so that a game moves a rating no more than
+    one match would.
+    """
+    changes = dict((agent, 0.0) for agent in seats)
+    weight = K_FACTOR / (len(seats) - 1)
+    for first, second in itertools.combinations(xrange(len(seats)), 2):
+        agent, other = seats[first], seats[second]
+        if agent == other:
+            continue
+        expected = 1.0 / (1.0 + 10.0 ** ((ratings[other] - ratings[agent]) /
+                                         400.0))
+        actual = cmp(scores[first], scores[second]) * 0.5 + 0.5
+        changes[agent] = changes[agent] + weight * (actual - expected)
+        changes[other] = changes[other] - weight * (actual - expected)
+    return changes
+
+
+def record_result(connection, game, result):
+    """ Store the GameResult of a Game unless it was already stored """
+    connection.execute(
+        'UPDATE games SET scores = ?, turns = ?, finished = ? '
+        'WHERE id = ? AND finished IS NULL',
+        (json.dumps(result.scores), result.turns, time.time(), game.game_id))
+
+
+def rate(connection, tournament_id):
+    """ Update the ratings with the results stored since they were last
+    rated, and return the ratings
+
+    Games are rated in the order they were scheduled, up to the first one
+    not yet played, so the ratings don't depend on the order workers
+    finish games in. The last game rated is stored with the ratings, so
+    calling this in the transaction storing results keeps both in step.
+    """
+    row = connection.execute('SELECT game FROM rated WHERE tournament = ?',
+                             (tournament_id,)).fetchone()
+    current = {}
+    games = {}
+    wins = {}
+    for agent, rating, played, won in connection.execute(
+            'SELECT agent, rating, games, wins FROM ratings '
+            'WHERE tournament = ?', (tournament_id,)):
+        # Without a last game rated, rate every game from the start
+        current[agent] = INITIAL_RATING if row is None else rating
+        games[agent] = 0 if row is None else played
+        wins[agent] = 0 if row is None else won
+    last = 0 if row is None else row[0]
+
+    rated = last
+    for game_id, seats, scores in connection.execute(
+            'SELECT id, seats, scores FROM games WHERE tournament = ? AND '
+            'id > ? ORDER BY id', (tournament_id, last)):
+        if scores is None:
+            break
+        seats = json.loads(seats)
+        scores = json.loads(scores)
+        best = max(scores)
+        winners = set(agent for agent, score in zip(seats, scores)
+                      if score == best)
+        for agent, change in rating_changes(current, seats,
+                                            scores).iteritems():
+            current[agent] = current[agent] + change
+            games[agent] = games[agent] + 1
+            wins[agent] = wins[agent] + int(agent in winners)
+        rated = game_id
+    if row is None or rated != last:
+        connection.executemany(
+            'UPDATE ratings SET rating = ?, games = ?, wins = ? '
+            'WHERE tournament = ? AND agent = ?',
+            [(current[agent], games[agent], wins[agent], tournament_id,
+              agent) for agent in sorted(current)])
+        connection.execute('INSERT OR REPLACE INTO rated VALUES (?, ?)',
+                           (tournament_id, rated))
+    return current
+
+
+def _play_task(task):
+    """ Play one scheduled Game, returning it with its GameResult """
+    game, hand_size = task
+    return game, sumoku.simulate.play_game(game.players, hand_size,
+                                           game.key_number, game.seats,
+                                           game.seed)
+
+
+def play_games(games, hand_size, workers=1):
+    """ Play Games, yielding each with its GameResult as it finishes """
+    tasks = [(game, hand_size) for game in games]
+    if workers == 1:
+        for task in tasks:
+            yield _play_task(task)
+        return
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        for played in pool.imap_unordered(_play_task, tasks):
+            yield played
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def run(connection, tournament_id, workers=1, limit=None,
+        batch_size=BATCH_SIZE, batch_seconds=BATCH_SECONDS, callback=None):
+    """ Play the games of a tournament not yet played, returning how many
+    were played
+
+    Results are stored batch_size at a time, or after batch_seconds,
+    whichever comes first, and the ratings updated with them in the same
+    transaction. Swiss rounds are scheduled as the last one finishes. No
+    more than limit games are played if it is given. callback, if given,
+    is called with each Game and its GameResult.
+    """
+    settings = get_settings(connection, tournament_id)
+    played = 0
+    while limit is None or played < limit:
+        games = unfinished(connection, tournament_id)
+        if len(games) == 0:
+            number = rounds_scheduled(connection, tournament_id)
+            if settings.format != SWISS or number >= settings.rounds:
+                break
+            with connection:
+                schedule(connection, tournament_id, settings, number,
+                         swiss(settings, number,
+                               rate(connection, tournament_id),
+                               pairs_met(connection, tournament_id)))
+            continue
+        if limit is not None:
+            games = games[:limit - played]
+
+        stored = 0
+        flushed = time.time()
+        try:
+            for game, result in play_games(games, settings.hand_size,
+                                           workers):
+                record_result(connection, game, result)
+                played = played + 1
+                stored = stored + 1
+                if callback is not None:
+                    callback(game, result)
+                if stored >= batch_size or \
+                        time.time() - flushed >= batch_seconds:
+                    rate(connection, tournament_id)
+                    connection.commit()
+                    stored = 0
+                    flushed = time.time()
+        finally:
+            rate(connection, tournament_id)
+            connection.commit()
+    return played
+
+
+def standings(connection, tournament_id):
+    """ Return the Standing of each agent, best rated first """
+    return [Standing(*row) for row in connection.execute(
+        'SELECT agent, rating, games, wins FROM ratings '
+        'WHERE tournament = ? ORDER BY rating DESC, agent',
+        (tournament_id,))]
+
+
+def progress(connection, tournament_id):
+    """ Return how many games have been played and scheduled """
+    return connection.execute(
+        'SELECT COUNT(finished), COUNT(*) FROM games WHERE tournament = ?',
+        (tournament_id,)).fetchone()
+
+
+def parse_args():
+    """ Parse command line arguments """
+    parser = argparse.ArgumentParser(
+        description='Sumoku tournaments between agent policies')
+    parser.add_argument('database', help='SQLite database to keep it in')
+    parser.add_argument('--name', default='tournament',
+                        help='name of the tournament, to start or resume')
+    parser.add_argument('--format', default=ROUND_ROBIN, choices=FORMATS,
+                        help='how games are scheduled')
+    parser.add_argument('--agents', default=['greedy', 'random'], nargs='+',
+                        choices=sorted(sumoku.simulate.AGENTS),
+                        help='agents taking part')
+    parser.add_argument('--players', default=[2, 3, 4, 5], type=int,
+                        nargs='+', choices=range(2, 6),
+                        help='player counts to play at')
+    parser.add_argument('--key-numbers', default=[3, 4, 5], type=int,
+                        nargs='+', choices=[3, 4, 5],
+                        help='key numbers to play with')
+    parser.add_argument('--rounds', default=1, type=int,
+                        help='number of rounds')
+    parser.add_argument('--hand-size', default=8, type=int,
+                        help='number of tiles in hand')
+    parser.add_argument('--seed', default=None, type=int,
+                        help='seed for the whole tournament')
+    parser.add_argument('--workers', default=multiprocessing.cpu_count(),
+                        type=int, help='number of worker processes')
+    parser.add_argument('--standings', action='store_true',
+                        help='print the standings without playing')
+    return parser.parse_args()
+
+
+def main():
+    """ Start or resume a tournament and print its standings as JSON """
+    args = parse_args()
+    connection = connect(args.database)
+    if args.standings:
+        tournament_id = find(connection, args.name)
+        if tournament_id is None:
+            raise SystemExit('No tournament {}'.format(args.name))
+    else:
+        tournament_id = create(connection, Settings(
+            args.name, args.format, args.agents, args.players,
+            args.key_numbers, args.rounds, args.hand_size, args.seed))
+        start = time.time()
+        try:
+            played = run(connection, tournament_id, args.workers)
+        except KeyboardInterrupt:
+            played = None
+        elapsed = max(time.time() - start, 1e-9)
+        if played is not None:
+            print 'Played {} games in {:.1f}s, {:.1f} per second'.format(
+                played, elapsed, played / elapsed)
+    finished, scheduled = progress(connection, tournament_id)
+    print json.dumps({
+        'played': finished, 'scheduled': scheduled,
+        'standings': [dict(standing._asdict()) for standing
+                      in standings(connection, tournament_id)]},
+        indent=2, sort_keys=True)
+    connection.close()
+
+if __name__ == "__main__":
+    main()
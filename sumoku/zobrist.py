@@ -0,0 +1,139 @@
+""" Zobrist hashing of game positions and a transposition table """
+
+MASK = (1 << 64) - 1
+
+# Kinds of thing a key can be made for
+KIND_BOARD = 0
+KIND_HAND = 1
+KIND_PLAYER = 2
+KIND_KEY_NUMBER = 3
+
+_KEYS = {}
+
+
+def mix(value):
+    """ Scramble an integer into a well distributed 64 bit key """
+    # This is the splitmix64 finalizer
+    value = (value + 0x9E3779B97F4A7C15) & MASK
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK
+    return value ^ (value >> 31)
+
+
+def _key(kind, value):
+    """ Return the key for a thing, the same in every process and run """
+    key = _KEYS.get((kind, value))
+    if key is None:
+        code = kind
+        for part in value:
+            code = (code << 20) | (part & 0xFFFFF)
+        key = mix(code)
+        _KEYS[(kind, value)] = key
+    return key
+
+
+def board_key(tile):
+    """ Return the key of a tile (number, color, x, y) on the board """
+    return _key(KIND_BOARD, tile)
+
+
+def hand_key(tile):
+    """ Return the key of a tile in a hand
+
+    A 6 and a 9 share a key, as either can be flipped to the other.
+    """
+    if tile[0] == 9:
+        return _key(KIND_HAND, (6, tile[1]))
+    return _key(KIND_HAND, (tile[0], tile[1]))
+
+
+def hand_hash(hand):
+    """ Return the hash of a hand of tiles
+
+    Hand keys are summed rather than xored, so that holding two copies of
+    a tile is different from holding none.
+    """
+    value = 0
+    for tile in hand:
+        value = value + hand_key(tile)
+    return value & MASK
+
+
+def board_hash(tiles):
+    """ Return the hash of played tiles """
+    value = 0
+    for tile in tiles:
+        value = value ^ board_key(tile)
+    return value
+
+
+def player_key(player):
+    """ Return the key for whose turn it is """
+    return _key(KIND_PLAYER, (player,))
+
+
+def key_number_key(key_number):
+    """ Return the key for the key number """
+    return _key(KIND_KEY_NUMBER, (key_number,))
+
+
+class TranspositionTable(object):
+    """ A bounded table of values stored by position hash
+
+    Each hash maps to a bucket of two slots. The first keeps whichever
+    entry was searched deepest, the second always takes the newest entry,
+    so deep results survive while recent ones are still found.
+    """
+
+    def __init__(self, size=1 << 16):
+        """ Construct a table holding up to size entries """
+        self.buckets = max(1, size // 2)
+        self.deep = [None] * self.buckets
+        self.recent = [None] * self.buckets
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def __len__(self):
+        return sum(1 for entry in self.deep if entry is not None) + \
+            sum(1 for entry in self.recent if entry is not None)
+
+    def get(self, key):
+        """ Return (depth, value) stored for a hash, or None """
+        index = key % self.buckets
+        for slots in (self.deep, self.recent):
+            entry = slots[index]
+            if entry is not None and entry[0] == key:
+                self.hits = self.hits + 1
+                return entry[1:]
+        self.misses = self.misses + 1
+        return None
+
+    def put(self, key, value, depth=0):
+        """ Store a value for a hash, searched to a depth """
+        index = key % self.buckets
+        entry = (key, depth, value)
+        self.stores = self.stores + 1
+        deep = self.deep[index]
+        if deep is None or deep[0] == key or depth >= deep[1]:
+            self.deep[index] = entry
+            if deep is None or deep[0] == key:
+                return
+            # The entry it displaced moves to the recent slot
+            entry = deep
+        recent = self.recent[index]
+        if recent is not None and recent[0] not in (key, entry[0]):
+            self.replacements = self.replacements + 1
+        self.recent[index] = entry
+
+    def clear(self):
+        """ Remove every entry, keeping the counters """
+        self.deep = [None] * self.buckets
+        self.recent = [None] * self.buckets
+
+    def statistics(self):
+        """ Return the table's counters """
+        return {'hits': self.hits, 'misses': self.misses,
+                'stores': self.stores, 'replacements': self.replacements,
+                'entries': len(self), 'size': self.buckets * 2}
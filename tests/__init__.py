@@ -0,0 +1,12 @@
+""" Unit tests for sumoku
+
+Tables cached on disk while testing go to a temporary directory, not the
+user's cache, and are removed when the tests finish.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+os.environ['SUMOKU_CACHE'] = tempfile.mkdtemp()
+atexit.register(shutil.rmtree, os.environ['SUMOKU_CACHE'], True)
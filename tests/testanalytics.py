@@ -0,0 +1,137 @@
+""" A unit test for statistics over records """
+import os
+import random
+import shutil
+import StringIO
+import tempfile
+import unittest
+import sumoku.game
+import sumoku.moves
+from sumoku import analytics, record
+
+
+def record_games(seeds, players=2, finish=True):
+    """ Record games played with the first legal move, placing and taking
+    back a tile before each play, and return the record """
+    stream = StringIO.StringIO()
+    writer = record.RecordWriter(stream)
+    for seed in seeds:
+        rng = random.Random(seed)
+        header = record.GameHeader(players, 6, 3 + seed % 3, seed,
+                                   record.shuffled_tiles(rng))
+        writer.write(header)
+        state = record.new_game(header)
+        while not state.game_complete():
+            if not finish and len(state.tiles) == 0:
+                break
+            if len(state.cur_hand()) > 0 and \
+                    state.board.get_tile(51, 19) is None:
+                for event in (('place', 0, 51, 19), ('remove', 51, 19)):
+                    writer.write(record.apply_event(state, event))
+            move = next(iter(sumoku.moves.generate_moves(
+                state.board, state.cur_hand(), state.key_number)), None)
+            for event in record.move_events(state, move):
+                writer.write(event)
+    return stream.getvalue()
+
+
+class TestAnalytics(unittest.TestCase):
+    """ Test summarizing and aggregating recorded games """
+
+    def test_summaries(self):
+        """ Test games are followed as a replay of them would be """
+        data = record_games([1, 2, 3], players=3)
+        replayed = list(record.replay(record.read_binary(
+            StringIO.StringIO(data))))
+        summaries = list(analytics.summaries(record.read_binary(
+            StringIO.StringIO(data))))
+        self.assertEqual(len(summaries), 3)
+        for summary, (header, state) in zip(summaries, replayed):
+            self.assertTrue(summary.finished)
+            self.assertEqual(list(summary.scores), state.scores)
+            self.assertEqual(summary.key_number, header.key_number)
+            self.assertEqual(summary.tiles, len(state.played_tiles))
+        events = [event[0] for event in
+                  record.read_binary(StringIO.StringIO(data))
+                  if not isinstance(event, record.GameHeader)]
+        self.assertEqual(sum(summary.removes for summary in summaries),
+                         events.count('remove'))
+        self.assertEqual(sum(summary.flips for summary in summaries),
+                         sum(1 for _, state in replayed
+                             for tile in state.played_tiles if tile[0] == 9))
+
+        # A record ending part way through a game
+        data = record_games([4], finish=False)
+        summary, = analytics.summaries(record.read_binary(
+            StringIO.StringIO(data)))
+        self.assertFalse(summary.finished)
+        self.assertEqual(analytics.analyze(record.read_binary(
+            StringIO.StringIO(data))).report()['unfinished'], 1)
+
+    def test_flips(self):
+        """ Test only tiles played showing a 9 count as flipped """
+        order = [tile for tile in sumoku.game.generate_tiles()
+                 if tile not in ((6, 0), (6, 1))] + [(6, 1), (6, 0)]
+        header = record.GameHeader(2, 6, 3, None, order)
+        state = record.new_game(header)
+        events = []
+
+        def play(*moves):
+            """ Make and record move events """
+            for event in moves:
+                events.append(record.apply_event(state, event))
+
+        # Flipped twice, back to a 6, then flipped and taken back off the
+        # board before the other 6 is played unflipped
+        self.assertEqual(state.cur_hand()[0], (6, 0))
+        play(('flip', 0), ('flip', 0), ('flip', 0), ('place', 0, 51, 19),
+             ('remove', 51, 19))
+        play(('place', list(state.cur_hand()).index((6, 1)), 51, 19),
+             ('submit',), ('submit',))
+        # The 9 left in hand is played
+        play(('place', list(state.cur_hand()).index((9, 0)), 51, 18),
+             ('submit',))
+        self.assertEqual(events.count(('flip', 0)), 3)
+
+        tracker = analytics.GameTracker(header)
+        for event in events:
+            tracker.event(event)
+        summary = tracker.summary()
+        self.assertEqual(summary.tiles, 2)
+        self.assertEqual(summary.flips, 1)
+        self.assertEqual(summary.removes, 1)
+        self.assertEqual(list(summary.scores), state.scores)
+
+    def test_merge(self):
+        """ Test Stats of parts of the games merge to those of all of
+        them """
+        parts = [record_games([1, 2]), record_games([3]),
+                 record_games([4, 5, 6])]
+        whole = analytics.analyze(record.read_binary(
+            StringIO.StringIO(''.join(parts))))
+        merged = analytics.Stats()
+        for part in parts:
+            merged.merge(analytics.analyze(record.read_binary(
+                StringIO.StringIO(part))))
+        self.assertEqual(merged.report(), whole.report())
+
+        report = whole.report()
+        self.assertEqual(report['games'], 6)
+        self.assertEqual(sorted(report['key_numbers']), [3, 4, 5])
+        self.assertEqual(sum(report['players'][2]['win_share']), 1.0)
+
+        # Files are analyzed the same by a pool of workers
+        directory = tempfile.mkdtemp()
+        try:
+            paths = []
+            for index, part in enumerate(parts):
+                paths.append(os.path.join(directory, '{}.rec'.format(index)))
+                with open(paths[-1], 'wb') as stream:
+                    stream.write(part)
+            self.assertEqual(analytics.analyze_files(paths, 2).report(),
+                             report)
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
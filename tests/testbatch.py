@@ -0,0 +1,94 @@
+""" A unit test for scoring batches of plays """
+import random
+import unittest
+import benchmarks.positions
+from sumoku import batch, game, moves
+
+
+def expected(play, tiles, key_number):
+    """ Return (score, completed, message) as score_play finds them """
+    try:
+        score, completed = game.score_play(list(play), tiles, key_number)
+        return (score, completed, None)
+    except game.InvalidPlayException, err:
+        return (0, False, err.message)
+
+
+def candidate_plays(state, rng, count):
+    """ Return the legal plays of a position followed by plays of random
+    tiles near the tiles on the board, most of them invalid """
+    plays = [list(move.tiles) for move in moves.state_moves(state)]
+    cells = [(tile[2], tile[3]) for tile in state.board]
+    while len(plays) < count:
+        x, y = rng.choice(cells)
+        x = x + rng.randint(-3, 3)
+        y = y + rng.randint(-3, 3)
+        step = rng.choice([(1, 0), (0, 1)])
+        play = []
+        for index in xrange(rng.randint(1, 4)):
+            # Leave a gap or step out of line now and then
+            index = index + (rng.random() < 0.1)
+            play.append((rng.randint(1, 9), rng.randint(0, 5),
+                         x + step[0] * index + (rng.random() < 0.05),
+                         y + step[1] * index))
+        plays.append(play)
+    return plays
+
+
+class TestBatch(unittest.TestCase):
+    """ Test scoring many plays at once """
+
+    def check(self, vectorize):
+        """ Test a batch scores plays exactly like score_play """
+        rng = random.Random(1)
+        for _, state in benchmarks.positions.positions():
+            plays = candidate_plays(state, rng, 1500)
+            copies = [list(play) for play in plays]
+            played = list(state.board)
+            results = batch.score_plays(plays, played, state.key_number,
+                                        vectorize)
+            self.assertEqual(plays, copies)
+            self.assertEqual(len(results), len(plays))
+            for play, result in zip(plays, results):
+                self.assertEqual((result.score, result.completed,
+                                  result.message),
+                                 expected(play, state.board,
+                                          state.key_number))
+                self.assertEqual(result.reason is None,
+                                 result.message is None)
+
+    def test_score_plays(self):
+        """ Test scoring plays one at a time """
+        self.check(False)
+
+    @unittest.skipIf(batch.numpy is None, 'NumPy is not installed')
+    def test_vectorized(self):
+        """ Test scoring plays with NumPy """
+        self.check(True)
+
+    def test_reasons(self):
+        """ Test invalid plays are given the reason they are invalid """
+        tiles = [(1, 0, 5, 5), (2, 1, 6, 5)]
+        plays = [[],
+                 [(3, 2, 7, 5)],
+                 [(3, 2, 7, 5), (1, 3, 5, 6)],
+                 [(3, 2, 6, 5)],
+                 [(3, 2, 7, 5), (3, 3, 9, 5)],
+                 [(1, 2, 7, 5)],
+                 [(3, 0, 7, 5)]]
+        self.assertEqual([result.reason for result in
+                          batch.score_plays(plays, tiles, 3)],
+                         [None, None, batch.NOT_IN_LINE, batch.OCCUPIED,
+                          batch.GAP, batch.SUM, batch.COLOR])
+        self.assertEqual(batch.score_plays([[(3, 0, 0, 0)], [(4, 0, 0, 0)]],
+                                           [], 3),
+                         [(3, False, None, None),
+                          (0, False, batch.SUM, 'Sum 4 not divisible by 3')])
+
+    @unittest.skipIf(batch.numpy is not None, 'NumPy is installed')
+    def test_no_numpy(self):
+        """ Test insisting on NumPy fails without it """
+        self.assertRaises(ImportError, batch.score_plays, [[]], [], 3, True)
+
+if __name__ == '__main__':
+    unittest.main()
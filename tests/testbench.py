@@ -0,0 +1,33 @@
+""" A unit test for the benchmark suite """
+import unittest
+from benchmarks import bench, positions
+
+
+class TestBench(unittest.TestCase):
+    """ Test the benchmark harness """
+
+    def test_positions(self):
+        """ Test positions have the tiles asked for """
+        state = positions.build_position(20)
+        self.assertTrue(len(state.played_tiles) >= 20)
+        self.assertFalse(state.game_complete())
+        again = positions.build_position(20)
+        self.assertEqual(again.played_tiles, state.played_tiles)
+
+    def test_run(self):
+        """ Test a benchmark is measured """
+        benchmarks = bench.stage_benchmarks('early',
+                                            positions.build_position(10))
+        names = [benchmark.name for benchmark in benchmarks]
+        self.assertTrue('score_play/early' in names)
+        results = bench.run(benchmarks[:1], min_time=0.01, repeat=1)
+        self.assertTrue(results[names[0]]['ops_per_sec'] > 0)
+
+    def test_compare(self):
+        """ Test regressions beyond the threshold are found """
+        baseline = {'a': {'ops_per_sec': 100.0},
+                    'b': {'ops_per_sec': 100.0}}
+        results = {'a': {'ops_per_sec': 95.0}, 'b': {'ops_per_sec': 80.0},
+                   'c': {'ops_per_sec': 1.0}}
+        self.assertEqual(bench.compare(results, baseline, 0.1),
+                         [('b', 100.0, 80.0)])
@@ -0,0 +1,118 @@
+""" A unit test for the sumoku.board module """
+import unittest
+from sumoku import board, game
+
+
+class TestBoard(unittest.TestCase):
+    """ Test the indexed board """
+
+    def test_find_tile(self):
+        """ Test looking up tiles by position """
+        tile = (1, 0, 3, 4)
+        played = board.Board([tile])
+        self.assertEqual(len(played), 1)
+        self.assertTrue(tile in played)
+        self.assertEqual(played.find_tile(3, 4), tile)
+        self.assertEqual(played.get_tile(4, 3), None)
+        self.assertRaises(game.InvalidPlayException, played.find_tile, 4, 3)
+        self.assertEqual(game.find_tile(3, 4, played), tile)
+
+    def test_add_remove_tile(self):
+        """ Test adding and removing tiles """
+        played = board.Board()
+        tile = (1, 0, 0, 0)
+        played.add_tile(tile)
+        self.assertRaises(game.InvalidPlayException, played.add_tile,
+                          (2, 1, 0, 0))
+        played.remove_tile(tile)
+        self.assertEqual(len(played), 0)
+        self.assertRaises(game.InvalidPlayException, played.remove_tile, tile)
+
+    def test_score_play(self):
+        """ Test that scoring against a board matches scoring a list """
+        tiles = [(1, 0, 0, 0), (2, 1, 1, 0), (2, 1, 0, 1)]
+        played = board.Board(tiles)
+        self.assertEqual(game.score_play([(3, 2, 2, 0)], played, 3),
+                         game.score_play([(3, 2, 2, 0)], tiles, 3))
+        self.assertRaises(game.InvalidPlayException, game.score_play,
+                          [(1, 2, 2, 0)], played, 3)
+
+        # The board is left untouched after scoring
+        self.assertEqual(len(played), 3)
+        self.assertEqual(played.get_tile(2, 0), None)
+
+    def test_segments(self):
+        """ Test the cached line segments follow additions and removals """
+        tiles = [(1, 0, 0, 0), (2, 1, 1, 0), (4, 2, 2, 0), (5, 3, 1, 1)]
+        played = board.Board(tiles)
+        self.assertEqual(played.segment(0, 0, True), (0, 2, 7, 7))
+        self.assertEqual(played.segment(1, 1, False), (0, 1, 7, 10))
+        self.assertEqual(played.line_through(3, 0, True), (7, 7, 3))
+        self.assertEqual(played.line_through(3, 0, False), (0, 0, 0))
+
+        played.remove_tile((2, 1, 1, 0))
+        self.assertEqual(played.segment(0, 0, True), (0, 0, 1, 1))
+        self.assertEqual(played.segment(2, 0, True), (2, 2, 4, 4))
+        self.assertEqual(played.segment(1, 1, False), (1, 1, 5, 8))
+        self.assertEqual(played.line_through(1, 0, True), (5, 5, 2))
+
+        # A repeated color is flagged in the mask
+        played.add_tile((2, 0, 1, 0))
+        self.assertEqual(board.repeated_color(
+            played.segment(0, 0, True)[3]), 0)
+        self.assertRaises(game.InvalidPlayException, game.score_play,
+                          [(3, 4, 3, 0)], played, 3)
+
+    def test_frontier(self):
+        """ Test the frontier follows additions, removals and copies """
+        def expected(played):
+            """ Work out the frontier of a board from scratch """
+            cells = {}
+            for x in xrange(game.MIN_X, game.MAX_X + 1):
+                for y in xrange(game.MIN_Y, game.MAX_Y + 1):
+                    if played.get_tile(x, y) is None:
+                        lines = (played.line_through(x, y, True),
+                                 played.line_through(x, y, False))
+                        if lines[0][2] > 0 or lines[1][2] > 0:
+                            cells[(x, y)] = lines
+            return cells
+
+        tiles = [(1, 0, 0, 0), (2, 1, 1, 0), (4, 2, 2, 0), (5, 3, 1, 1)]
+        played = board.Board(tiles)
+        self.assertEqual(played.frontier, expected(played))
+        self.assertEqual(played.frontier[(3, 0)], ((7, 7, 3), (0, 0, 0)))
+        self.assertFalse((0, 0) in played.frontier)
+
+        clone = played.copy()
+        clone.remove_tile((2, 1, 1, 0))
+        clone.add_tile((3, 4, 2, 1))
+        self.assertEqual(clone.frontier, expected(clone))
+        self.assertEqual(played.frontier, expected(played))
+
+        # Boards not keeping a frontier don't pay for it
+        self.assertEqual(board.Board(tiles, frontier=False).frontier, None)
+
+    def test_bounds(self):
+        """ Test boards of other sizes and without edges """
+        bounds = game.Bounds(0, 2, -1, 0)
+        self.assertTrue(bounds.contains(2, -1))
+        self.assertFalse(bounds.contains(3, 0))
+        self.assertEqual(bounds.limits(False), (-1, 0))
+        self.assertEqual(bounds.middle(), (1, -1))
+        self.assertEqual(game.UNBOUNDED.middle(), (0, 0))
+
+        # The frontier stops at the edges of the board
+        played = board.Board([(1, 0, 1, 0)], bounds=bounds)
+        self.assertEqual(sorted(played.frontier), [(0, 0), (1, -1), (2, 0)])
+
+        # Lines are followed however far from the origin they lie
+        tiles = [(number, number - 1, -1000 - number, -7)
+                 for number in xrange(1, 6)]
+        played = board.Board(tiles, bounds=game.UNBOUNDED)
+        self.assertEqual(sorted(played.complete_line(tiles[0], True)),
+                         sorted(tiles))
+        self.assertEqual(played.frontier[(-1006, -7)],
+                         ((15, 31, 5), (0, 0, 0)))
+        self.assertEqual(played.frontier[(-1003, -8)],
+                         ((0, 0, 0), (3, 4, 1)))
+        self.assertEqual(len(played.frontier), 12)
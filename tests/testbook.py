@@ -0,0 +1,82 @@
+""" A unit test for opening books """
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from sumoku import book, board, game, gamestate, mcts, moves, simulate
+
+
+class TestBook(unittest.TestCase):
+    """ Test building, canonicalizing and reading opening books """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'opening.book')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_canonical(self):
+        """ Test moved and recolored positions share a canonical hash """
+        played = board.Board([(1, 0, 10, 5), (2, 1, 11, 5)])
+        hand = [(3, 2), (6, 3), (4, 3)]
+        position = book.canonical(played, hand, 3)
+
+        # Moved, with red and green swapped and blue and yellow swapped
+        swap = {0: 1, 1: 0, 2: 3, 3: 2, 4: 4, 5: 5}
+        moved = board.Board([(1, 1, 30, 12), (2, 0, 31, 12)])
+        other = book.canonical(moved, [(9, 2), (3, 3), (4, 2)], 3)
+        self.assertEqual(other.key, position.key)
+        self.assertNotEqual(book.canonical(played, hand, 4).key,
+                            position.key)
+        # Colors on the board can't be swapped for others
+        self.assertNotEqual(book.canonical(moved, [(3, 0)], 3).key,
+                            book.canonical(played, [(3, 0)], 3).key)
+
+        # A play carries over to the other position
+        move = moves.Move(((3, 2, 12, 5),), 6, False)
+        packed = book.encode_move(position, move)
+        self.assertEqual(book.decode_move(other, packed),
+                         ((3, swap[2], 32, 12),))
+
+    def test_book(self):
+        """ Test a built book gives its plays back through mmap """
+        entries = book.build(6, 2, 8, 3, plies=2, iterations=10, seed=1)
+        self.assertTrue(len(entries) > 0)
+        book.write_book(self.path, entries)
+        self.assertEqual(os.path.getsize(self.path), book.HEADER.size +
+                         len(entries) * book.RECORD.size)
+
+        opening = book.OpeningBook(self.path)
+        try:
+            self.assertEqual(len(opening), len(entries))
+            for key, packed in entries.iteritems():
+                self.assertEqual(opening.lookup(key), packed)
+            self.assertEqual(opening.lookup(0), None)
+
+            # The first position of a game the book was built from is in
+            # it, with a legal play
+            _, state = book.opening_positions(2, 8, 3, 'greedy', 1,
+                                              simulate.game_seeds(6, 1)[0])[0]
+            move = opening.move(state)
+            self.assertFalse(move is None)
+            self.assertEqual(game.score_play(list(move.tiles), state.board,
+                                             3), (move.score, move.completed))
+            agent = mcts.MCTSAgent(None, 1, seed=1, book=opening)
+            self.assertEqual(agent(state), move)
+            state.stage_play(move.tiles)
+            state.submit_play()
+
+            # Positions not in the book get no play
+            self.assertEqual(opening.move(gamestate.GameState(
+                2, 8, 3, random.Random(99))), None)
+        finally:
+            opening.close()
+
+        with open(self.path, 'wb') as stream:
+            stream.write('not a book')
+        self.assertRaises(ValueError, book.OpeningBook, self.path)
+
+if __name__ == '__main__':
+    unittest.main()
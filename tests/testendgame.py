@@ -0,0 +1,78 @@
+""" A unit test for the endgame solver """
+import random
+import unittest
+from sumoku import endgame, game, gamestate, mcts, moves
+
+
+def endgame_state(seed, tiles_left, players=2):
+    """ Play a seeded game with four tile hands until the bag is empty and
+    no more than tiles_left tiles are held """
+    state = gamestate.GameState(players, 4, 3, random.Random(seed))
+    while len(state.tiles) > 0 or \
+            sum(len(hand) for hand in state.hands) > tiles_left:
+        state.apply(next(moves.generate_moves(state.board, state.cur_hand(),
+                                              state.key_number), None))
+    return state
+
+
+def minimax(state, root):
+    """ Return the paranoid margin of a position by searching every move """
+    if state.game_complete():
+        return endgame.margin(state, root)
+    values = []
+    for move in list(moves.generate_moves(state.board, state.cur_hand(),
+                                          state.key_number)) + [None]:
+        state.apply(move)
+        values.append(minimax(state, root))
+        state.undo()
+    if state.player == root:
+        return max(values)
+    return min(values)
+
+
+class TestEndgame(unittest.TestCase):
+    """ Test solving endgames """
+
+    def test_solve(self):
+        """ Test the solver finds the margin of an exhaustive search """
+        for seed, tiles_left, players in [(0, 3, 2), (7, 3, 2), (2, 5, 2),
+                                          (4, 3, 3), (0, 5, 3), (2, 5, 3)]:
+            state = endgame_state(seed, tiles_left, players)
+            root = state.player
+            packed = state.pack()
+            result = endgame.solve(state)
+            self.assertTrue(result.solved)
+            self.assertEqual(result.margin, minimax(state, root))
+            self.assertEqual(state.pack(), packed)
+
+            # Playing out the line reaches the margin
+            for move in result.line:
+                state.apply(move)
+            self.assertTrue(state.game_complete())
+            self.assertEqual(endgame.margin(state, root), result.margin)
+            self.assertEqual(result.move, result.line[0])
+            self.assertTrue(result.nodes_per_sec > 0)
+
+    def test_budget(self):
+        """ Test a search stopped by its budget still finds a move """
+        state = endgame_state(0, 8)
+        result = endgame.solve(state, nodes=10)
+        self.assertFalse(result.solved)
+        self.assertEqual(result.depth, 1)
+        self.assertEqual(game.score_play(list(result.move.tiles),
+                                         state.board, 3)[0],
+                         result.move.score)
+
+    def test_bag(self):
+        """ Test only endgames are solved """
+        state = gamestate.GameState(2, 8, 3, random.Random(1))
+        self.assertRaises(game.InvalidPlayException, endgame.solve, state)
+
+    def test_agent(self):
+        """ Test the computer player plays the solver's move """
+        state = endgame_state(7, 3)
+        agent = mcts.MCTSAgent(None, 1)
+        self.assertEqual(agent(state), endgame.solve(state).move)
+
+if __name__ == '__main__':
+    unittest.main()
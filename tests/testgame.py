@@ -1,4 +1,6 @@
 """ A unit test for the sumoku.game module """
+import itertools
+import random
 import unittest
 from sumoku import game
 
@@ -68,6 +70,14 @@ class TestGame(unittest.TestCase):
         self.assertTrue(keynum < 6)
         self.assertTrue(keynum > 2)
 
+    def test_tile_string(self):
+        """ Test translating tiles to strings """
+        self.assertEqual(game.tile_string((3, game.COLOR_GREEN)), 'green 3')
+        self.assertEqual(game.tile_string((9, game.COLOR_RED, 4, 5)),
+                         'red 9')
+        self.assertEqual(game.played_tile_string((9, game.COLOR_RED, 4, 5)),
+                         'red 9 at 4,5')
+
     def test_score_play(self):
         """ Test scoring a play """
         # Test various invalid plays
@@ -97,3 +107,95 @@ class TestGame(unittest.TestCase):
                                           (1, 2, 0, 2), (1, 3, 0, 3),
                                           (1, 4, 0, 4), (1, 5, 0, 5)], [], 3),
                          (6, True))
+
+    def test_tile_bag(self):
+        """ Test drawing from a seeded bag """
+        bag = game.TileBag(rng=random.Random(1))
+        self.assertEqual(len(bag), 96)
+        self.assertEqual(bag.count((1, 0)), 2)
+        tiles = [bag.draw() for _ in xrange(96)]
+        self.assertEqual(sorted(tiles), sorted(game.generate_tiles()))
+        self.assertEqual(bag.count((1, 0)), 0)
+        self.assertRaises(IndexError, bag.draw)
+
+        # The same seed draws the same tiles
+        again = game.TileBag(rng=random.Random(1))
+        self.assertEqual([game.draw_tile(again) for _ in xrange(96)], tiles)
+
+        # Tiles put back are drawn again
+        bag.put_back(tiles[-1])
+        self.assertEqual(bag.count(tiles[-1]), 1)
+        self.assertEqual(bag.draw(), tiles[-1])
+
+    def test_pack_tile(self):
+        """ Test packing tiles into ints """
+        for tile in [(1, 0), (9, 5), (6, 3, 51, 19), (8, 5, 63, 31)]:
+            value = game.pack_tile(tile)
+            self.assertTrue(value < 1 << 18)
+            self.assertEqual(game.unpack_tile(value)[:len(tile)], tile)
+        self.assertEqual(game.pack_tile((4, 2)),
+                         game.pack_tile((4, 2, 0, 0)))
+        self.assertRaises(ValueError, game.pack_tile, (1, 0, 64, 0))
+        value = game.pack_tile((9, 5, 3, 7))
+        self.assertEqual(game.tile_string(value), 'cyan 9')
+        self.assertEqual(game.played_tile_string(value), 'cyan 9 at 3,7')
+
+    def test_hand(self):
+        """ Test a packed hand behaves like a list of tiles """
+        hand = game.Hand([(6, 1), (2, 0)])
+        self.assertEqual(hand, [(6, 1), (2, 0)])
+        self.assertEqual(len(hand), 2)
+        hand[0] = (9, 1)
+        hand.append((1, 5))
+        self.assertEqual(hand[0], (9, 1))
+        self.assertEqual(hand[1:], [(2, 0), (1, 5)])
+        hand.sort()
+        self.assertEqual(list(hand), [(1, 5), (2, 0), (9, 1)])
+        del hand[0]
+        self.assertEqual(hand + [(3, 3)], [(2, 0), (9, 1), (3, 3)])
+        clone = hand.copy()
+        self.assertEqual(clone, hand)
+        clone[:] = [(4, 4)]
+        self.assertNotEqual(clone, hand)
+
+    def test_hand_analyzer(self):
+        """ Test the analyzer finds every combination closing a line """
+        hand = [(1, 0), (6, 1), (2, 1), (4, 2), (4, 2), (5, 3), (9, 4)]
+
+        def brute_force(tiles, residue, size, exclude):
+            """ Return the combinations found by trying every subset """
+            found = set()
+            for subset in itertools.combinations(tiles, size):
+                for faces in itertools.product(
+                        *[game.tile_faces(tile)[1] for tile in subset]):
+                    colors = [face[1] for face in faces]
+                    if len(set(colors)) == size and \
+                            not any(exclude & (1 << color)
+                                    for color in colors) and \
+                            sum(face[0] for face in faces) % 3 == residue:
+                        found.add(tuple(sorted(faces)))
+            return found
+
+        def check(analyzer, tiles):
+            """ Check the analyzer against brute force for a hand """
+            for residue in xrange(3):
+                for size in xrange(1, 5):
+                    for exclude in (0, 1 << 2):
+                        expected = brute_force(tiles, residue, size, exclude)
+                        self.assertEqual(set(analyzer.combinations(
+                            residue, size, exclude)), expected)
+                        self.assertEqual(analyzer.can_close(
+                            residue, size, exclude), len(expected) > 0)
+
+        analyzer = game.HandAnalyzer(hand, 3)
+        check(analyzer, hand)
+        analyzer.remove((1, 0))
+        check(analyzer, hand[1:])
+        analyzer.remove((4, 2))
+        check(analyzer, hand[1:4] + hand[5:])
+        analyzer.remove((6, 4))
+        check(analyzer, hand[1:4] + hand[5:6])
+        analyzer.add((1, 0))
+        check(analyzer, hand[:4] + hand[5:6])
+        self.assertEqual(analyzer.closing(5, 2), analyzer.combinations(1, 2))
+        self.assertRaises(game.InvalidPlayException, analyzer.remove, (8, 5))
@@ -1,6 +1,24 @@
 """ A unit test for sumoku game state """
+import random
 import unittest
-from sumoku import game, gamestate
+from sumoku import game, gamestate, moves
+
+
+def position(state):
+    """ Return everything about a game state that play can change """
+    return (list(state.tiles), [list(hand) for hand in state.hands],
+            list(state.scores), list(state.played_tiles), state.player,
+            state.passes, dict(state.board.cells), dict(state.board.rows),
+            dict(state.board.cols))
+
+
+def best_move(state):
+    """ Return the highest scoring move, or None if there are none """
+    generated = list(moves.generate_moves(state.board, state.cur_hand(),
+                                          state.key_number))
+    if len(generated) == 0:
+        return None
+    return max(generated, key=lambda move: move.score)
 
 
 class TestGameState(unittest.TestCase):
@@ -53,6 +71,33 @@ class TestGameState(unittest.TestCase):
         self.assertEqual(state.pending_tiles[0], (tile[0], tile[1], 0, 0))
         self.assertEqual(len(state.hands[0]), 7)
 
+        # Only one tile may be placed at a position
+        self.assertRaises(game.InvalidPlayException, state.place_tile,
+                          0, 0, 0)
+        self.assertEqual(len(state.hands[0]), 7)
+
+    def test_bounds(self):
+        """ Test games on boards of different sizes play side by side """
+        small = gamestate.GameState(2, 8, 3, random.Random(1),
+                                    bounds=game.Bounds(0, 4, 0, 4))
+        unbounded = gamestate.GameState(2, 8, 3, random.Random(1),
+                                        bounds=game.UNBOUNDED)
+        self.assertRaises(game.InvalidPlayException, small.place_tile,
+                          0, 5, 0)
+        self.assertRaises(ValueError, small.pack)
+        unbounded.place_tile(0, 5, -100)
+        unbounded.remove_tile(5, -100)
+
+        for state in (small, unbounded):
+            state.apply(best_move(state))
+            state.apply(best_move(state))
+        for tile in small.played_tiles:
+            self.assertTrue(0 <= tile[2] <= 4 and 0 <= tile[3] <= 4)
+        self.assertTrue(any(tile[2] == 0 and tile[3] == 0
+                            for tile in unbounded.played_tiles))
+        self.assertEqual(gamestate.GameState(2, 8, 3).board.bounds,
+                         game.STANDARD_BOUNDS)
+
     def test_remove_tile(self):
         """ Test removing a tile from the board """
         state = gamestate.GameState(2, 8, 3)
@@ -107,3 +152,148 @@ class TestGameState(unittest.TestCase):
         self.assertEqual(len(state.played_tiles), 6)
         self.assertEqual(len(state.pending_tiles), 0)
         self.assertEqual(len(state.hands[0]), 1)
+
+    def test_stage_play(self):
+        """ Test placing a play from the hand """
+        state = gamestate.GameState(2, 8, 3)
+        state.hands[0] = [(1, 0), (6, 1)]
+        state.stage_play([(9, 1, 1, 0), (1, 0, 0, 0)])
+        self.assertEqual(state.pending_tiles, [(9, 1, 1, 0), (1, 0, 0, 0)])
+        self.assertEqual(len(state.hands[0]), 0)
+        self.assertRaises(game.InvalidPlayException, state.stage_play,
+                          [(1, 0, 2, 0)])
+
+    def test_game_complete(self):
+        """ Test the game ends once every player passes """
+        state = gamestate.GameState(2, 8, 3)
+        self.assertFalse(state.game_complete())
+        state.submit_play()
+        self.assertFalse(state.game_complete())
+        state.submit_play()
+        self.assertTrue(state.game_complete())
+
+        # Placing the last tiles in hand doesn't end the game until they
+        # are submitted
+        state = gamestate.GameState(2, 1, 3, random.Random(0))
+        state.hands = [game.Hand([(3, 0)]), game.Hand()]
+        state.tiles.refill([])
+        state.place_tile(0, 0, 0)
+        self.assertFalse(state.game_complete())
+        state.submit_play()
+        self.assertTrue(state.game_complete())
+
+    def test_apply_undo(self):
+        """ Test moves can be taken back exactly """
+        state = gamestate.GameState(2, 8, 3, random.Random(1))
+        history = []
+        while not state.game_complete():
+            history.append(position(state))
+            move = best_move(state)
+            state.apply(move)
+        self.assertTrue(len(history) > 10)
+
+        snapshot = 5
+        state.restore(snapshot)
+        self.assertEqual(position(state), history[snapshot])
+        state.undo()
+        self.assertEqual(position(state), history[snapshot - 1])
+
+        # Replaying from a snapshot draws the same tiles
+        move = best_move(state)
+        state.apply(move)
+        self.assertEqual(position(state), history[snapshot])
+
+        # A failed move leaves nothing behind
+        state.restore(0)
+        self.assertEqual(position(state), history[0])
+        self.assertRaises(game.InvalidPlayException, state.apply,
+                          moves.Move(((1, 0, 0, 0), (1, 1, 5, 5)), 0, False))
+        self.assertEqual(position(state), history[0])
+        self.assertEqual(len(state.pending_tiles), 0)
+
+    def test_undo_keeps_hands(self):
+        """ Test references to a hand stay valid across apply and undo """
+        state = gamestate.GameState(2, 8, 3, random.Random(1))
+        hand = state.cur_hand()
+        before = list(hand)
+        state.apply(best_move(state))
+        self.assertNotEqual(list(hand), before)
+        state.undo()
+        self.assertTrue(state.cur_hand() is hand)
+        self.assertEqual(list(hand), before)
+
+        self.assertRaises(game.InvalidPlayException, state.apply,
+                          moves.Move(((1, 0, 0, 0), (1, 1, 5, 5)), 0, False))
+        self.assertTrue(state.cur_hand() is hand)
+        self.assertEqual(list(hand), before)
+
+    def test_analyzer(self):
+        """ Test the hand analyzers kept follow every change to the hands """
+        state = gamestate.GameState(2, 8, 3, random.Random(1))
+
+        def check():
+            """ Check each analyzer kept against one built afresh """
+            for player in xrange(state.players):
+                analyzer = state.analyzed(player)
+                if analyzer is None:
+                    continue
+                built = game.HandAnalyzer(state.hands[player], 3)
+                self.assertEqual(analyzer.counts, built.counts)
+                self.assertEqual(
+                    dict((entry, sorted(combinations)) for entry, combinations
+                         in analyzer.table.iteritems()),
+                    dict((entry, sorted(combinations)) for entry, combinations
+                         in built.table.iteritems()))
+
+        analyzer = state.analyzer()
+        self.assertTrue(state.analyzer() is analyzer)
+        state.place_tile(0, 7, 7)
+        check()
+        state.remove_tile(7, 7)
+        check()
+        for _ in xrange(8):
+            state.analyzer()
+            state.apply(best_move(state))
+            check()
+        state.restore(0)
+        check()
+        self.assertTrue(state.analyzer() is analyzer)
+
+        # A failed move leaves the analyzer as it was
+        hand = state.cur_hand()
+        self.assertRaises(game.InvalidPlayException, state.apply,
+                          moves.Move(((hand[0][0], hand[0][1], 0, 0),
+                                      (hand[1][0], hand[1][1], 5, 5)),
+                                     0, False))
+        check()
+
+        # A hand replaced outside the game state gets a new analyzer
+        state.hands[0] = game.Hand([(3, 0)])
+        self.assertTrue(state.analyzed(0) is None)
+        self.assertEqual(state.analyzer().combinations(0, 1), [((3, 0),)])
+        self.assertEqual(state.copy().analyzed(0), None)
+
+    def test_copy(self):
+        """ Test copies are independent """
+        state = gamestate.GameState(2, 8, 3, random.Random(1))
+        state.apply(best_move(state))
+        before = position(state)
+        clone = state.copy()
+        self.assertEqual(position(clone), before)
+        clone.apply(best_move(clone))
+        self.assertEqual(position(state), before)
+        self.assertNotEqual(position(clone), before)
+
+    def test_pack(self):
+        """ Test a position survives packing """
+        state = gamestate.GameState(3, 8, 4, random.Random(2))
+        for _ in xrange(6):
+            state.apply(best_move(state))
+        state.place_tile(0, 0, 0)
+        data = state.pack()
+        unpacked = gamestate.GameState.unpack(data)
+        self.assertEqual(position(unpacked), position(state))
+        self.assertEqual(unpacked.pending_tiles, state.pending_tiles)
+        self.assertEqual(unpacked.full_hash(), state.full_hash())
+        self.assertEqual(unpacked.pack(), data)
+        self.assertTrue(len(data) < 200)
@@ -0,0 +1,74 @@
+""" A unit test for hints """
+import random
+import unittest
+from sumoku import game, gamestate, hint, moves, sumokucli
+
+
+def midgame_state(seed, turns):
+    """ Play a seeded game for a few turns, taking the first legal move """
+    state = gamestate.GameState(2, 8, 3, random.Random(seed))
+    for _ in xrange(turns):
+        state.apply(next(moves.generate_moves(state.board, state.cur_hand(),
+                                              state.key_number), None))
+    return state
+
+
+class TestHint(unittest.TestCase):
+    """ Test searching for hints """
+
+    def test_hint(self):
+        """ Test a hint deepens and suggests a legal play """
+        state = midgame_state(3, 6)
+        packed = state.pack()
+        depths = []
+        result = hint.hint(state, nodes=200,
+                           progress=lambda result: depths.append(
+                               result.depth))
+        self.assertEqual(depths, range(1, result.depth + 1))
+        self.assertTrue(result.depth >= 2)
+        self.assertEqual(state.pack(), packed)
+        self.assertEqual(game.score_play(list(result.move.tiles),
+                                         state.board, 3)[0],
+                         result.move.score)
+
+        # Looking one turn ahead suggests the highest scoring play
+        best = max(moves.generate_moves(state.board, state.cur_hand(), 3),
+                   key=lambda move: move.score)
+        self.assertEqual(hint.hint(state, nodes=0).move.score, best.score)
+
+        # The same position gets the same hint
+        self.assertEqual(hint.hint(state, nodes=200).move, result.move)
+
+    def test_search(self):
+        """ Test a background search can be cancelled """
+        state = midgame_state(3, 6)
+        search = hint.HintSearch(state)
+        search.cancel()
+        result = search.result()
+        self.assertTrue(search.done())
+        self.assertTrue(result.depth >= 1)
+        self.assertFalse(result.move is None)
+
+        state.place_tile(0, 30, 10)
+        search = hint.HintSearch(state)
+        self.assertRaises(game.InvalidPlayException, search.result)
+
+    def test_command(self):
+        """ Test the hint command places the suggested tiles """
+        state = midgame_state(3, 6)
+        self.assertEqual(sumokucli.execute_command(state, ['hint']),
+                         ('hint', sumokucli.HINT_TIME))
+        self.assertEqual(sumokucli.execute_command(state, ['hint', '50']),
+                         ('hint', 50))
+        self.assertRaises(sumokucli.IllegalCommandException,
+                          sumokucli.parse_command, state, ['hint', 'a'])
+
+        hand = list(state.cur_hand())
+        sumokucli.hint(state, 50, announce=False)
+        self.assertTrue(len(state.pending_tiles) > 0)
+        self.assertEqual(len(state.cur_hand()) + len(state.pending_tiles),
+                         len(hand))
+        state.submit_play()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+""" A unit test for timing the hot paths """
+import json
+import os
+import pstats
+import shutil
+import StringIO
+import tempfile
+import unittest
+import sumoku.board
+import sumoku.game
+from sumoku import instrument, server, simulate
+
+
+class TestInstrument(unittest.TestCase):
+    """ Test the hot paths are timed only while instrumented """
+
+    def tearDown(self):
+        instrument.disable()
+        instrument.reset()
+
+    def test_enable(self):
+        """ Test enabling wraps the hot paths and disabling restores
+        them """
+        score_play = sumoku.game.score_play
+        method = vars(sumoku.board.Board)['score_play']
+        instrument.enable()
+        self.assertTrue(instrument.enabled())
+        self.assertFalse(sumoku.game.score_play is score_play)
+        simulate.play_game(2, 4, 3, ['greedy'] * 2, 7)
+        calls = instrument.STATS['game.score_play'].calls
+        self.assertEqual(sumoku.game.score_play([(3, 0, 0, 0)], [], 3),
+                         (3, False))
+        report = instrument.report()
+        self.assertEqual(report['game.score_play']['calls'], calls + 1)
+        self.assertTrue(report['gamestate.GameState.submit_play']['calls'] >
+                        0)
+        self.assertTrue(report['board.Board.score_play']['calls'] > 0)
+        self.assertTrue('render.Renderer.render' not in report)
+
+        instrument.disable()
+        self.assertTrue(sumoku.game.score_play is score_play)
+        self.assertTrue(vars(sumoku.board.Board)['score_play'] is method)
+        simulate.play_game(2, 4, 3, ['greedy'] * 2, 7)
+        self.assertEqual(instrument.report(), report)
+
+    def test_stat(self):
+        """ Test percentiles are read from the histogram closely """
+        stat = instrument.Stat()
+        for micros in xrange(1, 1001):
+            stat.add(micros * 1e-6)
+        self.assertEqual(stat.calls, 1000)
+        for point in (50, 90, 99):
+            value = stat.percentile(point)
+            self.assertTrue(point * 1e-5 <= value <= point * 1.25e-5)
+        self.assertEqual(stat.percentile(100), 1e-3)
+
+        merged = instrument.Stat().merge(stat).merge(stat)
+        self.assertEqual(merged.calls, 2000)
+        self.assertEqual(merged.percentile(50), stat.percentile(50))
+
+    def test_workers(self):
+        """ Test worker processes' timings are merged """
+        instrument.enable()
+        list(simulate.simulate(4, 2, 4, 3, ['greedy'], 1))
+        alone = instrument.take()
+        list(simulate.simulate(4, 2, 4, 3, ['greedy'], 1, workers=2,
+                               chunksize=1))
+        pooled = instrument.take()
+        self.assertEqual(sorted(pooled), sorted(alone))
+        for key in alone:
+            self.assertEqual(pooled[key].calls, alone[key].calls)
+
+    def test_profiling(self):
+        """ Test the profile and table are written on leaving the block """
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'profile')
+            stream = StringIO.StringIO()
+            with instrument.profiling(path, stream):
+                simulate.play_game(2, 4, 3, ['greedy'] * 2, 7)
+            self.assertFalse(instrument.enabled())
+            self.assertTrue(stream.getvalue().startswith('function'))
+            self.assertTrue('gamestate.GameState.submit_play' in
+                            stream.getvalue())
+            self.assertTrue(pstats.Stats(path).total_calls > 0)
+        finally:
+            shutil.rmtree(directory)
+
+        # The server reports the timings counted so far
+        game_server = server.GameServer()
+        try:
+            self.assertEqual(json.loads(game_server.execute(
+                None, ['timings'])), instrument.report())
+        finally:
+            game_server.close()
+
+if __name__ == '__main__':
+    unittest.main()
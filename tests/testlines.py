@@ -0,0 +1,59 @@
+""" A unit test for the sumoku.lines module """
+import itertools
+import os
+import shutil
+import tempfile
+import unittest
+from sumoku import board, lines
+
+
+class TestLines(unittest.TestCase):
+    """ Test the tables of line completions """
+
+    def test_completions(self):
+        """ Test the table agrees with adding up tiles """
+        table = lines.LineTable(4)
+        # Red 1, green 2: residue 3, so any completion must add 1 mod 4
+        mask = 3
+        self.assertFalse(table.is_valid(mask, 3))
+        self.assertTrue(table.is_valid(mask, 0))
+        self.assertTrue(table.is_valid(1, 3))
+        completions = table.completions(mask, 3)
+        for added in xrange(64):
+            possible = not added & mask and added != 0
+            self.assertEqual(bool(completions & (1 << added)), possible)
+        self.assertTrue(table.can_extend(mask, 3))
+        self.assertFalse(table.can_extend(mask, 3, 63 ^ mask))
+
+        # A full line can't be extended, nor one repeating a color
+        self.assertFalse(table.can_extend(63, 0))
+        self.assertEqual(table.completions(63, 1), 0)
+        repeated = board.merge_masks(1, 1)
+        self.assertEqual(table.completions(repeated, 0), 0)
+
+    def test_brute_force(self):
+        """ Test small completions against every choice of numbers """
+        table = lines.LineTable(5)
+        for mask, residue in [(0, 0), (1, 2), (5, 4), (31, 1)]:
+            completions = table.completions(mask, residue)
+            for added in (1, 2, 6, 32, 48):
+                colors = bin(mask | added).count('1')
+                possible = not added & mask and (colors < 2 or any(
+                    (residue + sum(numbers)) % 5 == 0
+                    for numbers in itertools.product(
+                        lines.NUMBERS, repeat=bin(added).count('1'))))
+                self.assertEqual(bool(completions & (1 << added)), possible)
+
+    def test_cache(self):
+        """ Test tables are saved and loaded """
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'lines3.bin')
+            table = lines.LineTable(3)
+            table.save(path)
+            self.assertEqual(os.path.getsize(path), 5 + 8 * 64 * 3)
+            self.assertEqual(lines.LineTable.load(path, 3).entries,
+                             table.entries)
+            self.assertEqual(lines.LineTable.load(path, 4), None)
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,32 @@
+""" A unit test for the Monte Carlo tree search player """
+import random
+import unittest
+from sumoku import game, gamestate, mcts
+
+
+class TestMCTS(unittest.TestCase):
+    """ Test the computer player """
+
+    def test_determinize(self):
+        """ Test dealing out the hidden tiles """
+        state = gamestate.GameState(3, 4, 3, random.Random(1))
+        hidden = mcts.unseen_tiles(state)
+        self.assertEqual(len(hidden), 96 - 4)
+        clone = mcts.determinize(state, random.Random(2))
+        self.assertEqual(clone.hands[0], state.hands[0])
+        self.assertEqual([len(hand) for hand in clone.hands], [4, 4, 4])
+        self.assertEqual(sorted(clone.hands[1] + clone.hands[2] +
+                                list(clone.tiles)), hidden)
+        self.assertEqual(len(state.tiles), 96 - 12)
+
+    def test_agent(self):
+        """ Test the agent makes a legal play """
+        state = gamestate.GameState(2, 4, 3, random.Random(1))
+        state.hands[0] = [(3, 0), (1, 1), (2, 2), (5, 3)]
+        agent = mcts.MCTSAgent(None, 10, seed=1)
+        move = agent(state)
+        self.assertEqual(game.score_play(list(move.tiles), state.board, 3),
+                         (move.score, move.completed))
+        state.stage_play(move.tiles)
+        state.submit_play()
+        self.assertEqual(state.scores[0], move.score)
@@ -0,0 +1,89 @@
+""" A unit test for the sumoku.moves module """
+import unittest
+from sumoku import board, game, moves
+
+
+class TestMoves(unittest.TestCase):
+    """ Test legal move generation """
+
+    def test_opening_moves(self):
+        """ Test the plays generated for an empty board """
+        generated = list(moves.generate_moves([], [(3, 0), (6, 1)], 3,
+                                              origin=(5, 5)))
+        tiles = [move.tiles for move in generated]
+        self.assertTrue(((3, 0, 5, 5),) in tiles)
+        self.assertTrue(((6, 1, 5, 5),) in tiles)
+        self.assertTrue(((9, 1, 5, 5),) in tiles)
+        self.assertTrue(((3, 0, 5, 5), (6, 1, 6, 5)) in tiles)
+        self.assertTrue(((3, 0, 5, 4), (9, 1, 5, 5)) in tiles)
+        for move in generated:
+            self.assertEqual(game.score_play(list(move.tiles), [], 3),
+                             (move.score, move.completed))
+
+        # An opening of six tiles completes its line
+        hand = [(1, 0), (2, 1), (3, 2), (4, 3), (5, 4), (3, 5), (1, 1),
+                (2, 2)]
+        generated = [move for move in moves.generate_moves(
+            [], hand, 3, origin=(10, 10)) if len(move.tiles) == 6]
+        self.assertTrue(len(generated) > 0)
+        for move in generated:
+            self.assertTrue(move.completed)
+            self.assertEqual((move.score, move.completed),
+                             game.score_play(list(move.tiles), [], 3))
+
+    def test_bounds(self):
+        """ Test plays keep within the bounds of the board """
+        hand = [(3, 0), (6, 1), (1, 2), (2, 3)]
+        small = board.Board(bounds=game.Bounds(0, 1, 0, 0))
+        generated = list(moves.generate_moves(small, hand, 3))
+        self.assertTrue(((3, 0, 0, 0),) in [move.tiles for move in generated])
+        for move in generated:
+            for tile in move.tiles:
+                self.assertTrue(small.bounds.contains(tile[2], tile[3]))
+
+        # Without edges plays reach out past where the standard board ends
+        played = board.Board([(1, 0, -60, 30)], bounds=game.UNBOUNDED)
+        generated = list(moves.generate_moves(played, hand, 3))
+        cells = set((tile[2], tile[3]) for move in generated
+                    for tile in move.tiles)
+        self.assertTrue((-61, 30) in cells)
+        self.assertTrue((-60, 31) in cells)
+        for move in generated:
+            self.assertEqual(played.score_play(list(move.tiles), 3),
+                             (move.score, move.completed))
+
+    def test_generate_moves(self):
+        """ Test every generated play is legal and distinct """
+        played = board.Board([(1, 0, 10, 5), (2, 1, 11, 5), (5, 2, 10, 6)])
+        hand = [(1, 3), (2, 4), (6, 5), (3, 3), (4, 0)]
+        generated = list(moves.generate_moves(played, hand, 3))
+        self.assertEqual(len(generated), len(set(generated)))
+        for move in generated:
+            self.assertEqual(game.score_play(list(move.tiles), played, 3),
+                             (move.score, move.completed))
+
+        # Every single tile play found by brute force is generated
+        singles = set()
+        for x in xrange(8, 14):
+            for y in xrange(3, 9):
+                for number, color in hand + [(9, 5)]:
+                    tile = (number, color, x, y)
+                    if played.get_tile(x, y) is not None or \
+                            played.line_through(x, y, True)[2] + \
+                            played.line_through(x, y, False)[2] == 0:
+                        continue
+                    try:
+                        score = game.score_play([tile], played, 3)
+                    except game.InvalidPlayException:
+                        continue
+                    singles.add(moves.Move((tile,), score[0], score[1]))
+        self.assertEqual(singles, set(move for move in generated
+                                      if len(move.tiles) == 1))
+
+    def test_completed_line(self):
+        """ Test a play completing a line is flagged """
+        played = board.Board([(1, 0, 0, 0), (1, 1, 1, 0), (1, 2, 2, 0),
+                              (1, 3, 3, 0)])
+        generated = list(moves.generate_moves(played, [(1, 4), (1, 5)], 3))
+        self.assertTrue(moves.Move(((1, 4, 4, 0), (1, 5, 5, 0)), 6, True)
+                        in generated)
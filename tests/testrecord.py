@@ -0,0 +1,108 @@
+""" A unit test for game records and their replay """
+import argparse
+import random
+import StringIO
+import unittest
+import sumoku.game
+import sumoku.moves
+from sumoku import record
+
+
+def play_game(seed, writer):
+    """ Play a game greedily, recording it, and return its final state """
+    rng = random.Random(seed)
+    header = record.GameHeader(2, 8, 3, seed, record.shuffled_tiles(rng))
+    writer.write(header)
+    state = record.new_game(header)
+    while not state.game_complete():
+        move = next(iter(sumoku.moves.generate_moves(
+            state.board, state.cur_hand(), state.key_number)), None)
+        for event in record.move_events(state, move):
+            writer.write(event)
+    return state
+
+
+class TestRecord(unittest.TestCase):
+    """ Test writing, reading and replaying records """
+
+    def recorded(self, binary, seeds=(1, 2)):
+        """ Return the events written, read back, and the final states of
+        games recorded with the given seeds """
+        stream = StringIO.StringIO()
+        writer = record.RecordWriter(stream, binary)
+        finals = [play_game(seed, writer) for seed in seeds]
+        stream.seek(0)
+        reader = record.read_binary if binary else record.read_json
+        return list(reader(stream)), finals
+
+    def test_encode(self):
+        """ Test events survive both formats """
+        header = record.GameHeader(3, 6, 4, None,
+                                   sumoku.game.generate_tiles()[:5])
+        for event in [header, ('place', 2, 40, 19), ('flip', 7),
+                      ('remove', 0, 0), ('submit', 300, 1)]:
+            self.assertEqual(record.decode(record.encode(event)[1:]), event)
+            self.assertEqual(record.from_json(record.to_json(event)), event)
+        self.assertRaises(ValueError, record.decode, 'X')
+
+    def test_seed(self):
+        """ Test seeds at the edges of their range survive both formats """
+        order = sumoku.game.generate_tiles()[:3]
+        for seed in (None, 0, record.SEED_LIMIT - 1):
+            header = record.GameHeader(2, 8, 3, seed, order)
+            self.assertEqual(record.decode(record.encode(header)[1:]),
+                             header)
+            self.assertEqual(record.from_json(record.to_json(header)),
+                             header)
+        for seed in (-1, record.SEED_LIMIT):
+            self.assertRaises(ValueError, record.encode,
+                              record.GameHeader(2, 8, 3, seed, order))
+            self.assertRaises(argparse.ArgumentTypeError, record.parse_seed,
+                              str(seed))
+        self.assertEqual(record.parse_seed(str(record.SEED_LIMIT - 1)),
+                         record.SEED_LIMIT - 1)
+
+        # Version 1 records stored no seed as -1
+        body = 'G' + record.HEADER_FIELDS_V1.pack(1, 2, 8, 3, -1) + \
+            ''.join(chr(sumoku.game.pack_tile(tile)) for tile in order)
+        self.assertEqual(record.decode(body),
+                         record.GameHeader(2, 8, 3, None, order))
+
+    def test_read_binary(self):
+        """ Test a record is read in chunks and a torn one is rejected """
+        events, _ = self.recorded(True)
+        data = ''.join(record.encode(event) for event in events)
+        chunk_size = record.CHUNK_SIZE
+        record.CHUNK_SIZE = 7
+        try:
+            self.assertEqual(
+                list(record.read_binary(StringIO.StringIO(data))), events)
+        finally:
+            record.CHUNK_SIZE = chunk_size
+        torn = StringIO.StringIO(data[:-1])
+        self.assertRaises(ValueError, list, record.read_binary(torn))
+
+    def test_replay(self):
+        """ Test replaying a record reaches the games' final states """
+        for binary in (True, False):
+            events, finals = self.recorded(binary)
+            for trusted in (False, True):
+                games = list(record.replay(events, trusted))
+                self.assertEqual(len(games), len(finals))
+                for (_, state), final in zip(games, finals):
+                    self.assertTrue(state.game_complete())
+                    self.assertEqual(state.scores, final.scores)
+                    self.assertEqual(state.played_tiles, final.played_tiles)
+
+    def test_tampered(self):
+        """ Test a validated replay rejects a score the play didn't make """
+        events, _ = self.recorded(True, seeds=(3,))
+        index = next(i for i, event in enumerate(events)
+                     if event[0] == 'submit' and event[1] > 0)
+        events[index] = ('submit', events[index][1] + 1, events[index][2])
+        self.assertRaises(sumoku.game.InvalidPlayException, list,
+                          record.replay(events))
+        self.assertEqual(len(list(record.replay(events, trusted=True))), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+""" A unit test for the sumoku.render module """
+import random
+import StringIO
+import unittest
+from sumoku import game, gamestate, render
+
+
+class TestRender(unittest.TestCase):
+    """ Test drawing the game state """
+
+    def test_full_frame(self):
+        """ Test a whole frame is written at once """
+        state = gamestate.GameState(2, 8, 3, random.Random(1))
+        tile = state.hands[0][0]
+        state.place_tile(0, 2, 1)
+        stream = StringIO.StringIO()
+        render.Renderer(stream).draw(state)
+        lines = stream.getvalue().split('\n')
+        self.assertEqual(len(lines), 22)
+        self.assertEqual(lines[0], render.HEADER)
+        self.assertTrue(lines[2].startswith(
+            ' 2 --' + render.tile_text(tile, True) + '---'))
+        self.assertTrue(lines[1].endswith(' Key number: 3'))
+
+    def test_diff(self):
+        """ Test only changed cells are redrawn """
+        state = gamestate.GameState(2, 8, 3, random.Random(1))
+        renderer = render.Renderer(StringIO.StringIO(), diff=True)
+        self.assertTrue(renderer.render(state)
+                        .startswith(render.CLEAR_SCREEN))
+        self.assertEqual(renderer.render(state),
+                         render.move_cursor(22, 1) + render.CLEAR_BELOW)
+
+        tile = state.hands[0][0]
+        state.place_tile(0, 2, 1)
+        text = renderer.render(state)
+        self.assertTrue(render.move_cursor(3, 6) +
+                        render.tile_text(tile, True) in text)
+        self.assertTrue(render.CLEAR_LINE in text)
+        self.assertEqual(text.count('\x1b[H'), 0)
+        self.assertEqual(text.count('H'), 3)
+
+        renderer.invalidate()
+        self.assertTrue(renderer.render(state)
+                        .startswith(render.CLEAR_SCREEN))
+
+    def test_viewport(self):
+        """ Test a large board is shown around the tiles placed """
+        state = gamestate.GameState(2, 8, 3, random.Random(1),
+                                    bounds=game.UNBOUNDED)
+        tile = state.hands[0][0]
+        state.place_tile(0, 100, -50)
+        stream = StringIO.StringIO()
+        render.Renderer(stream, width=9, height=7).draw(state)
+        lines = stream.getvalue().split('\n')
+        self.assertEqual(len(lines), 9)
+        self.assertEqual(lines[0], '    STUVWXYZa')
+        self.assertTrue(lines[4].startswith(
+            '-49 ----' + render.tile_text(tile, True) + '---- '))
+
+        # A small board is shown whole, the scores carrying on below it
+        state = gamestate.GameState(2, 8, 3, random.Random(1),
+                                    bounds=game.Bounds(0, 4, 0, 2))
+        lines = render.Renderer().render(state).split('\n')
+        self.assertEqual(lines[0], '   abcde')
+        self.assertEqual(lines[1], ' 1 ----- Key number: 3')
+        self.assertEqual(len(lines), 9)
+        self.assertTrue(lines[7].startswith(' ' * 14 + '2 00000 '))
@@ -0,0 +1,88 @@
+""" A unit test for the sumoku game server """
+import asyncore
+import random
+import socket
+import time
+import unittest
+from sumoku import loadtest, server
+
+
+class TestServer(unittest.TestCase):
+    """ Test hosting games over the line protocol """
+
+    def setUp(self):
+        self.server = server.GameServer()
+        self.client = socket.create_connection(self.server.address())
+        self.client.setblocking(0)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+        for connection in list(self.server.connections):
+            connection.close()
+
+    def send(self, *lines):
+        """ Send commands and return the replies """
+        self.client.sendall(''.join(line + '\n' for line in lines))
+        replies = ''
+        deadline = time.time() + 5
+        while replies.count('\n') < len(lines) and time.time() < deadline:
+            asyncore.loop(timeout=0.01, use_poll=True,
+                          map=self.server.socket_map, count=1)
+            try:
+                replies = replies + self.client.recv(4096)
+            except socket.error:
+                pass
+        return replies.splitlines()
+
+    def test_play(self):
+        """ Test commands are run on the connection's game """
+        self.assertEqual(self.send('state'), ['error not in a game'])
+        self.assertEqual(self.send('new 2 3 8 1'), ['ok 1'])
+        state = self.send('state')[0]
+        self.assertTrue(state.startswith('ok player=1 key=3 bag=80 '))
+        replies = self.send('place 1 a 1', 'place x a 1', 'remove a 1',
+                            'flip 9', 'submit', 'bogus')
+        self.assertEqual(replies, ['ok', 'error Tile must be a number',
+                                   'ok', 'error Tile must be between 1 and 8',
+                                   'ok player=2',
+                                   'error unknown command bogus'])
+        self.assertEqual(self.send('submit'), ['ok over scores=0,0'])
+        self.assertEqual(self.send('state'), ['error not in a game'])
+
+    def test_join(self):
+        """ Test only the seated connection plays its turn """
+        self.send('new 2 3 8 1')
+        other = server.Connection(self.server, socket.socket())
+        self.assertEqual(self.server.execute(other, ['join', '1', '1']), '')
+        self.assertEqual(self.send('submit'), ['error not your turn'])
+        self.assertRaises(server.ProtocolError, self.server.execute, other,
+                          ['join', '2', '1'])
+        other.close()
+
+    def test_evict(self):
+        """ Test idle games and connections are dropped """
+        self.send('new')
+        self.assertEqual(len(self.server.games), 1)
+        self.server.evict_idle(time.time() + server.IDLE_TIMEOUT / 2)
+        self.assertEqual(len(self.server.games), 1)
+        self.server.evict_idle(time.time() + server.IDLE_TIMEOUT + 1)
+        self.assertEqual(len(self.server.games), 0)
+        self.assertEqual(len(self.server.connections), 0)
+
+    def test_load(self):
+        """ Test load test clients play whole games without errors """
+        results = {'commands': 0, 'batches': 0, 'turns': 0, 'games': 0,
+                   'errors': 0, 'latency': 0.0}
+        clients = [loadtest.Client(self.server.address(), random.Random(1),
+                                   results, self.server.socket_map)
+                   for _ in xrange(3)]
+        deadline = time.time() + 30
+        while results['games'] < 3 and time.time() < deadline:
+            asyncore.loop(timeout=0.01, use_poll=True,
+                          map=self.server.socket_map, count=1)
+        for client in clients:
+            client.close()
+        self.assertTrue(results['games'] >= 3)
+        self.assertEqual(results['errors'], 0)
+        self.assertTrue(0 < self.server.moves <= results['turns'])
@@ -0,0 +1,38 @@
+""" A unit test for headless sumoku self-play """
+import unittest
+from sumoku import simulate
+
+
+class TestSimulate(unittest.TestCase):
+    """ Test playing games without a terminal """
+
+    def test_play_game(self):
+        """ Test a game is reproducible from its seed """
+        result = simulate.play_game(2, 4, 3, ['greedy', 'random'], 7)
+        self.assertEqual(result.seed, 7)
+        self.assertEqual(result.key_number, 3)
+        self.assertEqual(len(result.scores), 2)
+        self.assertTrue(result.turns > 0)
+        self.assertEqual(simulate.play_game(2, 4, 3, ['greedy', 'random'], 7),
+                         result)
+
+        # Passing players end the game after a round
+        result = simulate.play_game(3, 4, 3, ['pass'] * 3, 7)
+        self.assertEqual(result.scores, [0, 0, 0])
+        self.assertEqual(result.turns, 3)
+        self.assertEqual(result.tiles_left, 96 - 12)
+
+    def test_simulate(self):
+        """ Test running and summarizing a batch of games """
+        results = list(simulate.simulate(3, 2, 4, 'random', ['greedy'], 1))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(len(set(result.seed for result in results)), 3)
+        self.assertEqual(results, list(simulate.simulate(3, 2, 4, 'random',
+                                                         ['greedy'], 1)))
+        self.assertRaises(ValueError, list,
+                          simulate.simulate(1, 2, 4, 3, ['bogus'], 1))
+
+        summary = simulate.summarize(results)
+        self.assertEqual(summary['games'], 3)
+        self.assertEqual(len(summary['scores']), 2)
+        self.assertTrue(sum(summary['wins']) >= 3)
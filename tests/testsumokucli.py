@@ -0,0 +1,81 @@
+""" A unit test for the command line game """
+import random
+import StringIO
+import sys
+import unittest
+from sumoku import gamestate, moves, record, sumokucli
+
+
+def game_script(seed):
+    """ Play a game greedily and return its bag order, the commands which
+    played it and its final scores """
+    order = record.shuffled_tiles(random.Random(seed))
+    state = gamestate.GameState(2, 8, 3, order=order)
+    commands = []
+    while not state.game_complete():
+        move = next(iter(moves.generate_moves(
+            state.board, state.cur_hand(), state.key_number)), None)
+        commands.extend(sumokucli.format_command(event)
+                        for event in record.move_events(state, move))
+    return order, commands, state.scores
+
+
+class TestScript(unittest.TestCase):
+    """ Test running scripts of commands """
+
+    def test_script_commands(self):
+        """ Test blank lines and comments are skipped """
+        lines = ['# a game\n', 'place 1 a 1\n', '\n', 'submit # done\n']
+        self.assertEqual(list(sumokucli.script_commands(lines)),
+                         [(2, ['place', '1', 'a', '1']), (4, ['submit'])])
+
+    def test_run_script(self):
+        """ Test a script plays a whole game """
+        order, commands, scores = game_script(4)
+        state = gamestate.GameState(2, 8, 3, order=order)
+        sumokucli.run_script(state, sumokucli.script_commands(commands),
+                             None)
+        self.assertTrue(state.game_complete())
+        self.assertEqual(state.scores, scores)
+
+    def test_illegal(self):
+        """ Test a script stops at its first illegal command """
+        order, commands, _ = game_script(4)
+        for bad in ['bogus', 'place 9 a 1', 'remove a 1', 'flip x',
+                    'analyze']:
+            state = gamestate.GameState(2, 8, 3, order=order)
+            script = commands[:3] + [bad] + commands[3:]
+            with self.assertRaisesRegexp(sumokucli.IllegalCommandException,
+                                         '^Line 4: '):
+                sumokucli.run_script(state, sumokucli.script_commands(
+                    line + '\n' for line in script), None)
+
+        # Nothing can follow the end of the game
+        state = gamestate.GameState(2, 8, 3, order=order)
+        self.assertRaises(sumokucli.IllegalCommandException,
+                          sumokucli.run_script, state,
+                          sumokucli.script_commands(commands + ['submit']),
+                          None)
+
+    def test_quiet(self):
+        """ Test an interactive game with --quiet prints only the final
+        scores """
+        commands = ['?', 'bogus', 'place 99 a 1', 'analyze', 'hint 50',
+                    'submit'] + ['submit'] * 4
+        streams = (sys.argv, sys.stdin, sys.stdout)
+        sys.argv = ['sumokucli', '--quiet', '--seed', '3', '--players', '2']
+        sys.stdin = StringIO.StringIO('\n'.join(commands) + '\n')
+        sys.stdout = StringIO.StringIO()
+        try:
+            status = sumokucli.run_game(sumokucli.parse_args())
+            output = sys.stdout.getvalue()
+        finally:
+            sys.argv, sys.stdin, sys.stdout = streams
+        self.assertEqual(status, 0)
+        lines = output.splitlines()
+        self.assertEqual(lines[0], 'Final Scores:')
+        self.assertEqual([line[:3] for line in lines[1:]], ['P1 ', 'P2 '])
+        self.assertTrue(int(lines[1][3:]) > 0)
+
+if __name__ == '__main__':
+    unittest.main()
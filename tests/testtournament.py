@@ -0,0 +1,158 @@
+""" A unit test for tournaments """
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from sumoku import tournament
+
+
+def settings(name='test', form=tournament.ROUND_ROBIN,
+             agents=('random', 'pass'), player_counts=(2,), rounds=1):
+    """ Return the Settings of a small, quick tournament """
+    return tournament.Settings(name, form, list(agents), list(player_counts),
+                               [3], rounds, 4, 7)
+
+
+class TestTournament(unittest.TestCase):
+    """ Test scheduling, playing and resuming tournaments """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'tournament.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def results(self, connection, tournament_id):
+        """ Return the scores stored for each game, by round and number """
+        return list(connection.execute(
+            'SELECT round, number, seats, scores FROM games '
+            'WHERE tournament = ? ORDER BY round, number', (tournament_id,)))
+
+    def test_round_robin(self):
+        """ Test every group plays in every seat order """
+        tables = tournament.round_robin(tournament.Settings(
+            'rr', tournament.ROUND_ROBIN, ['a', 'b', 'c'], [2, 3, 4],
+            [3, 4], 1, 8, 0))
+        # Three pairs and one group of three, each seated two or three
+        # ways, and the three agents filling four seats four ways
+        self.assertEqual(len(tables), (3 * 2 + 3 + 4) * 2)
+        self.assertTrue((2, 4, ('b', 'a')) in tables)
+        self.assertTrue((4, 3, ('c', 'a', 'a', 'b')) in tables)
+
+    def test_rating_changes(self):
+        """ Test a game moves ratings between the agents in it """
+        changes = tournament.rating_changes({'a': 1500.0, 'b': 1500.0},
+                                            ['a', 'b', 'a'], [10, 5, 0])
+        self.assertAlmostEqual(changes['a'] + changes['b'], 0.0)
+        self.assertAlmostEqual(changes['a'], 0.0)
+
+        changes = tournament.rating_changes({'a': 1500.0, 'b': 1700.0},
+                                            ['a', 'b'], [10, 5])
+        self.assertTrue(changes['a'] > tournament.K_FACTOR / 2)
+        self.assertAlmostEqual(changes['a'], -changes['b'])
+
+    def test_resume(self):
+        """ Test a tournament stopped part way finishes without playing
+        any game twice, as if it had never stopped """
+        connection = tournament.connect(self.path)
+        tournament_id = tournament.create(connection, settings(rounds=2))
+        played = []
+
+        def note(game, _):
+            """ Note each game played """
+            played.append(game.game_id)
+
+        self.assertEqual(tournament.run(connection, tournament_id, limit=3,
+                                        callback=note), 3)
+        connection.close()
+
+        connection = tournament.connect(self.path)
+        self.assertEqual(tournament.create(connection, settings(rounds=2)),
+                         tournament_id)
+        self.assertEqual(tournament.run(connection, tournament_id,
+                                        callback=note), 1)
+        self.assertEqual(sorted(played), sorted(set(played)))
+        self.assertEqual(tournament.progress(connection, tournament_id),
+                         (4, 4))
+        self.assertEqual(tournament.run(connection, tournament_id), 0)
+
+        # The same tournament played straight through by a pool of
+        # workers stores the same
+        uninterrupted = tournament.create(connection,
+                                          settings('again', rounds=2))
+        tournament.run(connection, uninterrupted, workers=2)
+        self.assertEqual(self.results(connection, tournament_id),
+                         self.results(connection, uninterrupted))
+        self.assertEqual(
+            [standing[1:] for standing
+             in tournament.standings(connection, tournament_id)],
+            [standing[1:] for standing
+             in tournament.standings(connection, uninterrupted)])
+        best = tournament.standings(connection, tournament_id)[0]
+        self.assertEqual((best.agent, best.games, best.wins),
+                         ('random', 4, 4))
+
+        self.assertRaises(ValueError, tournament.create, connection,
+                          settings(rounds=3))
+        connection.close()
+
+    def test_rating_order(self):
+        """ Test ratings are updated in game order whatever the order
+        results are stored in """
+        connection = tournament.connect(':memory:')
+        agents = ('random', 'pass', 'greedy')
+        forwards = tournament.create(connection,
+                                     settings('forwards', agents=agents))
+        rated = []
+
+        def note(*_):
+            """ Note the games rated as each result comes in """
+            rated.append(sum(standing.games for standing
+                             in tournament.standings(connection, forwards)))
+
+        tournament.run(connection, forwards, batch_size=1, callback=note)
+        # Each two player game was rated as soon as it was stored
+        self.assertEqual(rated, range(0, 2 * len(rated), 2))
+
+        backwards = tournament.create(connection,
+                                      settings('backwards', agents=agents))
+        games = tournament.unfinished(connection, backwards)
+        results = list(tournament.play_games(games, 4))
+        # Games are only rated once every game before them is stored
+        for game, result in reversed(results[1:]):
+            tournament.record_result(connection, game, result)
+            tournament.rate(connection, backwards)
+        self.assertEqual([standing.games for standing
+                          in tournament.standings(connection, backwards)],
+                         [0, 0, 0])
+        tournament.record_result(connection, *results[0])
+        tournament.rate(connection, backwards)
+        self.assertEqual(
+            [standing[1:] for standing
+             in tournament.standings(connection, backwards)],
+            [standing[1:] for standing
+             in tournament.standings(connection, forwards)])
+
+    def test_swiss(self):
+        """ Test Swiss rounds are scheduled as the last one finishes """
+        connection = tournament.connect(':memory:')
+        tournament_id = tournament.create(connection, settings(
+            form=tournament.SWISS, agents=('random', 'pass', 'greedy'),
+            rounds=2))
+        self.assertEqual(tournament.progress(connection, tournament_id),
+                         (0, 0))
+        self.assertEqual(tournament.run(connection, tournament_id), 2)
+        self.assertEqual(tournament.rounds_scheduled(connection,
+                                                     tournament_id), 2)
+
+        # Each round one pair plays and the pair doesn't repeat
+        pairs = [frozenset(json.loads(row[2]))
+                 for row in self.results(connection, tournament_id)]
+        self.assertEqual(len(set(pairs)), 2)
+        self.assertEqual(tournament.pairs_met(connection, tournament_id),
+                         set(pairs))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+""" A unit test for position hashing """
+import random
+import unittest
+from sumoku import gamestate, moves, zobrist
+
+
+class TestZobrist(unittest.TestCase):
+    """ Test position hashes and the transposition table """
+
+    def assert_hashes(self, state):
+        """ Check the incremental hashes match recomputed ones """
+        value = state.hash()
+        full = state.full_hash()
+        state.rehash()
+        self.assertEqual(state.hash(), value)
+        self.assertEqual(state.full_hash(), full)
+
+    def test_hash(self):
+        """ Test hashes follow changes to the game state """
+        state = gamestate.GameState(2, 8, 3, random.Random(1))
+        start = state.hash()
+        self.assert_hashes(state)
+
+        # Flipping a tile doesn't change the position
+        state.hands[0][0] = (6, 0)
+        state.rehash()
+        start = state.hash()
+        state.flip_tile(0)
+        self.assertEqual(state.hash(), start)
+
+        state.place_tile(0, 10, 10)
+        self.assertNotEqual(state.hash(), start)
+        self.assert_hashes(state)
+        state.remove_tile(10, 10)
+        self.assertEqual(state.hash(), start)
+
+        # Apply and undo keep the hash up to date
+        seen = [state.hash()]
+        for _ in xrange(6):
+            generated = moves.state_moves(state)
+            state.apply(max(generated, key=lambda move: move.score)
+                        if generated else None)
+            self.assert_hashes(state)
+            seen.append(state.hash())
+        self.assertEqual(len(set(seen)), len(seen))
+        state.restore(0)
+        self.assertEqual(state.hash(), start)
+
+    def test_transposition_table(self):
+        """ Test storing and replacing entries """
+        table = zobrist.TranspositionTable(4)
+        self.assertEqual(table.get(1), None)
+        table.put(1, 'a', 3)
+        self.assertEqual(table.get(1), (3, 'a'))
+
+        # A shallower entry in the same bucket goes in the recent slot
+        table.put(3, 'b', 1)
+        self.assertEqual(table.get(1), (3, 'a'))
+        self.assertEqual(table.get(3), (1, 'b'))
+        table.put(5, 'c', 0)
+        self.assertEqual(table.get(3), None)
+        self.assertEqual(table.get(5), (0, 'c'))
+
+        # A deeper entry displaces the deep slot into the recent one
+        table.put(7, 'd', 4)
+        self.assertEqual(table.get(7), (4, 'd'))
+        self.assertEqual(table.get(1), (3, 'a'))
+        self.assertEqual(table.get(5), None)
+
+        statistics = table.statistics()
+        self.assertEqual(statistics['hits'], 6)
+        self.assertEqual(statistics['misses'], 3)
+        self.assertEqual(statistics['stores'], 4)
+        self.assertEqual(statistics['replacements'], 2)
+        self.assertEqual(statistics['entries'], 2)
+
+    def test_state_moves(self):
+        """ Test move lists are cached by position """
+        state = gamestate.GameState(2, 8, 3, random.Random(1))
+        table = zobrist.TranspositionTable()
+        generated = moves.state_moves(state, table)
+        self.assertTrue(moves.state_moves(state, table) is generated)
+        self.assertEqual(table.hits, 1)